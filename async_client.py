@@ -0,0 +1,149 @@
+import asyncio
+from itertools import chain
+import time
+from typing import List
+
+from cache.async_redis import AsyncRedis
+from cache.redis import RedisRegistry
+from client import BaseClient, SAVE_CACHE, SOCKET_SEND
+from messages.messages import Message, OrderReceivedMessage
+
+
+class AsyncClient(BaseClient):
+    """ asyncio version of Client, built on asyncio streams
+
+    same send/recv/save semantics as Client.
+    one request/response is in flight per connection (guarded by a lock),
+    so run one AsyncClient per order flow to drive many flows on one event loop
+    """
+
+    def __init__(self, host, port, redis=None, journal=None):
+        super().__init__(host, port, journal=journal)
+        self.redis = redis or AsyncRedis(host=RedisRegistry.host, port=RedisRegistry.port)
+        self.last_seq = 0  # OrderHistory.SEQ_KEY after the last save_cache
+
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    @property
+    def log_path(self) -> str:
+        return "logger/.logs/client.log"  # OrderHistory(source="disk")가 읽는 파일
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:  # event loop 안에서 생성
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def connect(self, host=None, port=None) -> None:
+        if host is not None:
+            self.host = host
+        if port is not None:
+            self.port = port
+
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self) -> None:
+        if self.journal is not None:
+            self.journal.flush()
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def sendall(self, c_packet: bytes) -> bool:
+        """ return True if succeed, False when failed """
+        if c_packet != self.RESET_PACKET:
+            return (await self._send_window([c_packet]))[0]
+
+        async with self.lock:
+            await self._write(c_packet)
+            s_packet = await self.recv()
+            self._unacked.clear()  # 거래소 초기화, 이전 주문의 ack은 기다리지 않음
+
+        if not s_packet:
+            self.logger.error("No Message Received From Server")
+            return False
+
+        s_msgs = self.msg_factory.create(s_packet)
+        _, response_code = self._inspect_s_msgs(s_msgs) or (None, None)
+        return response_code
+
+    async def send_many(self, c_packets: List[bytes], window=100) -> List[bool]:
+        """ pipelined version of sendall, see Client.send_many """
+        results = []
+        for i in range(0, len(c_packets), window):
+            results.extend(await self._send_window(c_packets[i : i + window]))
+        return results
+
+    async def _send_window(self, c_packets: List[bytes]) -> List[bool]:
+        async with self.lock:  # 다른 window의 ack과 섞이지 않도록 저장까지 lock 안에서
+            await self._write(b"".join(c_packets))
+            s_packet = await self.recv(expected=len(self._unacked) + len(c_packets))
+
+            s_msgs = self.msg_factory.create(s_packet) if s_packet else []
+            results, interactions = self._match_responses(c_packets, s_msgs)
+
+            if interactions:  # 저장 순서 == matching 순서 (Client와 같음)
+                await self.save_cache(*chain(*interactions))  # one transaction per window
+
+        return results
+
+    async def recv(self, size=1024, timeout=None, expected=1) -> str:
+        """ receive complete frames until `expected` OrderReceivedMessages arrive
+
+            unlike Client.recv, frames that arrive after the acks are not drained here,
+            they stay in the stream and are returned by the next call.
+            bytes of a partial frame are kept in the buffer for the next call.
+            returns an empty str if nothing arrives within `timeout` (None: recv_timeout)
+        """
+        timeout = self.recv_timeout if timeout is None else timeout
+
+        frames = []
+        n_received = 0
+        while n_received < expected:
+            try:
+                pk = await asyncio.wait_for(self._reader.read(size), timeout)
+            except asyncio.TimeoutError:
+                break
+            if not pk:  # closed
+                break
+            self._record_first_byte()
+
+            new_frames = self._feed(pk)
+            n_received += sum(
+                1 for f in new_frames if f[0] == OrderReceivedMessage.MSG_TYPE
+            )
+            frames.extend(new_frames)
+
+        return "".join(frames)
+
+    async def save_cache(self, *msg: Message) -> None:
+        """ see Client.save_cache """
+        stime = time.perf_counter_ns()
+        entries = self._cache_entries(msg)
+        self._append_journal(msg)
+        self.last_seq = await self.redis.rpush_all(
+            entries, seq_key=self.SEQ_KEY, stream=self.STREAM_KEY
+        )  # RAM
+        self._log_cache(entries)  # File
+        SAVE_CACHE.record(time.perf_counter_ns() - stime)
+
+    async def _write(self, data: bytes) -> None:
+        if self._writer is None:
+            await self.connect()
+
+        stime = time.perf_counter_ns()
+        self._writer.write(data)
+        await self._writer.drain()
+        self._sent_ns = time.perf_counter_ns()
+        SOCKET_SEND.record(self._sent_ns - stime)
+        self.logger.debug(data)
@@ -0,0 +1,49 @@
+""" open quantity by ticker, Python objects vs ColumnarOrderStore (requires numpy)
+
+python -m benchmarks.columnar [n_events ...]
+"""
+from collections import defaultdict
+import sys
+import time
+
+from cache.memory import InMemoryRedis
+from orders.orders import OrderFactory
+from orders.query_builder import ColumnarAXETaskQuerent
+from benchmarks.flows import synthetic_flow
+
+BATCH_SIZE = 1000  # orders per update
+REPEAT = 5
+
+
+def by_objects(querent):
+    result = defaultdict(int)
+    for o in querent._history:
+        if o.msg_type == "0" and o.response_code == "0" and o.unex_qty:
+            result[o.ticker] += o.unex_qty
+    return result
+
+
+def best_of(func, *args) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        stime = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - stime)
+    return best
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [100000, 1000000]
+    factory = OrderFactory()
+
+    print(f"{'events':>9} {'objects (ms)':>13} {'columnar (ms)':>14}")
+    for n in sizes:
+        querent = ColumnarAXETaskQuerent(redis=InMemoryRedis())
+        orders = [factory.create(**kw) for kw in synthetic_flow(n)]
+        for i in range(0, n, BATCH_SIZE):
+            querent._update(orders[i : i + BATCH_SIZE])
+
+        assert by_objects(querent) == querent.get_unex_qty_by_tickers()
+        objects = best_of(by_objects, querent)
+        columnar = best_of(querent.get_unex_qty_by_tickers)
+        print(f"{n:>9,} {objects * 1e3:>13,.1f} {columnar * 1e3:>14,.1f}")
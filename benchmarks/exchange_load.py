@@ -0,0 +1,131 @@
+""" end-to-end load test, Client sessions against a local ExchangeSimulator
+
+python -m benchmarks.exchange_load [--sessions 8] [--orders 5000] [--window 1] [--latency 0]
+
+ - the simulator runs in its own process, every session (Client) in another one
+ - each session sends NewOrders on random tickers / prices, and cancels
+   `cancel_ratio` of its acked orders later (rejected once filled, like the exchange)
+ - window 1: Client.sendall (one round trip per order), >1: Client.send_many
+ - persistence goes to an InMemoryRedis per session, logging is off (WARNING)
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import time
+
+from cache.memory import InMemoryRedis
+from client import Client
+from exchange.simulator import serve_in_process
+from logger import set_level
+
+N_TICKERS = 50
+N_PRICES = 20
+
+
+def _packet(msg_type, order_no, ticker, price, qty) -> bytes:
+    return f"{msg_type}{order_no}{ticker}{price}{str(qty).zfill(5)}".encode()
+
+
+def session(args) -> dict:
+    port, n_orders, window, cancel_ratio, seed = args
+    set_level(logging.WARNING)
+
+    rnd = random.Random(seed)
+    tickers = [str(100000 + i * 10).zfill(6) for i in range(N_TICKERS)]
+    prices = [str(50000 + i * 100).zfill(5) for i in range(N_PRICES)]
+
+    redis = InMemoryRedis()
+    client = Client("127.0.0.1", port, redis=redis)
+    client.socket.connect()
+
+    latencies = []
+    n_acked = n_sent = 0
+    acked = []  # (order_no, ticker, price) of the NewOrders to cancel later
+
+    def send(packets):
+        nonlocal n_acked, n_sent
+        n_saved = len(redis.lrange("NewOrder"))
+
+        stime = time.perf_counter()
+        if window == 1:
+            results = [client.sendall(packets[0])]
+        else:
+            results = client.send_many(packets, window=window)
+        latencies.append((time.perf_counter() - stime) / len(packets))
+
+        n_sent += len(packets)
+        n_acked += sum(results)
+        for j in redis.lrange("NewOrder")[n_saved:]:
+            o = json.loads(j)
+            if o["response_code"] == "0" and rnd.random() < cancel_ratio:
+                acked.append((o["order_no"], o["ticker"], o["price"]))
+
+    stime = time.perf_counter()
+    for _ in range(0, n_orders, window):
+        packets = [
+            _packet("0", "00000", rnd.choice(tickers), rnd.choice(prices), rnd.randint(1, 100))
+            for _ in range(window)
+        ]
+        send(packets)
+
+        if len(acked) >= window:
+            send([_packet("1", no, ticker, price, 1) for no, ticker, price in acked[:window]])
+            del acked[:window]
+    elapsed = time.perf_counter() - stime
+
+    client.close()
+    return {
+        "sent": n_sent,
+        "acked": n_acked,
+        "executions": len(redis.lrange("OrderExecutedOrder")),
+        "elapsed": elapsed,
+        "latencies": latencies,
+    }
+
+
+def run(port, n_sessions, n_orders, window=1, cancel_ratio=0.1):
+    with multiprocessing.Pool(n_sessions) as pool:
+        return pool.map(
+            session, [(port, n_orders, window, cancel_ratio, seed) for seed in range(n_sessions)]
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client sessions against ExchangeSimulator")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=5000, help="NewOrders per session")
+    parser.add_argument("--window", type=int, default=1, help="1: sendall, >1: send_many")
+    parser.add_argument("--cancel-ratio", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fill-ratio", type=float, default=0.5)
+    parser.add_argument("--contra-interval", type=float, default=0.001)
+    args = parser.parse_args()
+
+    port = serve_in_process(
+        latency=args.latency,
+        jitter=args.jitter,
+        fill_ratio=args.fill_ratio,
+        contra_interval=args.contra_interval,
+        seed=0,
+    )
+    stime = time.perf_counter()
+    results = run(port, args.sessions, args.orders, args.window, args.cancel_ratio)
+    elapsed = time.perf_counter() - stime
+
+    latencies = sorted(l for r in results for l in r["latencies"])
+    p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    sent = sum(r["sent"] for r in results)
+
+    print(
+        f"{'sessions':>8} {'window':>6} {'messages':>9} {'acked':>9} {'executions':>10} "
+        f"{'msgs/s':>9} {'p50 (us)':>9} {'p99 (us)':>9}"
+    )
+    print(
+        f"{args.sessions:>8} {args.window:>6} {sent:>9,} {sum(r['acked'] for r in results):>9,} "
+        f"{sum(r['executions'] for r in results):>10,} {sent / elapsed:>9,.0f} "
+        f"{p50 * 1e6:>9,.0f} {p99 * 1e6:>9,.0f}"
+    )
+    print("latency per message, send -> acks received and saved (window / window size)")
@@ -0,0 +1,89 @@
+""" synthetic order flows for benchmarks, no network / Redis required """
+from datetime import datetime, timedelta
+import random
+from typing import Dict, Iterator, List
+
+
+def synthetic_flow(
+    n_events: int, n_tickers=50, n_prices=20, fill_ratio=0.5, cancel_ratio=0.1, seed=0
+) -> List[Dict[str, str]]:
+    """ order kwargs as saved by Client.save_cache, in arrival order
+
+    every NewOrder is followed by its ReceivedOrder, then
+     - `fill_ratio` of them get one partial ExecutedOrder
+     - `cancel_ratio` of them get a successful CancelOrder (+ ReceivedOrder)
+    """
+    return list(iter_synthetic_flow(n_events, n_tickers, n_prices, fill_ratio, cancel_ratio, seed))
+
+
+def iter_synthetic_flow(
+    n_events: int, n_tickers=50, n_prices=20, fill_ratio=0.5, cancel_ratio=0.1, seed=0
+) -> Iterator[Dict[str, str]]:
+    rnd = random.Random(seed)
+    tickers = [str(100000 + i * 10).zfill(6) for i in range(n_tickers)]
+    prices = [str(50000 + i * 100).zfill(5) for i in range(n_prices)]
+    start = datetime(2020, 5, 26, 9)
+
+    n = 0
+    order_no = 0
+    while n < n_events:
+        order_no += 1
+        no = str(order_no).zfill(5)[-5:]
+        time = str(start + timedelta(microseconds=order_no * 100))
+
+        ticker, price = rnd.choice(tickers), rnd.choice(prices)
+        qty = rnd.randint(2, 100)
+
+        events = [
+            new_order(no, ticker, price, qty, "0", time),
+            received_order(no, "0", time),
+        ]
+        unex_qty = qty
+        if rnd.random() < fill_ratio:
+            fill = rnd.randint(1, qty - 1)
+            unex_qty -= fill
+            events.append(executed_order(no, fill, time))
+        if rnd.random() < cancel_ratio:
+            events.append(cancel_order(no, ticker, price, unex_qty, "0", time))
+            events.append(received_order(no, "0", time))
+
+        for e in events[: n_events - n]:
+            yield e
+        n += len(events)
+
+
+def new_order(order_no, ticker, price, qty, response_code, time, msg_type="0"):
+    return {
+        "packet": f"{msg_type}00000{ticker}{price}{str(qty).zfill(5)}",
+        "msg_type": msg_type,
+        "order_no": order_no,
+        "ticker": ticker,
+        "price": price,
+        "qty": str(qty).zfill(5),
+        "response_code": response_code,
+        "time": time,
+    }
+
+
+def cancel_order(order_no, ticker, price, qty, response_code, time):
+    return new_order(order_no, ticker, price, qty, response_code, time, msg_type="1")
+
+
+def received_order(order_no, response_code, time):
+    return {
+        "packet": f"2{order_no}{response_code}",
+        "msg_type": "2",
+        "order_no": order_no,
+        "response_code": response_code,
+        "time": time,
+    }
+
+
+def executed_order(order_no, qty, time):
+    return {
+        "packet": f"3{order_no}{str(qty).zfill(5)}",
+        "msg_type": "3",
+        "order_no": order_no,
+        "qty": str(qty).zfill(5),
+        "time": time,
+    }
@@ -0,0 +1,61 @@
+""" OrderHistory ingest benchmark, full scan vs order_no index for unex_qty
+
+python -m benchmarks.ingest [n_events ...]
+"""
+import sys
+import time
+
+from cache.memory import InMemoryRedis
+from orders.history import OrderHistory
+from orders.orders import CancelOrder, ExecutedOrder, NewOrder, OrderFactory
+from benchmarks.flows import synthetic_flow
+
+BATCH_SIZE = 1000  # orders per update
+LEGACY_MAX_EVENTS = 30000  # O(n^2), bigger flows take minutes
+
+
+class LegacyOrderHistory(OrderHistory):
+    """ _update_unex_qty before the order_no index (full scan of _history per fill) """
+
+    def _update_unex_qty(self, orders):
+        for o in orders:
+            if isinstance(o, ExecutedOrder) or (
+                isinstance(o, CancelOrder) and getattr(o, "response_code") == "0"
+            ):
+                order_no = getattr(o, "order_no")
+                qty = int(getattr(o, "qty"))
+
+                for target_order in self._history:
+                    if (
+                        isinstance(target_order, NewOrder)
+                        and getattr(target_order, "order_no") == order_no
+                        and getattr(target_order, "response_code") == "0"
+                    ):
+                        target_order.subtract_unex_order_count(qty)
+
+
+def ingest(history_cls, orders) -> float:
+    history = history_cls(redis=InMemoryRedis())
+
+    stime = time.perf_counter()
+    for i in range(0, len(orders), BATCH_SIZE):
+        history._update(orders[i : i + BATCH_SIZE])
+    return time.perf_counter() - stime
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000, 1000000]
+    factory = OrderFactory()
+
+    print(f"{'events':>9} {'legacy (ev/s)':>15} {'indexed (ev/s)':>15}")
+    for n in sizes:
+        orders = [factory.create(**kw) for kw in synthetic_flow(n)]
+
+        indexed = ingest(OrderHistory, orders)
+        if n <= LEGACY_MAX_EVENTS:
+            orders = [factory.create(**kw) for kw in synthetic_flow(n)]  # fresh unex_qty
+            legacy = f"{n / ingest(LegacyOrderHistory, orders):>15,.0f}"
+        else:
+            legacy = f"{'skipped':>15}"
+
+        print(f"{n:>9,} {legacy} {n / indexed:>15,.0f}")
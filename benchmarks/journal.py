@@ -0,0 +1,97 @@
+""" order event persistence, JSON log lines (disk) vs binary journal
+
+python -m benchmarks.journal [n_events ...]
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from cache.memory import InMemoryRedis
+from journal import JournalWriter
+from orders.history import OrderHistory
+from benchmarks.flows import synthetic_flow
+
+KEYS = {"0": "NewOrder", "1": "CancelOrderOrder", "2": "OrderReceivedOrder", "3": "OrderExecutedOrder"}
+
+
+class TmpHistory(OrderHistory):
+    directory = None
+
+    @property
+    def log_path(self):
+        return os.path.join(self.directory, "client.log")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, "journal")
+
+
+def write_log(directory, msgs) -> float:
+    """ Client._log_cache: json + logging formatter + FileHandler """
+    logger = logging.getLogger("benchmarks.journal")
+    logger.propagate = False
+    handler = logging.FileHandler(os.path.join(directory, "client.log"))
+    handler.setFormatter(logging.Formatter("[%(module)s:%(lineno)d][%(levelname)s][%(asctime)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+    stime = time.perf_counter()
+    for m in msgs:
+        logger.debug(f"{KEYS[m.msg_type]}-{json.dumps(m.__dict__)}")
+    elapsed = time.perf_counter() - stime
+
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed
+
+
+def write_journal(directory, msgs) -> float:
+    writer = JournalWriter(os.path.join(directory, "journal"))
+    stime = time.perf_counter()
+    writer.append(msgs)
+    writer.flush()
+    elapsed = time.perf_counter() - stime
+    writer.close()
+    return elapsed
+
+
+def read(directory, source, n) -> float:
+    """ n: events expected in directory """
+    history = TmpHistory(source=source, redis=InMemoryRedis())
+    history.directory = directory
+
+    with history:
+        stime = time.perf_counter()
+        orders = history.load_new_orders()
+        elapsed = time.perf_counter() - stime
+
+    assert len(orders) == n
+    return elapsed
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [100000, 1000000]
+
+    print(f"{'events':>9} {'write log':>10} {'write jnl':>10} {'read log':>10} {'read jnl':>10}  (events/s)")
+    for n in sizes:
+        msgs = [SimpleNamespace(**kw) for kw in synthetic_flow(n)]
+        for m in msgs:
+            del m.packet
+
+        directory = tempfile.mkdtemp()
+        try:
+            results = [
+                write_log(directory, msgs),
+                write_journal(directory, msgs),
+                read(directory, "disk", n),
+                read(directory, "journal", n),
+            ]
+        finally:
+            shutil.rmtree(directory)
+
+        print(f"{n:>9,} " + " ".join(f"{n / r:>10,.0f}" for r in results))
@@ -0,0 +1,71 @@
+""" Client.sendall round trips against StubExchangeServer, by logging mode
+
+python -m benchmarks.logging_overhead [n_orders]
+
+ - off    : set_level(WARNING), debug records are dropped by the level check
+ - sync   : DEBUG, formatted and written (file + stderr) in the calling thread
+ - queued : DEBUG, QueuedLogging, written by the listener thread
+the exchange runs in another process, as a remote one would
+stderr is redirected to /dev/null, the log file is logger/.logs/client.log
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from cache.memory import InMemoryRedis
+from client import Client
+from exchange import StubExchangeServer
+from logger import QueuedLogging, set_level
+
+NEW_PACKET = b"0000000006606000000010"
+
+
+def _serve(ports, fill_qty):
+    async def serve():
+        ports.put(await StubExchangeServer(fill_qty=fill_qty).start())
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def serve_in_process(fill_qty=5) -> int:
+    """ run StubExchangeServer in a daemon process (no GIL sharing), return the port """
+    ports = multiprocessing.Queue()
+    multiprocessing.Process(target=_serve, args=(ports, fill_qty), daemon=True).start()
+    return ports.get()
+
+
+def run(port, n) -> list:
+    client = Client("127.0.0.1", port, redis=InMemoryRedis())
+    client.socket.connect()
+
+    latencies = []
+    for _ in range(n):
+        stime = time.perf_counter()
+        client.sendall(NEW_PACKET)
+        latencies.append(time.perf_counter() - stime)
+
+    client.close()
+    return sorted(latencies)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    sys.stderr = open(os.devnull, "w")  # before any StreamHandler is built
+
+    port = serve_in_process()
+
+    print(f"{'mode':>7} {'orders/s':>10} {'p50 (us)':>9} {'p99 (us)':>9}")
+    for mode in ["off", "sync", "queued"]:
+        set_level(logging.WARNING if mode == "off" else logging.DEBUG)
+        if mode == "queued":
+            QueuedLogging.start()
+
+        latencies = run(port, n)
+        QueuedLogging.stop()
+
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+        print(f"{mode:>7} {n / sum(latencies):>10,.0f} {p50 * 1e6:>9,.0f} {p99 * 1e6:>9,.0f}")
@@ -0,0 +1,55 @@
+""" memory of the Order representation, __dict__ + padded str (legacy) vs __slots__ + int
+
+python -m benchmarks.memory [n_events ...]
+"""
+import sys
+import tracemalloc
+
+from orders.orders import OrderFactory
+from benchmarks.flows import iter_synthetic_flow
+
+
+class LegacyOrder:
+    """ Order before __slots__, every field (incl. packet) in __dict__ as str """
+
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+class LegacyNewOrder(LegacyOrder):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.unex_qty = kwargs["qty"]
+
+
+class LegacyOrderFactory:
+    def create(self, **kwargs) -> LegacyOrder:
+        if kwargs["msg_type"] in ("0", "1"):
+            return LegacyNewOrder(**kwargs)
+        return LegacyOrder(**kwargs)
+
+
+def measure(factory, n):
+    """ bytes held by n orders (tracemalloc, the flow dicts are freed on the way) """
+    tracemalloc.start()
+    orders = [factory.create(**kw) for kw in iter_synthetic_flow(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del orders
+    return size
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [1000000]
+
+    print(f"{'events':>9} {'legacy (MB)':>12} {'slots (MB)':>12} {'B/order':>16} {'ratio':>6}")
+    for n in sizes:
+        legacy = measure(LegacyOrderFactory(), n)
+        slots = measure(OrderFactory(), n)
+
+        per_order = f"{legacy / n:,.0f} -> {slots / n:,.0f}"
+        print(
+            f"{n:>9,} {legacy / 2**20:>12,.1f} {slots / 2**20:>12,.1f} {per_order:>16} {legacy / slots:>6.2f}"
+        )
@@ -0,0 +1,61 @@
+""" MessageFactory.split_packet microbenchmark
+
+python -m benchmarks.split_packet [n_frames]
+"""
+from collections import deque
+import sys
+import time
+
+from messages.messages import MessageFactory
+
+
+def legacy_split_packet(packet: str):
+    """ split_packet before PacketFramer (list -> deque -> popleft per letter) """
+    result = []
+
+    letter_queue = deque(list(packet))
+    while len(letter_queue):
+        msg_cls = MessageFactory.get_msg_cls_from_msg_type(letter_queue[0])
+
+        buffer = []
+        for _ in range(msg_cls.SIZE):
+            buffer.append(letter_queue.popleft())
+        result.append("".join(buffer))
+
+    return result
+
+
+def stacked_packet(n_frames: int) -> bytes:
+    """ received(7) + executed(11) + new(22) frames, stacked """
+    frames = [b"2000010", b"30000100010", b"0000010006606000000020"]
+    return b"".join(frames[i % 3] for i in range(n_frames))
+
+
+def run(func, packet, repeat=3) -> float:
+    best = None
+    for _ in range(repeat):
+        stime = time.perf_counter()
+        func(packet)
+        elapsed = time.perf_counter() - stime
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    factory = MessageFactory()
+    packet = stacked_packet(n_frames)
+
+    assert legacy_split_packet(packet.decode()) == factory.split_packet(packet)
+
+    results = {
+        "legacy (str, deque)": run(lambda p: legacy_split_packet(p.decode()), packet),
+        "framer (str)": run(lambda p: factory.split_packet(p.decode()), packet),
+        "framer (bytes)": run(factory.split_packet, packet),
+        "framer (memoryview frames)": run(factory.framer.split, bytearray(packet)),
+    }
+
+    baseline = results["legacy (str, deque)"]
+    print(f"{n_frames} frames, {len(packet)} bytes")
+    for name, elapsed in results.items():
+        print(f"{name:<28} {elapsed * 1000:>9.1f} ms  x{baseline / elapsed:.1f}")
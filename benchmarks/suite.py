@@ -0,0 +1,273 @@
+""" benchmark suite: parsing, ingest and queries on synthetic flows, no network / Redis
+
+python -m benchmarks.suite run [--sizes 1e3,1e4,1e5,1e6] [--components parse,ingest,query] [--out FILE]
+python -m benchmarks.suite compare BASE.json NEW.json [--threshold 0.1]
+
+every (component, size) runs in a fresh process, so peak memory is its own
+ - parse  : MessageFactory.create on recv-sized stacks of wire packets
+ - ingest : OrderHistory(source="stream").update() per batch, fed through InMemoryRedis
+ - query  : the six AXETaskQuerent methods on random tickers / prices after ingest
+results (throughput, latency p50/p99/max, peak memory) are saved as JSON, see compare
+"""
+import argparse
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from cache.memory import InMemoryRedis
+from messages.messages import MessageFactory
+from metrics import Histogram
+from orders.history import OrderHistory
+from orders.query_builder import AXETaskQuerent
+from benchmarks.flows import iter_synthetic_flow
+
+COMPONENTS = ["parse", "ingest", "query"]
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]  # 10**7 on request, needs ~10 GB for query
+
+N_TICKERS = 500
+N_PRICES = 50
+PACKETS_PER_RECV = 64  # stacked packets per MessageFactory.create
+BATCH_SIZE = 1000  # events per OrderHistory.update
+N_QUERIES = 2000  # per query method
+
+
+def flow(n):
+    return iter_synthetic_flow(n, n_tickers=N_TICKERS, n_prices=N_PRICES)
+
+
+def _timed_calls(func, args_list, histogram: Histogram) -> float:
+    """ total seconds, latency of each call recorded in the histogram """
+    perf_counter_ns = time.perf_counter_ns
+    total = 0
+    for args in args_list:
+        stime = perf_counter_ns()
+        func(*args)
+        elapsed = perf_counter_ns() - stime
+        histogram.record(elapsed)
+        total += elapsed
+    return total / 1e9
+
+
+def bench_parse(n, histogram):
+    factory = MessageFactory()
+    packets = [kw["packet"].encode() for kw in flow(n)]
+    stacks = [
+        (b"".join(packets[i : i + PACKETS_PER_RECV]),)
+        for i in range(0, len(packets), PACKETS_PER_RECV)
+    ]
+    del packets
+
+    return n, _timed_calls(factory.create, stacks, histogram)
+
+
+def _ingest(n, histogram):
+    redis = InMemoryRedis()
+    history = AXETaskQuerent(source="stream", redis=redis)
+
+    elapsed = 0.0
+    batch = []
+    for kw in flow(n):
+        batch.append(("", json.dumps(kw)))
+        if len(batch) == BATCH_SIZE:
+            redis.rpush_all(batch, stream=OrderHistory.STREAM_KEY)
+            elapsed += _timed_calls(history.update, [()], histogram)
+            batch = []
+    if batch:
+        redis.rpush_all(batch, stream=OrderHistory.STREAM_KEY)
+        elapsed += _timed_calls(history.update, [()], histogram)
+
+    return history, elapsed
+
+
+def bench_ingest(n, histogram):
+    _, elapsed = _ingest(n, histogram)
+    return n, elapsed
+
+
+def bench_query(n, histogram):
+    querent, _ = _ingest(n, Histogram("ingest"))
+
+    rnd = random.Random(0)
+    orders = [o for o in querent._history if o.msg_type == "0"]
+    picks = [rnd.choice(orders) for _ in range(N_QUERIES)]
+
+    elapsed = 0.0
+    for method, args in [
+        (querent.get_unex_qty_by_ticker, [(o.ticker,) for o in picks]),
+        (querent.get_unex_qty_by_ticker_and_price, [(o.ticker, o.price) for o in picks]),
+        (querent.get_unex_orders_by_ticker, [(o.ticker,) for o in picks]),
+        (querent.get_unex_orders_by_ticker_and_price, [(o.ticker, o.price) for o in picks]),
+        (querent.get_unex_order_by_ticker_sorted, [(o.ticker,) for o in picks]),
+        (querent.get_order_by_ticker_and_order_no, [(o.ticker, o.order_no) for o in picks]),
+    ]:
+        elapsed += _timed_calls(method, args, histogram)
+
+    return 6 * N_QUERIES, elapsed
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on linux
+
+
+def _worker(component, n, results):
+    baseline = _peak_rss_mb()
+    histogram = Histogram(component)
+
+    ops, elapsed = globals()[f"bench_{component}"](n, histogram)
+
+    latency = histogram.snapshot()
+    results.put(
+        {
+            "component": component,
+            "events": n,
+            "ops": ops,
+            "seconds": elapsed,
+            "throughput": ops / elapsed if elapsed else 0.0,
+            "p50": latency["p50"],
+            "p99": latency["p99"],
+            "max": latency["max"],
+            "peak_mb": _peak_rss_mb() - baseline,
+        }
+    )
+
+
+def run(components, sizes):
+    ctx = multiprocessing.get_context("spawn")  # fresh interpreter, clean peak memory
+    for component in components:
+        for n in sizes:
+            results = ctx.Queue()
+            p = ctx.Process(target=_worker, args=(component, n, results))
+            p.start()
+            result = _result(p, results)
+            p.join()
+            yield result
+
+
+def _result(p, results) -> dict:
+    """ result of the worker p, RuntimeError if it exited without one (e.g. OOM killed) """
+    while True:
+        exited = p.exitcode is not None  # 종료 전에 put한 결과는 이미 queue에 있음
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if exited:
+                raise RuntimeError(f"{p.name} exited with {p.exitcode}, no result") from None
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit or None,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _print_result(r) -> None:
+    print(
+        f"{r['component']:>7} {r['events']:>11,} {r['throughput']:>13,.0f} "
+        f"{r['p50'] * 1e6:>10,.1f} {r['p99'] * 1e6:>10,.1f} {r['max'] * 1e6:>11,.1f} {r['peak_mb']:>9,.1f}"
+    )
+
+
+def cmd_run(args):
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    components = args.components.split(",")
+    for c in components:
+        if c not in COMPONENTS:
+            raise SystemExit(f"unknown component {c}, choose from {COMPONENTS}")
+
+    print(f"{'comp':>7} {'events':>11} {'ops/s':>13} {'p50 (us)':>10} {'p99 (us)':>10} {'max (us)':>11} {'peak (MB)':>9}")
+    results = []
+    for r in run(components, sizes):
+        _print_result(r)
+        results.append(r)
+
+    out = args.out or f"benchmarks/results/{_meta()['commit'] or 'run'}-{int(time.time())}.json"
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": _meta(), "results": results}, f, indent=2)
+    print(f"saved {out}")
+
+
+def compare(base: dict, new: dict, threshold=0.1):
+    """ [(component, events, metric, base, new, change, is_regression)] of the common runs """
+    rows = []
+    base_results = {(r["component"], r["events"]): r for r in base["results"]}
+    for r in new["results"]:
+        b = base_results.get((r["component"], r["events"]))
+        if b is None:
+            continue
+
+        for metric, higher_is_better in [
+            ("throughput", True),
+            ("p50", False),
+            ("p99", False),
+            ("peak_mb", False),
+        ]:
+            if not b[metric]:
+                continue
+            change = r[metric] / b[metric] - 1
+            worse = -change if higher_is_better else change
+            rows.append(
+                (r["component"], r["events"], metric, b[metric], r[metric], change, worse > threshold)
+            )
+    return rows
+
+
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"base {base['meta'].get('commit')} ({base['meta'].get('date')})")
+    print(f"new  {new['meta'].get('commit')} ({new['meta'].get('date')})")
+    print(f"{'comp':>7} {'events':>11} {'metric':>10} {'base':>14} {'new':>14} {'change':>8}")
+
+    rows = compare(base, new, args.threshold)
+    for component, events, metric, b, n, change, regression in rows:
+        scale = 1e6 if metric in ("p50", "p99") else 1  # us
+        flag = "  REGRESSION" if regression else ""
+        print(
+            f"{component:>7} {events:>11,} {metric:>10} {b * scale:>14,.1f} {n * scale:>14,.1f} {change:>+8.1%}{flag}"
+        )
+
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="parse / ingest / query benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--sizes", default=",".join(str(s) for s in SIZES))
+    p_run.add_argument("--components", default=",".join(COMPONENTS))
+    p_run.add_argument("--out", default=None, help="default: benchmarks/results/<commit>-<time>.json")
+    p_run.set_defaults(func=cmd_run)
+
+    p_compare = sub.add_parser("compare")
+    p_compare.add_argument("base")
+    p_compare.add_argument("new")
+    p_compare.add_argument("--threshold", type=float, default=0.1, help="relative change flagged")
+    p_compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from cache.redis import Redis
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis < 4.2
+    aioredis = None
+
+
+class AsyncRedis:
+    """ asyncio counterpart of cache.redis.Redis (redis.asyncio, redis>=4.2) """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            if aioredis is None:
+                raise ImportError("AsyncRedis requires redis>=4.2 (redis.asyncio)")
+            self._conn = aioredis.Redis(host=self.host, port=self.port, db=0)
+        return self._conn
+
+    async def rpush(self, key, *value):
+        await self.conn.rpush(key, *value)
+
+    async def rpush_all(self, entries, transaction=True, seq_key=None, stream=None):
+        """ see Redis.rpush_all """
+        values = defaultdict(list)
+        for key, value in entries:
+            values[key].append(value)
+
+        pipe = self.conn.pipeline(transaction=transaction)
+        for key, value in values.items():
+            pipe.rpush(key, *value)
+        if stream is not None:
+            for key, value in entries:
+                fields = {"key": key, "data": value}
+                pipe.xadd(stream, fields, maxlen=Redis.STREAM_MAXLEN, approximate=True)
+        if seq_key is not None:
+            pipe.incrby(seq_key, len(entries))
+
+        result = await pipe.execute()
+        return result[-1] if seq_key is not None else None
+
+    async def lrange(self, key, start=0, end=-1):
+        value = await self.conn.lrange(key, start, end)
+        return [v.decode() for v in value]
+
+    async def flushall(self):
+        await self.conn.flushall()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
@@ -0,0 +1,114 @@
+from collections import defaultdict
+import fnmatch
+import threading
+import time
+
+
+class InMemoryRedis:
+    """ in-process stand-in for cache.redis.Redis, for tests and benchmarks
+
+    implements the subset of the wrapper used by Client and OrderHistory,
+    with the same return types (decoded str instead of bytes where the wrapper decodes)
+    rpush_all is atomic (one lock), xread supports blocking reads,
+    the stream is never trimmed (Redis.STREAM_MAXLEN is not applied)
+    """
+
+    pool = None
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._lists = defaultdict(list)
+        self._strings = {}
+        self._streams = defaultdict(list)  # {stream: [(id, fields)]}
+
+    def get(self, key):
+        with self._cond:
+            value = self._strings.get(key)
+        return None if value is None else str(value).encode()  # redis returns bytes
+
+    def set(self, key, value):
+        with self._cond:
+            self._strings[key] = value
+
+    def incrby(self, key, amount=1):
+        with self._cond:
+            return self._incrby(key, amount)
+
+    def rpush(self, key, *value):
+        with self._cond:
+            self._lists[key].extend(value)
+
+    def lrange(self, key, start=0, end=-1):
+        with self._cond:
+            values = self._lists.get(key, [])
+            end = len(values) if end == -1 else end + 1
+            return list(values[start:end])
+
+    def keys(self, pattern="*"):
+        with self._cond:
+            keys = list(self._lists) + list(self._strings) + list(self._streams)
+        return [k.encode() for k in keys if fnmatch.fnmatchcase(k, pattern)]
+
+    def scan_iter(self, pattern="*", count=100):
+        return [k.decode() for k in self.keys(pattern)]
+
+    def rpush_all(self, entries, transaction=True, seq_key=None, stream=None):
+        """ see Redis.rpush_all """
+        with self._cond:
+            for key, value in entries:
+                self._lists[key].append(value)
+                if stream is not None:
+                    self._xadd(stream, {"key": key, "data": value})
+
+            seq = self._incrby(seq_key, len(entries)) if seq_key is not None else None
+            self._cond.notify_all()
+        return seq
+
+    def xadd(self, stream, fields):
+        with self._cond:
+            entry_id = self._xadd(stream, fields)
+            self._cond.notify_all()
+        return entry_id
+
+    def xread(self, stream, last_id="0-0", count=None, block=None):
+        """ see Redis.xread, block=0 waits forever like BLOCK 0 """
+        deadline = None if not block else time.monotonic() + block / 1000
+        last_seq = int(last_id.split("-")[0])
+
+        with self._cond:
+            while True:
+                entries = self._streams.get(stream, [])
+                # id == "<seq>-0" and seq == idx + 1
+                new_entries = entries[last_seq : None if count is None else last_seq + count]
+                if new_entries or block is None:
+                    return [(i, dict(f)) for i, f in new_entries]
+
+                if deadline is None:  # block=0
+                    self._cond.wait()
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+    def xlast_id(self, stream) -> str:
+        with self._cond:
+            entries = self._streams.get(stream)
+            return entries[-1][0] if entries else "0-0"
+
+    def flushall(self):
+        with self._cond:
+            self._lists.clear()
+            self._strings.clear()
+            self._streams.clear()
+
+    def _incrby(self, key, amount):
+        self._strings[key] = int(self._strings.get(key, 0)) + amount
+        return self._strings[key]
+
+    def _xadd(self, stream, fields):
+        entries = self._streams[stream]
+        entry_id = f"{len(entries) + 1}-0"
+        entries.append((entry_id, fields))
+        return entry_id
@@ -0,0 +1,79 @@
+from collections import Counter
+import threading
+import time
+
+try:
+    import redis
+except ImportError as e:  # cache.redis.RedisRegistry는 redis가 있을 때만 import함
+    raise ImportError(
+        "cache.pool requires redis-py (pip install redis), "
+        "or use RedisRegistry.configure(backend='memory')"
+    ) from e
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """ BlockingConnectionPool with usage stats
+
+    callers block (up to `timeout`) when `max_connections` are in use,
+    instead of opening more connections
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checked_out = set()  # id of the connections handed out, not released yet
+        self.checkouts = 0
+        self.wait_time = 0.0  # seconds spent waiting for a connection
+        self.max_wait_time = 0.0
+        self.commands = Counter()
+
+    def get_connection(self, *args, **kwargs):
+        stime = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        wait = time.perf_counter() - stime
+
+        with self._stats_lock:
+            self._checked_out.add(id(connection))
+            self.checkouts += 1
+            self.wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+        return connection
+
+    def release(self, connection):
+        """ also called by get_connection itself when connect() fails, before it was counted """
+        with self._stats_lock:
+            self._checked_out.discard(id(connection))
+        return super().release(connection)
+
+    @property
+    def in_use(self) -> int:
+        return len(self._checked_out)
+
+    def count(self, *command_names):
+        with self._stats_lock:
+            self.commands.update(command_names)
+
+    def client(self) -> redis.Redis:
+        return CountingRedis(connection_pool=self)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            created = len(self._connections)
+            return {
+                "max_connections": self.max_connections,
+                "created": created,
+                "in_use": len(self._checked_out),
+                "idle": created - len(self._checked_out),
+                "checkouts": self.checkouts,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+                "commands": dict(self.commands),
+            }
+
+
+class CountingRedis(redis.Redis):
+    """ redis.Redis which counts commands on its InstrumentedConnectionPool """
+
+    def execute_command(self, *args, **options):
+        self.connection_pool.count(args[0])
+        return super().execute_command(*args, **options)
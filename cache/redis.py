@@ -1,22 +1,43 @@
 import ast
+from collections import defaultdict
 from collections.abc import Iterable
 import json
+import os
+import threading
 
-import redis
-from redis.exceptions import DataError, ResponseError
+try:
+    import redis
+    from redis.exceptions import DataError, ResponseError
+except ImportError:  # cache.memory.InMemoryRedis only
+    redis = None
 
 
 class Redis:
-    def __init__(self, host, port):
+    # retention of the rpush_all stream, trimmed approximately (XADD MAXLEN ~),
+    # the per-type lists keep every message, a stream reader further behind skips the trimmed events
+    STREAM_MAXLEN = 1000000
+
+    def __init__(self, host, port, pool=None):
+        """ pool: cache.pool.InstrumentedConnectionPool shared with other wrappers
+            (see RedisRegistry), None for a private connection
+        """
         self.host = host
         self.port = port
+        self.pool = pool
 
         self._conn = None
 
     @property
     def conn(self):
         if self._conn is None:
-            self._conn = redis.Redis(host=self.host, port=self.port, db=0)
+            if redis is None:
+                raise ImportError(
+                    "redis is not installed, use RedisRegistry.configure(backend='memory')"
+                )
+            elif self.pool is not None:
+                self._conn = self.pool.client()
+            else:
+                self._conn = redis.Redis(host=self.host, port=self.port, db=0)
         return self._conn
 
     def execute_command(self, cmd):
@@ -83,9 +104,144 @@ class Redis:
     def rpush(self, key, *value):
         self.conn.rpush(key, *value)
 
+    # push all in one
+    def rpush_all(self, entries, transaction=True, seq_key=None, stream=None):
+        """ [(key, value), ...] -> one RPUSH per key, sent in a single round trip
+            wrapped in MULTI/EXEC when transaction is True
+
+            if seq_key is given, it is INCRBY'd by the number of entries in the same
+            transaction and its new value is returned
+            if stream is given, every entry is also XADD'ed to it as {"key", "data"},
+            in the given order, capped at about STREAM_MAXLEN entries
+        """
+        values = defaultdict(list)
+        for key, value in entries:
+            values[key].append(value)
+
+        pipe = self.conn.pipeline(transaction=transaction)
+        for key, value in values.items():
+            pipe.rpush(key, *value)
+        if stream is not None:
+            for key, value in entries:
+                fields = {"key": key, "data": value}
+                pipe.xadd(stream, fields, maxlen=self.STREAM_MAXLEN, approximate=True)
+        if seq_key is not None:
+            pipe.incrby(seq_key, len(entries))
+
+        if self.pool is not None:
+            self.pool.count(*(args[0] for args, _ in pipe.command_stack))
+
+        result = pipe.execute()
+        return result[-1] if seq_key is not None else None
+
+    def xread(self, stream, last_id="0-0", count=None, block=None):
+        """ entries of `stream` after last_id -> [(id, {field: value}), ...]
+            block: milliseconds to wait for a new entry, None for no wait, 0 forever
+        """
+        result = self.conn.xread({stream: last_id}, count=count, block=block)
+        if not result:
+            return []
+
+        _, entries = result[0]
+        return [(i.decode(), self._decode(fields)) for i, fields in entries]
+
+    def xlast_id(self, stream) -> str:
+        """ id of the last entry of `stream`, "0-0" if it is empty """
+        result = self.conn.xrevrange(stream, count=1)
+        return result[0][0].decode() if result else "0-0"
+
     def lrange(self, key, start=0, end=-1):
         value = self.conn.lrange(key, start=start, end=end)
         return [v.decode() for v in value]
 
+    def get(self, key):
+        return self.conn.get(key)
+
     def flushall(self):
         self.conn.flushall()
+
+
+class RedisRegistry:
+    """ process-wide registry of Redis wrappers
+
+    every component asking for the same endpoint shares one wrapper,
+    backed by one InstrumentedConnectionPool, so the number of connections
+    per process is bounded by `max_connections` whatever the number of querents
+
+    the default endpoint is read from AXE_REDIS_HOST / AXE_REDIS_PORT /
+    AXE_REDIS_MAX_CONNECTIONS, or set with configure() before the first get()
+
+    backend="memory" (or AXE_REDIS_BACKEND=memory) hands out one shared
+    cache.memory.InMemoryRedis instead, for tests and benchmarks without Redis
+    """
+
+    backend = os.environ.get("AXE_REDIS_BACKEND", "redis")
+    host = os.environ.get("AXE_REDIS_HOST", "127.0.0.1")
+    port = int(os.environ.get("AXE_REDIS_PORT", 6379))
+    max_connections = int(os.environ.get("AXE_REDIS_MAX_CONNECTIONS", 50))
+    timeout = 20  # seconds to wait for a free connection
+
+    _lock = threading.Lock()
+    _clients = {}  # {(host, port): Redis}
+
+    @classmethod
+    def configure(
+        cls, host=None, port=None, max_connections=None, timeout=None, backend=None
+    ):
+        if backend is not None:
+            cls.backend = backend
+        if host is not None:
+            cls.host = host
+        if port is not None:
+            cls.port = int(port)
+        if max_connections is not None:
+            cls.max_connections = max_connections
+        if timeout is not None:
+            cls.timeout = timeout
+
+    @classmethod
+    def get(cls, host=None, port=None) -> Redis:
+        endpoint = (host or cls.host, int(port or cls.port))
+
+        with cls._lock:
+            client = cls._clients.get(endpoint)
+            if client is None and cls.backend == "memory":
+                from cache.memory import InMemoryRedis
+
+                client = InMemoryRedis()
+                cls._clients[endpoint] = client
+            elif client is None and redis is None:
+                client = Redis(host=endpoint[0], port=endpoint[1])  # conn에서 ImportError
+            elif client is None:
+                from cache.pool import InstrumentedConnectionPool
+
+                pool = InstrumentedConnectionPool(
+                    host=endpoint[0],
+                    port=endpoint[1],
+                    db=0,
+                    max_connections=cls.max_connections,
+                    timeout=cls.timeout,
+                )
+                client = Redis(host=endpoint[0], port=endpoint[1], pool=pool)
+                cls._clients[endpoint] = client
+            return client
+
+    @classmethod
+    def stats(cls) -> dict:
+        """ {"host:port": pool stats} """
+        with cls._lock:
+            clients = dict(cls._clients)
+        return {
+            f"{h}:{p}": c.pool.stats()
+            for (h, p), c in clients.items()
+            if getattr(c, "pool", None) is not None
+        }
+
+    @classmethod
+    def reset(cls) -> None:
+        """ disconnect and forget every pool """
+        with cls._lock:
+            clients, cls._clients = cls._clients, {}
+        for c in clients.values():
+            if getattr(c, "pool", None) is not None:
+                c.pool.disconnect()
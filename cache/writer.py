@@ -0,0 +1,178 @@
+import atexit
+from itertools import chain
+import queue
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from logger import LoggerMixin
+
+
+class WriteBehindWriter(LoggerMixin):
+    """ write-behind persistence for Client.save_cache
+
+    save_cache only puts [(key, json), ...] on a bounded in-memory queue,
+    a background thread drains it in batches to Redis (one MULTI/EXEC per batch)
+    and then to the log.
+
+     - backpressure: put() blocks while the queue is full
+       (raises queue.Full after `put_timeout` seconds, None: wait forever)
+     - durability: flush() blocks until everything put so far is persisted,
+       close() flushes and stops the worker, and is registered with atexit
+     - failures: a batch is retried `max_retries` times (None: forever), then it and
+       every later put are dropped (to keep the order), flush() and put() raise RuntimeError
+    """
+
+    def __init__(
+        self,
+        redis,
+        log: Callable[[List[Tuple[str, str]]], None] = None,
+        seq_key: str = None,
+        stream: str = None,
+        max_queue_size=10000,
+        flush_interval=0.05,
+        flush_size=500,
+        put_timeout=None,
+        retry_interval=1.0,
+        max_retries=10,
+    ):
+        self.redis = redis
+        self.log = log
+        self.seq_key = seq_key
+        self.stream = stream
+
+        self.flush_interval = flush_interval  # seconds
+        self.flush_size = flush_size  # number of puts per batch
+        self.put_timeout = put_timeout
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.persisted_seq = 0  # value of seq_key after the last batch
+
+        self._cond = threading.Condition()
+        self._put_lock = threading.Lock()  # ticket 순서 == queue 순서
+        self._last_ticket = 0  # ticket of the last put
+        self._persisted_ticket = 0  # ticket of the last persisted put
+        self._failed_ticket = None  # first ticket of the dropped puts
+        self.error = None  # error of the dropped batch
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, entries: List[Tuple[str, str]]) -> int:
+        """ enqueue one interaction, return its ticket (see wait) """
+        with self._put_lock:  # close()와 경쟁하지 않도록 lock 안에서 확인
+            if self._closed:
+                raise RuntimeError("WriteBehindWriter is closed")
+            if self.error is not None:
+                raise RuntimeError("WriteBehindWriter dropped a batch") from self.error
+
+            ticket = self._last_ticket + 1
+            self.queue.put((ticket, entries), timeout=self.put_timeout)
+            self._last_ticket = ticket
+        return ticket
+
+    def wait(self, ticket: int, timeout=None) -> bool:
+        """ block until the put with `ticket` is persisted, False on timeout
+            raise RuntimeError if it was dropped
+        """
+        with self._cond:
+            done = self._cond.wait_for(
+                lambda: self._persisted_ticket >= ticket or self._is_dropped(ticket), timeout
+            )
+            if self._is_dropped(ticket):
+                raise RuntimeError(f"put {ticket} was dropped") from self.error
+            return done
+
+    def _is_dropped(self, ticket: int) -> bool:
+        return self._failed_ticket is not None and ticket >= self._failed_ticket
+
+    def flush(self, timeout=None) -> bool:
+        """ block until every put so far is persisted, False on timeout """
+        return self.wait(self._last_ticket, timeout)
+
+    def close(self, timeout=None) -> bool:
+        """ flush and stop the worker, False if not everything put was persisted """
+        with self._put_lock:
+            if self._closed:
+                return True
+            self._closed = True  # stop signal, the worker exits once the queue is drained
+
+        try:
+            is_flushed = self.flush(timeout)
+        except RuntimeError:  # dropped, already logged by the worker
+            is_flushed = False
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+        return is_flushed
+
+    """ worker """
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                self._write(batch)
+
+    def _next_batch(self):
+        """ wait for the first put, then collect up to flush_size puts within flush_interval
+            return None once closed and drained
+        """
+        try:
+            item = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:  # closed 이후에는 put이 없으므로 비어 있으면 종료
+            return None if self._closed and self.queue.empty() else []
+
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _write(self, batch):
+        if self.error is not None:  # 앞의 batch가 유실됨, 순서를 지키기 위해 이후 batch도 버림
+            return
+
+        entries = list(chain.from_iterable(e for _, e in batch))  # put 순서를 유지
+
+        retries = 0
+        while True:
+            try:
+                seq = self.redis.rpush_all(entries, seq_key=self.seq_key, stream=self.stream)
+                break
+            except Exception as e:  # Redis가 복구될 때까지 batch를 유지한 채로 재시도
+                if self.max_retries is not None and retries >= self.max_retries:
+                    self.logger.error(f"write-behind batch dropped after {retries} retries: {e}")
+                    with self._cond:
+                        self.error = e
+                        self._failed_ticket = batch[0][0]
+                        self._cond.notify_all()
+                    return
+
+                retries += 1
+                self.logger.error(f"write-behind batch failed, retrying: {e}")
+                time.sleep(self.retry_interval)
+
+        if self.log is not None:
+            try:
+                self.log(entries)
+            except Exception as e:  # 로그 실패로 worker가 멈추면 flush()가 끝나지 않음
+                self.logger.error(f"write-behind log failed: {e}")
+
+        with self._cond:
+            if seq is not None:
+                self.persisted_seq = seq
+            self._persisted_ticket = batch[-1][0]
+            self._cond.notify_all()
@@ -1,40 +1,193 @@
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import nullcontext
 from datetime import datetime
 import json
 import logging
 import inspect
+from itertools import chain
 import socket
 import time
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
-from cache.redis import Redis
+from cache.redis import RedisRegistry
+from cache.writer import WriteBehindWriter
+from exceptions import MessageTypeNotSupported
 from logger import LoggerMixin
+import metrics
 from messages.messages import (
     Message,
     OrderReceivedMessage,
     MessageFactory,
 )
+from orders.history import OrderHistory
 from orders.orders import OrderFactory
 from sockets import TCPSocket
 
+SOCKET_SEND = metrics.histogram("client_socket_send", "socket send of client packets")
+FIRST_BYTE = metrics.histogram("client_first_byte", "send done -> first response bytes")
+SAVE_CACHE = metrics.histogram("client_save_cache", "persistence of one save_cache call")
+
+
+class BaseClient(LoggerMixin):
+    """ transport independent parts of Client and AsyncClient """
 
-class Client(LoggerMixin):
     RESET_PACKET = b"reset"
+    RECV_TIMEOUT = 3  # seconds, default timeout of recv
+    SEQ_KEY = OrderHistory.SEQ_KEY
+    STREAM_KEY = OrderHistory.STREAM_KEY
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, journal=None):
         self.host = host
         self.port = port
-        self.socket = TCPSocket(host=host, port=port)
-
-        self.redis = Redis(host="127.0.0.1", port="6379")
+        self.journal = journal  # journal.JournalWriter, binary copy of every saved message
+        self.recv_timeout = self.RECV_TIMEOUT
 
         self.msg_factory = MessageFactory()
         self.order_factory = OrderFactory()
 
+        self._recv_buffer = bytearray()  # partial frame carried over to the next read
+        self._unacked = deque()  # client msgs sent, waiting for their ack (in send order)
+        self._sent_ns = None  # perf_counter_ns when the last send was done
+
+    def _feed(self, packet: bytes) -> List[str]:
+        """ append packet to the buffer and pop complete frames """
+        self._recv_buffer += packet
+
+        try:
+            frames, consumed = self.msg_factory.framer.scan(self._recv_buffer)
+        except MessageTypeNotSupported:
+            self._recv_buffer = bytearray()  # frame 경계를 잃었으므로 buffer를 비움
+            raise
+
+        frames = [self.msg_factory.framer.decode(f) for f in frames]
+        del self._recv_buffer[:consumed]
+
+        return frames
+
+    def _record_first_byte(self) -> None:
+        if self._sent_ns is not None:
+            FIRST_BYTE.record(time.perf_counter_ns() - self._sent_ns)
+            self._sent_ns = None
+
+    def _match_responses(self, c_packets: List[bytes], s_msgs: List[Message]):
+        """ match the n-th OrderReceivedMessage to the n-th unacked client packet
+
+            returns (is_success per packet of c_packets, [[c_msg, received msg, executed msgs ...]])
+            the exchange acks in send order. packets without an ack yet (e.g. recv timeout)
+            stay unacked and are False, their late acks are matched (and saved)
+            before the acks of the next window
+        """
+        window = [self.msg_factory.create(c_packet).pop() for c_packet in c_packets]
+        self._unacked.extend(window)
+
+        is_success = {}  # {id(c_msg): bool}
+        interactions = []
+        for m in s_msgs:
+            if isinstance(m, OrderReceivedMessage) and self._unacked:
+                c_msg = self._unacked.popleft()
+                self._overwrite_c_msg(c_msg, m.order_no, m.response_code)
+                is_success[id(c_msg)] = m.response_code == OrderReceivedMessage.SUCCESS
+
+                interactions.append([c_msg, m])
+            elif interactions:
+                interactions[-1].append(m)
+            else:  # execution reports before the first ack
+                interactions.append([m])
+
+        if self._unacked:
+            self.logger.error(f"No Message Received From Server for {len(self._unacked)} orders")
+
+        return [is_success.get(id(c_msg), False) for c_msg in window], interactions
+
+    def _overwrite_c_msg(self, c_msg: Message, order_no: str, response_code: str):
+        setattr(c_msg, "response_code", response_code)
+        if response_code == OrderReceivedMessage.SUCCESS:  # 성공한 주문만 order_no을 덮어씀
+            setattr(c_msg, "order_no", order_no)
+
+    def _cache_key(self, msg: Message) -> str:
+        cls_name = msg.__class__.__name__
+        if cls_name == "NewOrderMessage":
+            return cls_name.replace("Message", "")  # NewOrderMessage -> NewOrder
+        return cls_name.replace("Message", "Order")  # xxxMessage -> xxxOrder
+
+    def _cache_entries(self, msgs) -> List[Tuple[str, str]]:
+        """ [(key, json), ...] for one exchange interaction, in arrival order """
+        now = str(datetime.now())
+
+        entries = []
+        for m in msgs:
+            setattr(m, "time", now)  # time property 추가
+            entries.append((self._cache_key(m), m.json()))
+        return entries
+
+    def _append_journal(self, msgs: List[Message]) -> None:
+        if self.journal is not None:
+            self.journal.append(msgs)
+
+    def _log_cache(self, entries: List[Tuple[str, str]]) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+
+        for key, j in entries:
+            self.logger.debug(f"{key}-{j}")  # File
+
+    def _inspect_s_msgs(self, s_msgs: List[Message]):
+        """ 
+        Client가 packet을 전송할 때는, 주문번호와 응답코드가 비어있음
+        따라서, server에서 받은 packet에서 주문번호와 응답코드를 파싱함
+        """
+
+        for m in s_msgs:
+            if isinstance(m, OrderReceivedMessage):
+                order_no = getattr(m, "order_no")
+                response_code = getattr(m, "response_code")
+
+                return order_no, response_code
+
+
+class Client(BaseClient):
+    def __init__(
+        self, host, port, write_behind=False, redis=None, journal=None, **writer_kwargs
+    ):
+        """
+        Parameters
+        ==========
+        redis: cache.redis.Redis
+            default: shared wrapper of RedisRegistry
+        journal: journal.JournalWriter
+            if given, save_cache also appends every message to the binary journal
+            (read back by OrderHistory(source="journal"))
+        write_behind: bool
+            if True, save_cache only enqueues messages and a background thread
+            persists them to Redis and the log (see cache.writer.WriteBehindWriter)
+        writer_kwargs:
+            max_queue_size, flush_interval, flush_size, put_timeout, retry_interval,
+            max_retries of WriteBehindWriter
+        """
+        super().__init__(host, port, journal=journal)
+        self.socket = TCPSocket(host=host, port=port)
+
+        self.redis = redis or RedisRegistry.get()
+
+        self.last_seq = 0  # OrderHistory.SEQ_KEY after the last persisted message
+        self.save_lock = nullcontext()  # shared by the clients of a journal, see SessionPool
+        self.writer = None
+        if write_behind:
+            self.writer = WriteBehindWriter(
+                self.redis,
+                log=self._log_cache,
+                seq_key=self.SEQ_KEY,
+                stream=self.STREAM_KEY,
+                **writer_kwargs,
+            )
+
     def sendall(self, c_packet: bytes) -> bool:
         """ return True if succeed, False when failed """
+        if c_packet != self.RESET_PACKET:
+            return self._send_window([c_packet])[0]
 
-        self.socket.sendall(c_packet)  # send packet
+        self._send(c_packet)  # send packet
 
         s_packet = self.recv()
         if not s_packet:
@@ -42,61 +195,111 @@ class Client(LoggerMixin):
             return False
 
         s_msgs = self.msg_factory.create(s_packet)
-        order_no, response_code = self._inspect_s_msgs(s_msgs)
-        is_success = response_code == OrderReceivedMessage.SUCCESS
+        self._unacked.clear()  # 거래소 초기화, 이전 주문의 ack은 기다리지 않음
+        _, response_code = self._inspect_s_msgs(s_msgs) or (None, None)
+        return response_code
 
-        if c_packet == self.RESET_PACKET:
-            return response_code
+    def send_many(self, c_packets: List[bytes], window=100) -> List[bool]:
+        """ pipelined version of sendall for New/Cancel packets
 
-        # overwrite Order Message
-        c_msg = self.msg_factory.create(c_packet).pop()
+            writes up to `window` packets back-to-back before reading the responses.
+            the exchange acks in send order, so the n-th OrderReceivedMessage
+            belongs to the n-th unacked packet (see _match_responses).
+            returns is_success per packet, in the given order
+        """
+        results = []
+        for i in range(0, len(c_packets), window):
+            results.extend(self._send_window(c_packets[i : i + window]))
+        return results
 
-        setattr(c_msg, "response_code", response_code)
-        if response_code == "0":  # 성공한 주문만 order_no을 덮어씀
-            setattr(c_msg, "order_no", order_no)
+    def _send_window(self, c_packets: List[bytes]) -> List[bool]:
+        self._send(b"".join(c_packets))  # send packets back-to-back
+
+        s_packet = self.recv(expected=len(self._unacked) + len(c_packets))
+        s_msgs = self.msg_factory.create(s_packet) if s_packet else []
 
-        self.save_cache(c_msg)
-        self.save_cache(*s_msgs)
+        results, interactions = self._match_responses(c_packets, s_msgs)
+        if interactions:
+            self.save_cache(*chain(*interactions))  # one transaction per window
 
-        return is_success
+        return results
 
-    def recv(self, size=1024, timeout=0.3):
-        s_packets = []  # copy 최소화
+    def _send(self, data: bytes) -> None:
+        stime = time.perf_counter_ns()
+        self.socket.sendall(data)
+        self._sent_ns = time.perf_counter_ns()
+        SOCKET_SEND.record(self._sent_ns - stime)
+
+    def recv(self, size=1024, timeout=None, expected=1) -> str:
+        """ receive complete frames until `expected` OrderReceivedMessages arrive
+
+            returns as soon as the acks are in, after draining the frames
+            which have already arrived (e.g. execution reports).
+            bytes of a partial frame are kept in the buffer for the next call.
+            returns an empty str if nothing arrives within `timeout` (None: recv_timeout)
+        """
+        frames = []
+        n_received = 0
+        wait = self.recv_timeout if timeout is None else timeout
         while True:
-            try:
-                pk = self.socket.recv(size, timeout).decode()  # receive packet
-            except AttributeError:  # no data
+            pk = self.socket.recv(size, wait)
+            if not pk:  # timeout(None) or closed(b"")
                 break
-            s_packets.append(pk)
-        s_packet = "".join(s_packets)
+            self._record_first_byte()
+
+            new_frames = self._feed(pk)
+            n_received += sum(
+                1 for f in new_frames if f[0] == OrderReceivedMessage.MSG_TYPE
+            )
+            frames.extend(new_frames)
+
+            if n_received >= expected:
+                wait = 0  # ack 수신 완료, 이미 도착한 packet만 읽음
 
-        return s_packet
+        return "".join(frames)
 
     def save_cache(self, *msg: Message) -> None:
         """ Save on Redis with key <Class Name> + leave log 
             as json format
+
+            messages of one exchange interaction are pushed in a single
+            MULTI/EXEC, so readers never see a NewOrder without its ReceivedOrder
+            they are also appended to the STREAM_KEY event log, in arrival order
+            in write-behind mode, they are persisted later by the writer thread
         """
-        for m in msg:
-            setattr(m, "time", str(datetime.now()))  # time property 추가
+        stime = time.perf_counter_ns()
+        entries = self._cache_entries(msg)
+
+        with self.save_lock:  # journal과 Redis에 같은 순서로 기록
+            self._append_journal(msg)
 
-            cls_name = m.__class__.__name__
-            if cls_name == "NewOrderMessage":
-                key = cls_name.replace("Message", "")  # NewOrderMessage -> NewOrder
+            if self.writer is not None:
+                self.writer.put(entries)  # blocks while the queue is full
             else:
-                key = cls_name.replace("Message", "Order")  # xxxMessage -> xxxOrder
+                self.last_seq = self.redis.rpush_all(
+                    entries, seq_key=self.SEQ_KEY, stream=self.STREAM_KEY
+                )  # RAM
+                self._log_cache(entries)  # File
 
-            self.redis.rpush(key, m.json())  # RAM
-            self.logger.debug(f"{key}-{m.json()}")  # File
+        SAVE_CACHE.record(time.perf_counter_ns() - stime)
 
-    def _inspect_s_msgs(self, s_msgs: List[Message]):
-        """ 
-        Client가 packet을 전송할 때는, 주문번호와 응답코드가 비어있음
-        따라서, server에서 받은 packet에서 주문번호와 응답코드를 파싱함
+    def flush(self, timeout=None) -> int:
+        """ block until every saved message is persisted
+            return the last sequence, to be passed to OrderHistory.wait_for_seq
+            raise TimeoutError if the write-behind queue is not persisted within `timeout`,
+            RuntimeError if the writer dropped messages (Redis failed `max_retries` times)
         """
+        if self.writer is not None:
+            if not self.writer.flush(timeout):
+                raise TimeoutError(f"write-behind flush timed out after {timeout} seconds")
+            self.last_seq = self.writer.persisted_seq
+        if self.journal is not None:
+            self.journal.flush()
+        return self.last_seq
 
-        for m in s_msgs:
-            if isinstance(m, OrderReceivedMessage):
-                order_no = getattr(m, "order_no")
-                response_code = getattr(m, "response_code")
-
-                return order_no, response_code
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        if self.journal is not None:
+            self.journal.flush()  # the journal may be shared, closed by its owner
+        self.socket.close()
@@ -0,0 +1,320 @@
+from concurrent.futures import Future, wait
+import queue
+import threading
+import time
+from typing import Callable, Dict, Hashable, List
+
+from cache.redis import RedisRegistry
+from cache.writer import WriteBehindWriter
+from client import Client
+from logger import LoggerMixin
+from metrics import Histogram
+
+
+def ticker_key(c_packet: bytes) -> bytes:
+    """ default routing key, ticker of a New/Cancel packet (b"reset" is not routed) """
+    return c_packet[6:12]
+
+
+class _Session(LoggerMixin):
+    """ one Client (exchange connection) and its FIFO worker thread
+
+    packets are sent in submit order, queued packets are pipelined
+    with Client.send_many (up to `window` per round trip)
+    """
+
+    def __init__(self, idx: int, client: Client, window: int):
+        self.idx = idx
+        self.client = client
+        self.window = window
+
+        self.queue = queue.Queue()  # (packet, Future, submit time ns), None: stop
+        self.latency = Histogram(f"session_{idx}", "submit -> acks saved, per message")
+        self.messages = 0
+        self.successes = 0
+        self.busy = 0.0  # seconds spent in round trips
+        self.keys = set()  # routing keys of this session
+
+        self._pending = []  # item taken out of the queue, but not part of the last batch
+        self._thread = threading.Thread(target=self._run, name=f"session-{idx}", daemon=True)
+
+    def start(self) -> None:
+        self.client.socket.connect()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            packet, future, _ = batch[0]
+            if packet is None:  # flush marker, every packet before it is answered
+                future.set_result(True)
+            else:
+                self._send(batch)
+
+    def _next_batch(self):
+        """ block for the first packet, then take the New/Cancel packets already queued
+            reset packets and flush markers come alone, return None on the stop signal
+        """
+        item = self._pending.pop() if self._pending else self.queue.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        if not self._is_order(item):
+            return batch
+
+        while len(batch) < self.window:
+            try:
+                item = self._pending.pop() if self._pending else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None or not self._is_order(item):
+                self._pending.append(item)  # 다음 batch에서 처리
+                break
+            batch.append(item)
+        return batch
+
+    @staticmethod
+    def _is_order(item) -> bool:
+        return item is not None and item[0] is not None and item[0] != Client.RESET_PACKET
+
+    def _send(self, batch) -> None:
+        packets = [packet for packet, _, _ in batch]
+
+        stime = time.perf_counter_ns()
+        try:
+            if len(packets) == 1:
+                results = [self.client.sendall(packets[0])]
+            else:
+                results = self.client.send_many(packets, window=self.window)
+        except Exception as e:  # 연결 오류 등, 해당 batch의 future에 전달
+            self.logger.error(f"session {self.idx} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            elapsed = time.perf_counter_ns() - stime
+            self.busy += elapsed / 1e9
+            self.messages += len(packets)
+
+        answered = time.perf_counter_ns()  # 대기 시간 포함, packet마다 기록
+        for (_, future, submitted), result in zip(batch, results):
+            self.latency.record(answered - submitted)
+            self.successes += result is True
+            future.set_result(result)
+
+
+class SessionPool(LoggerMixin):
+    """ N exchange sessions (Client), orders routed to a session by key
+
+     - routing: `key(c_packet)` (default: ticker) is bound to a session on first sight,
+       round-robin, so every packet of a key goes through the same session
+     - ordering: one FIFO worker thread per session, packets of a key are sent
+       and answered in submit order, different keys proceed in parallel
+     - b"reset" is a barrier: every session is drained first, then it is sent
+       on the first session, packets submitted after it follow its ack
+     - persistence: every session saves to the same redis / journal, and with
+       write_behind to one shared WriteBehindWriter (OrderHistory.SEQ_KEY / STREAM_KEY
+       stay a single sequence), with a journal the sessions save under one lock,
+       so the journal has the same order as Redis
+     - stats(): per session throughput and latency
+
+    usage
+        with SessionPool(host, port, n_sessions=4) as pool:
+            futures = [pool.submit(p) for p in packets]  # Future[bool]
+            pool.flush()
+        print(pool.report())
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        n_sessions=4,
+        key: Callable[[bytes], Hashable] = ticker_key,
+        window=100,
+        redis=None,
+        journal=None,
+        write_behind=False,
+        **writer_kwargs,
+    ):
+        """
+        Parameters
+        ==========
+        key: callable
+            routing key of a client packet, e.g. lambda p: p[6:12] (ticker)
+        window: int
+            max packets pipelined per round trip of a session (Client.send_many)
+        redis, journal, write_behind, writer_kwargs:
+            see Client, shared by every session
+        """
+        self.host = host
+        self.port = port
+        self.key = key
+
+        self.redis = redis or RedisRegistry.get()
+        self.journal = journal
+
+        self.sessions = [
+            _Session(i, Client(host, port, redis=self.redis, journal=journal), window)
+            for i in range(n_sessions)
+        ]
+
+        if journal is not None:
+            save_lock = threading.Lock()
+            for s in self.sessions:
+                s.client.save_lock = save_lock
+
+        self.writer = None
+        if write_behind:
+            self.writer = WriteBehindWriter(
+                self.redis,
+                log=self.sessions[0].client._log_cache,
+                seq_key=Client.SEQ_KEY,
+                stream=Client.STREAM_KEY,
+                **writer_kwargs,
+            )
+            for s in self.sessions:
+                s.client.writer = self.writer
+
+        self._routes = {}  # type: Dict[Hashable, _Session]
+        self._route_lock = threading.Lock()
+        self._next_session = 0
+        self._started = None
+
+    def start(self) -> None:
+        for s in self.sessions:
+            s.start()
+        self._started = time.perf_counter()
+
+    def session(self, c_packet: bytes) -> _Session:
+        """ session of the routing key of c_packet """
+        key = self.key(c_packet)
+        session = self._routes.get(key)
+        if session is None:
+            with self._route_lock:
+                session = self._routes.get(key)
+                if session is None:
+                    session = self.sessions[self._next_session % len(self.sessions)]
+                    self._next_session += 1
+                    session.keys.add(key)
+                    self._routes[key] = session
+        return session
+
+    def submit(self, c_packet: bytes) -> Future:
+        """ enqueue a packet on its session, the future resolves to is_success
+            b"reset" blocks until the exchange has acked it, see _reset
+        """
+        if c_packet == Client.RESET_PACKET:
+            return self._reset()
+
+        future = Future()
+        self.session(c_packet).queue.put((c_packet, future, time.perf_counter_ns()))
+        return future
+
+    def _reset(self) -> Future:
+        """ barrier: wait until every session has answered its queued packets,
+            then send b"reset" on the first session and wait for its ack
+        """
+        wait(self._markers())
+
+        future = Future()
+        self.sessions[0].queue.put((Client.RESET_PACKET, future, time.perf_counter_ns()))
+        wait([future])
+        return future
+
+    def _markers(self) -> List[Future]:
+        """ one flush marker per session, resolved once the packets before it are answered """
+        markers = []
+        for s in self.sessions:
+            marker = Future()
+            s.queue.put((None, marker, None))
+            markers.append(marker)
+        return markers
+
+    def sendall(self, c_packet: bytes) -> bool:
+        return self.submit(c_packet).result()
+
+    def send_many(self, c_packets: List[bytes]) -> List[bool]:
+        """ is_success per packet, in the given order """
+        futures = [self.submit(p) for p in c_packets]
+        return [f.result() for f in futures]
+
+    def flush(self, timeout=None) -> int:
+        """ block until every submitted packet is answered and persisted
+            return the last sequence, to be passed to OrderHistory.wait_for_seq
+            raise TimeoutError if the sessions or the write-behind queue are not done within `timeout`
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        _, not_done = wait(self._markers(), timeout)
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} sessions not answered within {timeout} seconds")
+
+        last_seq = max(s.client.last_seq for s in self.sessions)
+        if self.writer is not None:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not self.writer.flush(remaining):
+                raise TimeoutError(f"write-behind flush timed out after {timeout} seconds")
+            last_seq = self.writer.persisted_seq
+        if self.journal is not None:
+            self.journal.flush()
+        return last_seq
+
+    def close(self) -> None:
+        for s in self.sessions:
+            s.stop()
+        for s in self.sessions:
+            s.client.close()  # shared writer is closed (once) by the first session
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    """ stats """
+
+    def stats(self) -> List[dict]:
+        """ per session: routing keys, messages, successes, msgs/s since start,
+            busy ratio and per message latency (seconds), from submit until its ack is saved,
+            so the time queued behind earlier packets of the session is included
+        """
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+
+        result = []
+        for s in self.sessions:
+            latency = s.latency.snapshot()
+            result.append(
+                {
+                    "session": s.idx,
+                    "keys": len(s.keys),
+                    "messages": s.messages,
+                    "successes": s.successes,
+                    "throughput": s.messages / elapsed if elapsed else 0.0,
+                    "busy": s.busy / elapsed if elapsed else 0.0,
+                    "p50": latency["p50"],
+                    "p99": latency["p99"],
+                }
+            )
+        return result
+
+    def report(self) -> str:
+        lines = [
+            f"{'session':>7} {'keys':>5} {'messages':>9} {'ok':>9} {'msgs/s':>9} "
+            f"{'busy':>6} {'p50 (us)':>9} {'p99 (us)':>9}"
+        ]
+        for r in self.stats():
+            lines.append(
+                f"{r['session']:>7} {r['keys']:>5} {r['messages']:>9,} {r['successes']:>9,} "
+                f"{r['throughput']:>9,.0f} {r['busy']:>6.0%} {r['p50'] * 1e6:>9,.0f} {r['p99'] * 1e6:>9,.0f}"
+            )
+        return "\n".join(lines)
@@ -8,3 +8,7 @@ class MessageTypeNotSupported(Exception):
 
 class PacketDecodeError(Exception):
     pass
+
+
+class AggregateMismatchError(Exception):
+    pass
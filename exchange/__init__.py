@@ -0,0 +1,3 @@
+from .matching import MatchingEngine
+from .simulator import ExchangeSimulator
+from .stub import StubExchangeServer
@@ -0,0 +1,179 @@
+from bisect import bisect_left, insort
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+
+""" Price-Time Matching Engine
+
+limit orders per ticker, two sides (bids / asks)
+ - better price first, then arrival order (FIFO per price level)
+ - a taker trades at the maker's price, the rest of it rests in the book
+   unless it is immediate-or-cancel (ioc)
+ - cancels reduce the remaining quantity (partial cancel), like CancelOrder
+
+the wire protocol has no side, see exchange.simulator for how client orders
+and the synthetic contra flow are mapped to sides
+"""
+
+BUY = "B"
+SELL = "S"
+
+Fill = namedtuple("Fill", ["taker", "maker", "qty", "price"])
+
+
+class EngineOrder:
+    __slots__ = ("order_id", "ticker", "side", "price", "qty", "remaining", "owner")
+
+    def __init__(self, order_id, ticker: str, side: str, price: int, qty: int, owner=None):
+        self.order_id = order_id
+        self.ticker = ticker
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.remaining = qty
+        self.owner = owner  # e.g. the session to notify of fills, None for contra flow
+
+    def __repr__(self):
+        return (
+            f"EngineOrder({self.order_id!r}, {self.ticker}, {self.side}, "
+            f"{self.price}, {self.remaining}/{self.qty})"
+        )
+
+
+class BookSide:
+    """ price levels of one side, best first
+
+    levels are kept by key = sign * price in a sorted list (ascending),
+    so the best bid (highest) and the best ask (lowest) are both at index 0
+    each level is a FIFO queue (insertion ordered dict, O(1) removal)
+    """
+
+    def __init__(self, side: str):
+        self.side = side
+        self.sign = -1 if side == BUY else 1
+
+        self._keys = []  # sorted
+        self._levels = {}  # {key: {order: None}}
+
+    def add(self, order: EngineOrder) -> None:
+        key = self.sign * order.price
+        level = self._levels.get(key)
+        if level is None:
+            level = self._levels[key] = {}
+            insort(self._keys, key)
+        level[order] = None
+
+    def remove(self, order: EngineOrder) -> None:
+        key = self.sign * order.price
+        level = self._levels.get(key)
+        if level is None or order not in level:
+            return
+
+        del level[order]
+        if not level:
+            del self._levels[key]
+            del self._keys[bisect_left(self._keys, key)]
+
+    def best_price(self) -> Optional[int]:
+        return self.sign * self._keys[0] if self._keys else None
+
+    def crosses(self, price: int) -> bool:
+        """ True if a taker of the other side at `price` trades with the best level """
+        return bool(self._keys) and self._keys[0] <= self.sign * price
+
+    def match(self, taker: EngineOrder) -> List[Fill]:
+        fills = []
+        while taker.remaining and self.crosses(taker.price):
+            key = self._keys[0]
+            level = self._levels[key]
+
+            maker = next(iter(level))
+            qty = min(taker.remaining, maker.remaining)
+            taker.remaining -= qty
+            maker.remaining -= qty
+            fills.append(Fill(taker, maker, qty, maker.price))
+
+            if not maker.remaining:
+                del level[maker]
+                if not level:
+                    del self._levels[key]
+                    del self._keys[0]
+        return fills
+
+    def depth(self, n=5) -> List[tuple]:
+        """ [(price, remaining quantity, number of orders)] of the best n levels """
+        return [
+            (self.sign * key, sum(o.remaining for o in self._levels[key]), len(self._levels[key]))
+            for key in self._keys[:n]
+        ]
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self._levels.values())
+
+
+class Book:
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.bids = BookSide(BUY)
+        self.asks = BookSide(SELL)
+
+    def side(self, side: str) -> BookSide:
+        return self.bids if side == BUY else self.asks
+
+    def opposite(self, side: str) -> BookSide:
+        return self.asks if side == BUY else self.bids
+
+
+class MatchingEngine:
+    """ {ticker: Book} and an index of the resting orders by order_id """
+
+    def __init__(self):
+        self.books = {}  # type: Dict[str, Book]
+        self._orders = {}  # type: Dict[object, EngineOrder], resting orders
+
+        self.n_orders = 0
+        self.n_fills = 0
+        self.filled_qty = 0
+
+    def book(self, ticker: str) -> Book:
+        book = self.books.get(ticker)
+        if book is None:
+            book = self.books[ticker] = Book(ticker)
+        return book
+
+    def submit(self, order: EngineOrder, ioc=False) -> List[Fill]:
+        """ match against the opposite side, then rest the remaining quantity (unless ioc) """
+        book = self.book(order.ticker)
+        fills = book.opposite(order.side).match(order)
+
+        for f in fills:
+            if not f.maker.remaining:
+                self._orders.pop(f.maker.order_id, None)
+
+        if order.remaining and not ioc:
+            book.side(order.side).add(order)
+            self._orders[order.order_id] = order
+
+        self.n_orders += 1
+        self.n_fills += len(fills)
+        self.filled_qty += sum(f.qty for f in fills)
+        return fills
+
+    def cancel(self, order_id, qty: int) -> bool:
+        """ cancel `qty` of a resting order, False if it is not resting or has less left """
+        order = self._orders.get(order_id)
+        if order is None or not 0 < qty <= order.remaining:
+            return False
+
+        order.remaining -= qty
+        if not order.remaining:
+            self.book(order.ticker).side(order.side).remove(order)
+            del self._orders[order_id]
+        return True
+
+    def get(self, order_id) -> Optional[EngineOrder]:
+        """ resting order, None once filled / cancelled """
+        return self._orders.get(order_id)
+
+    def reset(self) -> None:
+        self.__init__()
@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+import multiprocessing
+import random
+from typing import Dict, List
+
+from exceptions import MessageTypeNotSupported
+from logger import LoggerMixin
+from messages.messages import (
+    MessageFactory,
+    NewOrderMessage,
+    CancelOrderMessage,
+    OrderReceivedMessage,
+    OrderExecutedMessage,
+)
+from .matching import BUY, SELL, EngineOrder, Fill, MatchingEngine
+
+
+class _Session:
+    """ one client connection, responses are delivered after the simulated latency
+
+    delivery times never go backwards, so responses keep the send order
+    (Client matches the n-th ack to the n-th packet) even with jitter
+    """
+
+    def __init__(self, simulator: "ExchangeSimulator", writer):
+        self.simulator = simulator
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+
+        self._loop = asyncio.get_running_loop()
+        self._deliver_at = 0.0
+
+    def send(self, data: bytes) -> None:
+        delay = self.simulator.delay()
+        if not delay:
+            self._write(data)
+            return
+
+        deliver_at = max(self._loop.time() + delay, self._deliver_at)
+        self._deliver_at = deliver_at
+        self._loop.call_at(deliver_at, self._write, data)
+
+    def _write(self, data: bytes) -> None:
+        if not self.writer.is_closing():  # 세션 종료 후 도착한 체결은 버림
+            self.writer.write(data)
+
+
+class ExchangeSimulator(LoggerMixin):
+    """ local exchange with a price-time matching engine, for end-to-end load tests
+
+    speaks the same fixed-width protocol as the exchange (and StubExchangeServer)
+     - NewOrder: acked with the next order_no (exchange wide, 5 digits),
+       then rests in the book on `client_side` (the protocol has no side)
+       after a wrap, order_nos still resting are skipped, rejected ("1") if none is free
+     - CancelOrder: cancels qty of a resting order of the same session, acked with
+       its order_no, rejected ("1") if the order is not resting, has less left
+       or belongs to another session
+     - synthetic contra flow (the other side, immediate-or-cancel) fills resting
+       orders by price, then time, so fills may be partial and may go to older
+       orders of other sessions
+        - `fill_ratio` of the NewOrders meet a contra order at their price right away,
+          of 1..qty, the execution reports follow the ack
+        - every `contra_interval` seconds, a contra order hits the best level
+          of a random ticker (executions arriving between requests)
+     - b"reset" clears the books and the order_no, acked with order_no "00000"
+     - every response is delayed by `latency` + uniform(0, `jitter`) seconds
+
+    usage
+        simulator = ExchangeSimulator(latency=0.0002, fill_ratio=0.5)
+        port = await simulator.start()
+        ...
+        await simulator.stop()
+
+    or in another process: python -m exchange.simulator --port 12345
+    """
+
+    RESET_PACKET = b"reset"
+    MAX_ORDER_NO = 99999  # 5자리 주문번호
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        fill_ratio=0.5,
+        contra_interval=None,
+        client_side=BUY,
+        seed=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.fill_ratio = fill_ratio
+        self.contra_interval = contra_interval
+        self.client_side = client_side
+        self.contra_side = SELL if client_side == BUY else BUY
+
+        self.engine = MatchingEngine()
+        self.msg_factory = MessageFactory()
+        self.sessions = set()
+        self.stats = Counter()  # sessions, orders, cancels, rejects, executions, executed_qty
+
+        self._rnd = random.Random(seed)
+        self._order_no = 0
+        self._contra_id = 0
+        self._server = None
+        self._contra_task = None
+
+    async def start(self, host="127.0.0.1", port=0) -> int:
+        """ return the bound port """
+        self._server = await asyncio.start_server(self._handle, host, port)
+        if self.contra_interval:
+            self._contra_task = asyncio.create_task(self._contra_flow())
+
+        host, port = self._server.sockets[0].getsockname()[:2]
+        self.logger.info(f"listening on {host}:{port}")
+        return port
+
+    async def stop(self) -> None:
+        if self._contra_task is not None:
+            self._contra_task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def delay(self) -> float:
+        if self.jitter:
+            return self.latency + self._rnd.uniform(0, self.jitter)
+        return self.latency
+
+    async def _handle(self, reader, writer):
+        session = _Session(self, writer)
+        self.sessions.add(session)
+        self.stats["sessions"] += 1
+        self.logger.info(f"session opened {session.peer}, {len(self.sessions)} active")
+
+        buffer = bytearray()
+        try:
+            while True:
+                pk = await reader.read(65536)
+                if not pk:
+                    break
+                buffer += pk
+
+                out = defaultdict(bytearray)  # {session: responses}, one write per session
+                if buffer.startswith(self.RESET_PACKET):
+                    del buffer[: len(self.RESET_PACKET)]
+                    self.reset()
+                    out[session] += self._ack("00000", OrderReceivedMessage.SUCCESS)
+
+                frames, consumed = self.msg_factory.framer.scan(buffer)
+                frames = [self.msg_factory.framer.decode(f) for f in frames]
+                del buffer[:consumed]
+
+                for f in frames:
+                    self._on_message(session, self.msg_factory.create(f).pop(), out)
+
+                self._send(out)
+                await writer.drain()
+        except MessageTypeNotSupported as e:
+            self.logger.error(f"session {session.peer} closed, {e}")
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            self.logger.info(f"session closed {session.peer}, {len(self.sessions)} active")
+
+    def reset(self) -> None:
+        self.engine.reset()
+        self._order_no = 0
+
+    """ order handling """
+
+    def _on_message(self, session: _Session, c_msg, out: Dict[_Session, bytearray]) -> None:
+        if isinstance(c_msg, NewOrderMessage):
+            self._new_order(session, c_msg, out)
+        elif isinstance(c_msg, CancelOrderMessage):
+            self._cancel_order(session, c_msg, out)
+        # server side messages from a client are ignored
+
+    def _new_order(self, session, c_msg, out) -> None:
+        price, qty = _to_int(c_msg.price), _to_int(c_msg.qty)
+        if price <= 0 or qty <= 0:
+            self.stats["rejects"] += 1
+            out[session] += self._ack("00000", OrderReceivedMessage.FAIL)
+            return
+
+        order_no = self._next_order_no()
+        if order_no is None:  # 모든 주문번호가 미체결 주문에 사용 중
+            self.stats["rejects"] += 1
+            out[session] += self._ack("00000", OrderReceivedMessage.FAIL)
+            return
+
+        order = EngineOrder(order_no, c_msg.ticker, self.client_side, price, qty, owner=session)
+
+        self.stats["orders"] += 1
+        out[session] += self._ack(order_no, OrderReceivedMessage.SUCCESS)
+        self._report(self.engine.submit(order), out)
+
+        if self.fill_ratio and self._rnd.random() < self.fill_ratio:
+            self._contra(order.ticker, price, self._rnd.randint(1, qty), out)
+
+    def _next_order_no(self):
+        """ next order_no not resting in the engine, None if every one is """
+        for _ in range(self.MAX_ORDER_NO):
+            self._order_no = self._order_no % self.MAX_ORDER_NO + 1
+            order_no = str(self._order_no).zfill(5)
+            if self.engine.get(order_no) is None:
+                return order_no
+        return None
+
+    def _cancel_order(self, session, c_msg, out) -> None:
+        qty = _to_int(c_msg.qty)
+        order = self.engine.get(c_msg.order_no)
+        if order is not None and order.owner is session and self.engine.cancel(c_msg.order_no, qty):
+            self.stats["cancels"] += 1
+            out[session] += self._ack(c_msg.order_no, OrderReceivedMessage.SUCCESS)
+        else:
+            self.stats["rejects"] += 1
+            out[session] += self._ack(c_msg.order_no, OrderReceivedMessage.FAIL)
+
+    def _contra(self, ticker: str, price: int, qty: int, out) -> None:
+        self._contra_id += 1
+        order = EngineOrder(-self._contra_id, ticker, self.contra_side, price, qty)
+        self._report(self.engine.submit(order, ioc=True), out)
+
+    def _report(self, fills: List[Fill], out) -> None:
+        """ execution reports to the sessions of the client orders of the fills """
+        for f in fills:
+            for order in (f.taker, f.maker):
+                if order.owner is not None:
+                    out[order.owner] += self._execution(order.order_id, f.qty)
+                    self.stats["executions"] += 1
+                    self.stats["executed_qty"] += f.qty
+
+    async def _contra_flow(self) -> None:
+        while True:
+            await asyncio.sleep(self.contra_interval)
+
+            tickers = [
+                t
+                for t, b in self.engine.books.items()
+                if b.side(self.client_side).best_price() is not None
+            ]
+            if not tickers:
+                continue
+
+            ticker = self._rnd.choice(tickers)
+            side = self.engine.book(ticker).side(self.client_side)
+            price, level_qty, _ = side.depth(1)[0]
+
+            out = defaultdict(bytearray)
+            self._contra(ticker, price, self._rnd.randint(1, level_qty), out)
+            self._send(out)
+
+    def _send(self, out: Dict[_Session, bytearray]) -> None:
+        for session, data in out.items():
+            if data:
+                session.send(bytes(data))
+
+    def _ack(self, order_no: str, response_code: str) -> bytes:
+        return f"{OrderReceivedMessage.MSG_TYPE}{order_no}{response_code}".encode()
+
+    def _execution(self, order_no: str, qty: int) -> bytes:
+        return f"{OrderExecutedMessage.MSG_TYPE}{order_no}{str(qty).zfill(5)}".encode()
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _serve(ports, host, port, kwargs):
+    async def serve():
+        simulator = ExchangeSimulator(**kwargs)
+        ports.put(await simulator.start(host, port))
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def serve_in_process(host="127.0.0.1", port=0, **kwargs) -> int:
+    """ run an ExchangeSimulator in a daemon process (no GIL sharing with the clients)
+        return the bound port
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ports, host, port, kwargs), daemon=True)
+    process.start()
+    return ports.get()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local exchange simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform(0, jitter) seconds")
+    parser.add_argument("--fill-ratio", type=float, default=0.5)
+    parser.add_argument("--contra-interval", type=float, default=None, help="seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    simulator_kwargs = dict(
+        latency=args.latency,
+        jitter=args.jitter,
+        fill_ratio=args.fill_ratio,
+        contra_interval=args.contra_interval,
+        seed=args.seed,
+    )
+    _serve(multiprocessing.Queue(), args.host, args.port, simulator_kwargs)
@@ -0,0 +1,93 @@
+import asyncio
+
+from messages.messages import (
+    MessageFactory,
+    NewOrderMessage,
+    CancelOrderMessage,
+    OrderReceivedMessage,
+    OrderExecutedMessage,
+)
+
+
+class StubExchangeServer:
+    """ local asyncio stand-in for the exchange server, for tests
+
+    speaks the same fixed-width protocol as the exchange
+     - every NewOrder is accepted with the next order_no,
+       then `fill_qty` of it is executed right away (0: no execution)
+     - every CancelOrder is accepted, unless its order_no is in `reject_order_nos`
+     - b"reset" is acked with order_no "00000"
+
+    usage
+        server = StubExchangeServer()
+        port = await server.start()
+        ...
+        await server.stop()
+    """
+
+    RESET_PACKET = b"reset"
+
+    def __init__(self, fill_qty=0, reject_order_nos=()):
+        self.fill_qty = fill_qty
+        self.reject_order_nos = set(reject_order_nos)
+
+        self.received = []  # client packets, in arrival order
+        self._order_no = 0
+        self._server = None
+        self.msg_factory = MessageFactory()
+
+    async def start(self, host="127.0.0.1", port=0) -> int:
+        """ return the bound port """
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        buffer = bytearray()
+        try:
+            while True:
+                pk = await reader.read(1024)
+                if not pk:
+                    break
+                buffer += pk
+
+                if buffer.startswith(self.RESET_PACKET):
+                    del buffer[: len(self.RESET_PACKET)]
+                    self._order_no = 0
+                    writer.write(self._ack("00000", OrderReceivedMessage.SUCCESS))
+
+                frames, consumed = self.msg_factory.framer.scan(buffer)
+                frames = [self.msg_factory.framer.decode(f) for f in frames]
+                del buffer[:consumed]
+
+                for f in frames:
+                    self.received.append(f)
+                    writer.write(self._respond(self.msg_factory.create(f).pop()))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _respond(self, c_msg) -> bytes:
+        if isinstance(c_msg, NewOrderMessage):
+            self._order_no += 1
+            order_no = str(self._order_no).zfill(5)
+
+            response = self._ack(order_no, OrderReceivedMessage.SUCCESS)
+            if self.fill_qty:
+                qty = min(self.fill_qty, int(c_msg.qty))
+                response += self._execution(order_no, qty)
+            return response
+
+        elif isinstance(c_msg, CancelOrderMessage):
+            if c_msg.order_no in self.reject_order_nos:
+                return self._ack(c_msg.order_no, OrderReceivedMessage.FAIL)
+            return self._ack(c_msg.order_no, OrderReceivedMessage.SUCCESS)
+
+    def _ack(self, order_no: str, response_code: str) -> bytes:
+        return f"{OrderReceivedMessage.MSG_TYPE}{order_no}{response_code}".encode()
+
+    def _execution(self, order_no: str, qty: int) -> bytes:
+        return f"{OrderExecutedMessage.MSG_TYPE}{order_no}{str(qty).zfill(5)}".encode()
@@ -0,0 +1 @@
+from .journal import JournalWriter, JournalReader, JournalRecord, RECORD_SIZE
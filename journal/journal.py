@@ -0,0 +1,238 @@
+from bisect import bisect_right
+from collections import namedtuple
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, List, Tuple
+import zlib
+
+from logger import LoggerMixin
+from orders.orders import parse_time
+
+
+""" Binary Order Journal
+
+append-only, fixed-width records in segment files
+ - record: seq, monotonic ns, time, msg_type, order_no, ticker, price, qty, response_code, crc32
+ - segment: "<first seq>.journal", a new one every `segment_records` records
+ - sparse index: first seq of every segment (file names),
+   inside a segment the offset is (seq - first seq) * RECORD_SIZE
+ - a torn or corrupted tail (crash while writing) is ignored by the reader
+   and truncated by the next writer
+"""
+
+RECORD = struct.Struct("<QQd1s5s6sII1s")  # crc32 of these bytes follows
+CRC = struct.Struct("<I")
+RECORD_SIZE = RECORD.size + CRC.size
+_FULL_RECORD = struct.Struct(RECORD.format + "I")
+_DECODED = {}  # {bytes field: str or None}
+
+SUFFIX = ".journal"
+NONE = b" "  # field absent from the message (e.g. ticker of an OrderReceived)
+
+JournalRecord = namedtuple(
+    "JournalRecord",
+    ["seq", "mono_ns", "time", "msg_type", "order_no", "ticker", "price", "qty", "response_code"],
+)
+
+
+def to_kwargs(record: JournalRecord) -> dict:
+    """ OrderFactory.create kwargs of a record, absent fields are left out """
+    kwargs = {"msg_type": record.msg_type, "order_no": record.order_no, "time": record.time}
+    if record.msg_type in ("0", "1"):
+        kwargs.update(ticker=record.ticker, price=record.price, qty=record.qty)
+    elif record.msg_type == "3":
+        kwargs.update(qty=record.qty)
+
+    if record.response_code is not None:
+        kwargs["response_code"] = record.response_code
+    return kwargs
+
+
+def list_segments(path: str) -> List[int]:
+    """ sorted first seqs of the segments in `path` """
+    try:
+        names = os.listdir(path)
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[: -len(SUFFIX)]) for n in names if n.endswith(SUFFIX))
+
+
+def segment_path(path: str, first_seq: int) -> str:
+    return os.path.join(path, f"{first_seq:020d}{SUFFIX}")
+
+
+def decode(buffer, first_seq: int) -> Tuple[List[JournalRecord], int]:
+    """ records of a segment buffer, stops at the first torn / corrupted record
+        return (records, number of valid bytes)
+    """
+    records = []
+    n_valid = len(buffer) - len(buffer) % RECORD_SIZE
+    view = memoryview(buffer)
+    crc32, body_size = zlib.crc32, RECORD.size
+    strs = _DECODED  # tickers, msg_types, ... repeat, decode once
+
+    for i, fields in enumerate(_FULL_RECORD.iter_unpack(view[:n_valid])):
+        seq, mono_ns, t, msg_type, order_no, ticker, price, qty, code, crc = fields
+        offset = i * RECORD_SIZE
+        if crc32(view[offset : offset + body_size]) != crc or seq != first_seq + i:
+            return records, offset  # corrupted, or stale bytes of another record
+
+        for b in (msg_type, ticker, code):
+            if b not in strs:
+                strs[b] = None if b[:1] == NONE else sys.intern(b.decode())
+
+        records.append(
+            JournalRecord(
+                seq, mono_ns, t, strs[msg_type], order_no.decode(), strs[ticker], price, qty, strs[code]
+            )
+        )
+    return records, n_valid
+
+
+class JournalWriter(LoggerMixin):
+    """ appends messages of Client.save_cache, thread-safe
+
+    records are buffered by the file object, flush() (Client.flush) writes them
+    with fsync=True, flush() also waits for the disk
+    """
+
+    def __init__(self, path: str, segment_records=1 << 20, fsync=False):
+        self.path = path
+        self.segment_records = segment_records
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_seq = None  # first seq of the open segment
+
+        os.makedirs(path, exist_ok=True)
+        self.last_seq = self._recover()
+
+    def append(self, msgs: Iterable) -> int:
+        """ append messages (with the time set by Client._cache_entries), return the last seq """
+        with self._lock:
+            for m in msgs:
+                seq = self.last_seq + 1
+                if self._file is None or seq - self._segment_seq >= self.segment_records:
+                    self._open_segment(seq)
+
+                body = RECORD.pack(
+                    seq,
+                    time.monotonic_ns(),
+                    parse_time(getattr(m, "time", None)) or 0.0,
+                    m.msg_type.encode(),
+                    m.order_no.encode(),
+                    getattr(m, "ticker", "").encode() or NONE,
+                    int(getattr(m, "price", 0)),
+                    int(getattr(m, "qty", 0)),
+                    # OrderExecutedMessage.response_code는 class 속성이므로 저장하지 않음
+                    m.__dict__.get("response_code", " ").encode(),
+                )
+                self._file.write(body + CRC.pack(zlib.crc32(body)))
+                self.last_seq = seq
+            return self.last_seq
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open_segment(self, first_seq: int) -> None:
+        if self._file is not None:
+            self._file.close()
+
+        self._file = open(segment_path(self.path, first_seq), "ab")
+        self._segment_seq = first_seq
+
+    def _recover(self) -> int:
+        """ last valid seq, a torn tail of the last segment is truncated """
+        segments = list_segments(self.path)
+        if not segments:
+            return 0
+
+        first_seq = segments[-1]
+        with open(segment_path(self.path, first_seq), "r+b") as f:
+            records, n_valid = decode(f.read(), first_seq)
+            if n_valid != f.seek(0, os.SEEK_END):
+                self.logger.warning(f"journal segment {first_seq} truncated to {n_valid} bytes")
+                f.truncate(n_valid)
+
+        self._segment_seq = first_seq
+        self._file = open(segment_path(self.path, first_seq), "ab")
+        return records[-1].seq if records else first_seq - 1
+
+
+class JournalReader:
+    """ reads records from any seq, segments written later are picked up on read """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._segments = []  # sparse index, first seq per segment
+
+    def read(self, from_seq=1, max_records=None) -> List[JournalRecord]:
+        """ valid records from `from_seq`, in seq order """
+        records = []
+        for first_seq, offset in self._locate(from_seq):
+            if max_records is not None and len(records) >= max_records:
+                break
+
+            size = None
+            if max_records is not None:
+                size = (max_records - len(records)) * RECORD_SIZE
+
+            with open(segment_path(self.path, first_seq), "rb") as f:
+                f.seek(offset)
+                buffer = f.read() if size is None else f.read(size)
+
+            new_records, n_valid = decode(buffer, first_seq + offset // RECORD_SIZE)
+            records.extend(new_records)
+            if n_valid < len(buffer) - len(buffer) % RECORD_SIZE:
+                break  # corrupted, nothing after it is trusted
+        return records
+
+    def __iter__(self) -> Iterator[JournalRecord]:
+        return iter(self.read())
+
+    def last_seq(self) -> int:
+        """ seq of the last record read() yields, 0 if empty
+            only the last record is checked, the segment is decoded if it is torn / corrupted
+        """
+        self._segments = list_segments(self.path)
+        if not self._segments:
+            return 0
+
+        first_seq = self._segments[-1]
+        with open(segment_path(self.path, first_seq), "rb") as f:
+            n_records = f.seek(0, os.SEEK_END) // RECORD_SIZE
+            if not n_records:
+                return first_seq - 1
+
+            f.seek((n_records - 1) * RECORD_SIZE)
+            last, _ = decode(f.read(RECORD_SIZE), first_seq + n_records - 1)
+            if last:
+                return last[0].seq
+
+            f.seek(0)
+            records, _ = decode(f.read(), first_seq)  # 마지막 record가 손상됨
+        return records[-1].seq if records else first_seq - 1
+
+    def _locate(self, from_seq: int) -> Iterator[Tuple[int, int]]:
+        """ (first seq of the segment, byte offset) of from_seq, then the next segments """
+        self._segments = list_segments(self.path)
+
+        idx = max(bisect_right(self._segments, from_seq) - 1, 0)
+        for first_seq in self._segments[idx:]:
+            offset = max(from_seq - first_seq, 0) * RECORD_SIZE
+            yield first_seq, offset
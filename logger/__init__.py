@@ -1 +1 @@
-from .logger import LoggerBuidler, ClassLogger, LoggerMixin
+from .logger import LoggerBuidler, ClassLogger, LoggerMixin, QueuedLogging, set_level
@@ -1,24 +1,30 @@
 from abc import ABC, abstractproperty
+import atexit
 import logging
+from logging.handlers import QueueHandler
 import inspect
+import queue
+import threading
 import time
 
 
 class LoggerMixin(ABC):
     """ Mixin을 상속하여 logger를 쉽게 구현 가능 """
 
-    LOGGERS = {}
+    LOGGERS = {}  # {module: logger}
+    CLASS_LOGGERS = {}  # {class: logger}, resolved once per class
+    LEVEL = logging.DEBUG  # logger level, see set_level()
     FILE_LEVEL = logging.DEBUG
     STREAM_LEVEL = logging.DEBUG
 
     @property
     def module(self) -> str:
         # Mixin을 상속한 모듈명
-        return getattr(inspect.getmodule(self.__class__), "__name__")
+        return self.__class__.__module__
 
     @property
     def top_level_module(self) -> str:
-        return getattr(inspect.getmodule(self.__class__), "__name__").split(".")[0]
+        return self.module.split(".")[0]
 
     @property
     def log_path(self) -> str:
@@ -29,20 +35,161 @@ class LoggerMixin(ABC):
 
     @property
     def logger(self):
-        logger = LoggerMixin.LOGGERS.get(self.module)
-        if logger:
+        logger = LoggerMixin.CLASS_LOGGERS.get(self.__class__)  # hot path, one dict lookup
+        if logger is not None:
             return logger
 
-        # if logger doens't exist, build a new one
-        logger_builder = LoggerBuidler(self.module)
-        logger_builder.addFileHandler(path=self.log_path, level=self.FILE_LEVEL)
-        logger_builder.addStreamHandler(level=self.STREAM_LEVEL)
-        logger = logger_builder.build()
+        logger = LoggerMixin.LOGGERS.get(self.module)
+        if logger is None:
+            # if logger doens't exist, build a new one
+            logger_builder = LoggerBuidler(self.module)
+            logger_builder.addFileHandler(path=self.log_path, level=self.FILE_LEVEL)
+            logger_builder.addStreamHandler(level=self.STREAM_LEVEL)
+            logger = logger_builder.build()
+            logger.setLevel(LoggerMixin.LEVEL)
+
+            if QueuedLogging.listener is not None:
+                QueuedLogging.attach(logger)
+            LoggerMixin.LOGGERS[self.module] = logger
 
-        LoggerMixin.LOGGERS[self.module] = logger
+        LoggerMixin.CLASS_LOGGERS[self.__class__] = logger
         return logger
 
 
+def set_level(level) -> None:
+    """ level of every LoggerMixin logger (and of the ones built later)
+        records below it are dropped by logger.debug() etc. before any formatting
+    """
+    LoggerMixin.LEVEL = level
+    for logger in LoggerMixin.LOGGERS.values():
+        logger.setLevel(level)
+
+
+class _PassThroughQueueHandler(QueueHandler):
+    """ enqueue the record as is, formatting is left to the listener thread
+        (log arguments must not be mutated after the call)
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class _BatchListener(threading.Thread):
+    """ drains the queue in batches and hands every record to the handlers of its logger
+
+    stream/file handlers get one write + flush per batch, and a record is
+    formatted once per formatter (file and stderr handlers share one)
+    """
+
+    _STOP = object()
+
+    def __init__(self, queue, handlers, interval=0.05):
+        super().__init__(name="QueuedLogging", daemon=True)
+        self.queue = queue
+        self.handlers = handlers  # {logger name: [handlers]}
+        self.interval = interval  # 다음 batch까지 대기, wake-up(GIL 경합)을 줄임
+
+    def stop(self) -> None:
+        self.queue.put(self._STOP)
+        self.join()
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not self._STOP:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is self._STOP
+            self._write([r for r in batch if r is not self._STOP])
+            if stop:
+                return
+            time.sleep(self.interval)
+
+    def _write(self, records) -> None:
+        lines = {}  # {handler: [formatted record]}
+        formatted = {}  # {(formatter, record): str}
+        for record in records:
+            for handler in self.handlers.get(record.name, ()):
+                if record.levelno < handler.level:
+                    continue
+                elif not isinstance(handler, logging.StreamHandler):
+                    handler.handle(record)
+                    continue
+
+                key = (id(handler.formatter), id(record))
+                if key not in formatted:
+                    formatted[key] = handler.format(record)
+                lines.setdefault(handler, []).append(formatted[key])
+
+        for handler, texts in lines.items():
+            handler.acquire()
+            try:
+                if handler.stream is None:  # FileHandler(delay=True)
+                    handler.stream = handler._open()
+                handler.stream.write(handler.terminator.join(texts) + handler.terminator)
+                handler.flush()
+            except Exception:
+                handler.handleError(records[0])
+            finally:
+                handler.release()
+
+
+class QueuedLogging:
+    """ non-blocking logging mode
+
+    LoggerMixin loggers only put records on an in-memory queue,
+    one background listener thread formats them and writes the files / stderr
+    QueuedLogging.start() 이후 생성되는 logger도 자동으로 queue를 사용함
+    """
+
+    queue = None
+    listener = None
+    handlers = {}  # {logger name: [handlers moved behind the queue]}
+
+    @classmethod
+    def start(cls, interval=0.05) -> None:
+        """ interval: seconds the listener waits between two batches """
+        if cls.listener is not None:
+            return
+
+        cls.queue = queue.SimpleQueue()
+        cls.listener = _BatchListener(cls.queue, cls.handlers, interval)
+        cls.listener.start()
+        for logger in LoggerMixin.LOGGERS.values():
+            cls.attach(logger)
+
+        atexit.register(cls.stop)
+
+    @classmethod
+    def stop(cls) -> None:
+        """ write the queued records and give the handlers back to their loggers """
+        if cls.listener is None:
+            return
+
+        cls.listener.stop()  # writes the queued records first
+        for logger in LoggerMixin.LOGGERS.values():
+            for handler in list(logger.handlers):
+                if isinstance(handler, _PassThroughQueueHandler):
+                    logger.removeHandler(handler)
+            for handler in cls.handlers.pop(logger.name, ()):
+                logger.addHandler(handler)
+
+        cls.queue = cls.listener = None
+        atexit.unregister(cls.stop)
+
+    @classmethod
+    def attach(cls, logger: logging.Logger) -> None:
+        handlers = cls.handlers.setdefault(logger.name, [])
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handlers.append(handler)
+
+        logger.addHandler(_PassThroughQueueHandler(cls.queue))
+
+
 class LoggerBuidler:
     _logger = None
     _fileHandler = None
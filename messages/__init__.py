@@ -5,5 +5,6 @@ from .messages import (
     OrderReceivedMessage,
     OrderExecutedMessage,
     MessageFactory,
+    PacketFramer,
 )
 
@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod, abstractproperty
-from collections import deque
 import json
+import time
 from typing import Tuple, Dict, List
 
 from exceptions import MessageTypeNotSupported, PacketDecodeError
+import metrics
+
+PARSE = metrics.histogram("message_parse", "MessageFactory.create, packet -> messages")
 
 
 """ Message Class 
@@ -120,6 +123,78 @@ class OrderExecutedMessage(Message):
         }
 
 
+""" Framer """
+
+
+class PacketFramer:
+    """ split stacked packets into frames by offset, using the fixed SIZE of each message class
+
+    works on str, bytes, bytearray and memoryview
+    str / bytes are sliced once per frame (not per letter),
+    bytearray / memoryview are sliced through a memoryview, so frames are zero-copy views
+    """
+
+    def __init__(self, type_to_cls: Dict[str, type]):
+        # str[i] -> "0", bytes[i] -> 48 이므로 두 key를 모두 등록
+        self.sizes = {}
+        for msg_type, msg_cls in type_to_cls.items():
+            self.sizes[msg_type] = msg_cls.SIZE
+            self.sizes[ord(msg_type)] = msg_cls.SIZE
+
+    def split(self, packet) -> List:
+        """ return every frame, raise PacketDecodeError if the last frame is incomplete """
+        frames, consumed = self.scan(packet)
+        if consumed != len(packet):
+            raise PacketDecodeError(
+                f"incomplete frame: {len(packet) - consumed} trailing bytes"
+            )
+        return frames
+
+    def scan(self, packet) -> Tuple[List, int]:
+        """ return (complete frames, number of consumed bytes)
+            bytes of a trailing partial frame are not consumed
+        """
+        if not isinstance(packet, (str, bytes)):
+            packet = memoryview(packet)
+
+        sizes = self.sizes
+        frames = []
+        offset, end = 0, len(packet)
+        while offset < end:
+            size = sizes.get(packet[offset])
+            if size is None:
+                msg_type = packet[offset : offset + 1]
+                if isinstance(packet, memoryview):
+                    msg_type = bytes(msg_type)
+                    self._release(frames, packet)  # caller가 buffer를 비울 수 있도록 view 해제
+                if not isinstance(msg_type, str):
+                    msg_type = msg_type.decode(errors="backslashreplace")  # b"9" -> "9"
+                raise MessageTypeNotSupported(f"MSG TYPE {msg_type} is not supported")
+
+            if offset + size > end:  # partial frame
+                break
+
+            frames.append(packet[offset : offset + size])
+            offset += size
+
+        return frames, offset
+
+    @staticmethod
+    def _release(frames, view) -> None:
+        """ release the memoryviews of scan, the exported buffer can be resized again """
+        for f in frames:
+            f.release()
+        view.release()
+
+    @staticmethod
+    def decode(frame) -> str:
+        if isinstance(frame, str):
+            return frame
+        elif isinstance(frame, bytes):
+            return frame.decode()
+        return str(frame, "utf-8")  # memoryview -> str, one copy per frame
+
+
 """ Factory """
 
 
@@ -133,12 +208,15 @@ class MessageFactory:
 
     CLS_TO_TYPE = {v: k for k, v in TYPE_TO_CLS.items()}
 
-    def create(self, packet: str) -> List[Message]:
-        if isinstance(packet, bytes):
-            packet = packet.decode()
+    def __init__(self):
+        self.framer = PacketFramer(self.TYPE_TO_CLS)
 
-        packets = self.split_packet(packet)
-        return [self._create(p) for p in packets]
+    def create(self, packet: str or bytes) -> List[Message]:
+        stime = time.perf_counter_ns()
+        frames = self.framer.split(packet)
+        msgs = [self._create(self.framer.decode(f)) for f in frames]
+        PARSE.record(time.perf_counter_ns() - stime)
+        return msgs
 
     def _create(self, packet: str) -> Message:
         msg_cls = self.get_msg_cls_from_packet(packet)
@@ -147,28 +225,9 @@ class MessageFactory:
 
         return msg_cls(packet)
 
-    def split_packet(self, packet: str) -> List[str]:
+    def split_packet(self, packet: str or bytes) -> List[str]:
         """ split stacked packets to each packets """
-        result = []
-
-        letters = list(packet)
-        letter_queue = deque(letters)  # letters -> List[str]
-
-        while len(letter_queue):
-            msg_type = letter_queue[0]
-            msg_cls = MessageFactory.get_msg_cls_from_msg_type(msg_type)
-            if msg_cls is None:
-                print(letter_queue)
-                raise MessageTypeNotSupported(f"MSG TYPE {msg_type} is not supported")
-
-            buffer = []
-            for _ in range(msg_cls.SIZE):
-                buffer.append(letter_queue.popleft())
-            buffer = "".join(buffer)  # str copy 최소화
-
-            result.append(buffer)
-
-        return result
+        return [self.framer.decode(f) for f in self.framer.split(packet)]
 
     @classmethod
     def get_msg_cls_from_packet(cls, packet: str):
@@ -0,0 +1,10 @@
+from .metrics import (
+    Histogram,
+    Registry,
+    REGISTRY,
+    MetricsServer,
+    histogram,
+    snapshot,
+    serve,
+    timed,
+)
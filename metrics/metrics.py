@@ -0,0 +1,202 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from typing import Dict
+
+
+""" Latency Metrics
+
+cheap enough to stay on in production
+ - Histogram.record() is a bit_length + one list increment, no lock and no allocation
+   (concurrent records may rarely lose an increment, which is fine for latencies)
+ - log-linear buckets: SUB_BUCKETS per power of two, percentiles are the bucket's
+   upper bound (relative error <= 1 / SUB_BUCKETS)
+
+usage
+    SEND = metrics.histogram("client_socket_send")
+    stime = time.perf_counter_ns()
+    ...
+    SEND.record(time.perf_counter_ns() - stime)
+
+    metrics.snapshot()  # {name: {"count", "mean", "p50", "p99", "max"}} in seconds
+    metrics.serve(9108)  # optional, text exposition on http://127.0.0.1:9108/metrics
+"""
+
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_BITS = 64  # ns, ~584 years
+
+
+class Histogram:
+    """ durations in ns """
+
+    def __init__(self, name: str, description=""):
+        self.name = name
+        self.description = description
+        self.enabled = True
+        self.reset()
+
+    def reset(self) -> None:
+        self.counts = [0] * (MAX_BITS * SUB_BUCKETS)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        if not self.enabled:
+            return
+
+        if value < SUB_BUCKETS:
+            idx = max(value, 0)
+        else:  # top SUB_BITS + 1 bits of the value
+            shift = value.bit_length() - SUB_BITS - 1
+            idx = (shift + 1) * SUB_BUCKETS + ((value >> shift) - SUB_BUCKETS)
+        self.counts[idx] += 1
+
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @staticmethod
+    def upper_bound(idx: int) -> int:
+        if idx < SUB_BUCKETS:
+            return idx
+        shift = idx // SUB_BUCKETS - 1
+        return ((idx % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+    def percentile(self, q: float) -> int:
+        """ q in [0, 100], 0 if nothing is recorded """
+        if not self.count:
+            return 0
+
+        rank = q / 100 * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.upper_bound(idx), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        """ count and seconds """
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count / 1e9 if self.count else 0.0,
+            "p50": self.percentile(50) / 1e9,
+            "p99": self.percentile(99) / 1e9,
+            "max": self.max / 1e9,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}  # type: Dict[str, Histogram]
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, description="") -> Histogram:
+        """ get or create """
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(name, description))
+        return histogram
+
+    def __iter__(self):
+        return iter(list(self._histograms.values()))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {h.name: h.snapshot() for h in self}
+
+    def reset(self) -> None:
+        for h in self:
+            h.reset()
+
+    def enable(self, enabled=True) -> None:
+        for h in self:
+            h.enabled = enabled
+
+    def render(self) -> str:
+        """ text exposition format (summary per histogram, seconds) """
+        lines = []
+        for h in self:
+            name = f"{h.name}_seconds"
+            snapshot = h.snapshot()
+            if h.description:
+                lines.append(f"# HELP {name} {h.description}")
+            lines.append(f"# TYPE {name} summary")
+            lines.append(f'{name}{{quantile="0.5"}} {snapshot["p50"]:.9f}')
+            lines.append(f'{name}{{quantile="0.99"}} {snapshot["p99"]:.9f}')
+            lines.append(f'{name}{{quantile="1"}} {snapshot["max"]:.9f}')
+            lines.append(f"{name}_sum {h.sum / 1e9:.9f}")
+            lines.append(f"{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def histogram(name: str, description="") -> Histogram:
+    return REGISTRY.histogram(name, description)
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    return REGISTRY.snapshot()
+
+
+class timed:
+    """ context manager for code which is not on the hot path
+
+        with timed(histogram):
+            ...
+    """
+
+    __slots__ = ("histogram", "stime")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.stime = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.record(time.perf_counter_ns() - self.stime)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # no stderr line per scrape
+        pass
+
+
+class MetricsServer:
+    """ optional local endpoint, GET /metrics on a daemon thread """
+
+    def __init__(self, port=9108, host="127.0.0.1", registry=REGISTRY):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def serve(port=9108, host="127.0.0.1") -> MetricsServer:
+    return MetricsServer(port, host)
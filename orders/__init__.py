@@ -5,3 +5,5 @@ from .orders import (
     ExecutedOrder,
     OrderFactory,
 )
+from .book import OrderBook, OrderBooks
+from .columnar import ColumnarOrderStore
@@ -0,0 +1,142 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterator, List, Tuple
+
+from .orders import NewOrder
+
+
+class OrderBook:
+    """ price-time priority book of the open orders of one ticker
+
+    price levels are kept in a sorted list (ascending),
+    each level is a FIFO queue (insertion ordered dict, O(1) removal)
+    iteration, best price and depth snapshots need no sorting
+
+    open (unexecuted) quantity is kept as running totals,
+    for the whole book (qty) and per price level (level_qty)
+    """
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.qty = 0  # open quantity of the book
+
+        self._prices = []  # sorted
+        self._levels = {}  # {price: {order: None}}
+        self._level_qty = {}  # {price: open quantity}
+
+    def add(self, order: NewOrder) -> None:
+        price = order.price
+        level = self._levels.get(price)
+        if level is None:
+            level = self._levels[price] = {}
+            self._level_qty[price] = 0
+            insort(self._prices, price)
+
+        level[order] = None
+        self._add_qty(price, order.unex_qty)
+
+    def remove(self, order: NewOrder) -> None:
+        price = order.price
+        level = self._levels.get(price)
+        if level is None or order not in level:
+            return
+
+        del level[order]
+        self._add_qty(price, -order.unex_qty)
+
+        if not level:
+            del self._levels[price]
+            del self._level_qty[price]
+            del self._prices[bisect_left(self._prices, price)]
+
+    def reduce(self, order: NewOrder, old_qty: int) -> None:
+        """ follow an unex_qty change (execution / cancel) of an order in the book
+            the order leaves the book once nothing is left
+        """
+        if order not in self:
+            return
+
+        self._add_qty(order.price, order.unex_qty - old_qty)
+        if order.unex_qty <= 0:
+            self.remove(order)
+
+    def level_qty(self, price) -> int:
+        return self._level_qty.get(price, 0)
+
+    def _add_qty(self, price, qty: int) -> None:
+        self._level_qty[price] += qty
+        self.qty += qty
+
+    def __contains__(self, order) -> bool:
+        level = self._levels.get(order.price)
+        return level is not None and order in level
+
+    def __iter__(self) -> Iterator[NewOrder]:
+        """ orders by price, then by arrival """
+        for price in self._prices:
+            yield from self._levels[price]
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self._levels.values())
+
+    @property
+    def prices(self) -> List:
+        return list(self._prices)
+
+    def best_price(self):
+        """ first price level, None if the book is empty """
+        return self._prices[0] if self._prices else None
+
+    def level(self, price) -> List[NewOrder]:
+        """ orders at `price`, by arrival """
+        return list(self._levels.get(price, ()))
+
+    def depth(self, n=5) -> List[Tuple]:
+        """ [(price, unex_qty, number of orders)] of the first n price levels """
+        result = []
+        for price in self._prices[:n]:
+            result.append((price, self._level_qty[price], len(self._levels[price])))
+        return result
+
+
+class OrderBooks:
+    """ {ticker: OrderBook}, fed by OrderHisotryEnhanced on ingest """
+
+    def __init__(self):
+        self._books = {}  # type: Dict[str, OrderBook]
+
+    def get(self, ticker: str) -> OrderBook:
+        """ book of `ticker`, an empty one (not stored) for an unknown ticker """
+        book = self._books.get(ticker)
+        return OrderBook(ticker) if book is None else book
+
+    def add(self, order: NewOrder) -> None:
+        book = self._books.get(order.ticker)
+        if book is None:  # book은 주문이 들어올 때만 생성
+            book = self._books[order.ticker] = OrderBook(order.ticker)
+        book.add(order)
+
+    def remove(self, order: NewOrder) -> None:
+        book = self._books.get(order.ticker)
+        if book is not None:
+            book.remove(order)
+
+    def reduce(self, order: NewOrder, old_qty) -> None:
+        book = self._books.get(order.ticker)
+        if book is not None:
+            book.reduce(order, old_qty)
+
+    def qty(self, ticker: str) -> int:
+        """ open quantity of `ticker`, O(1) """
+        book = self._books.get(ticker)
+        return 0 if book is None else book.qty
+
+    def level_qty(self, ticker: str, price) -> int:
+        """ open quantity of `ticker` at `price`, O(1) """
+        book = self._books.get(ticker)
+        return 0 if book is None else book.level_qty(price)
+
+    def __iter__(self):
+        return iter(self._books.values())
+
+    def __contains__(self, ticker) -> bool:
+        return ticker in self._books
@@ -0,0 +1,243 @@
+from typing import Dict, Iterable, List, Tuple
+
+try:  # optional, pip install numpy
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .orders import Order, NewOrder, ExecutedOrder, normalize_value
+
+
+""" Columnar Order Store
+
+bulk analytics (e.g. open quantity by ticker over millions of orders) without
+iterating Python objects
+ - append-only NumPy arrays per field, capacity doubles on demand
+ - tickers are dictionary encoded (int32 code, see ColumnarOrderStore.tickers)
+ - msg_type, order_no, response_code are stored as int ("00001" -> 1)
+ - unex_qty is the only column updated in place (체결/취소)
+"""
+
+
+class ColumnTable:
+    """ columns of the same length, rows are appended only """
+
+    def __init__(self, dtypes: Dict[str, str], capacity=1024):
+        self.dtypes = dtypes
+        self._columns = {k: np.empty(capacity, dtype=t) for k, t in dtypes.items()}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, name) -> "np.ndarray":
+        """ view of the filled part of a column, no copy """
+        return self._columns[name][: self._size]
+
+    def append(self, rows: Dict[str, List]) -> None:
+        n = len(next(iter(rows.values())))
+        self._reserve(self._size + n)
+
+        for k, values in rows.items():
+            self._columns[k][self._size : self._size + n] = values
+        self._size += n
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(next(iter(self._columns.values())))
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+        for k, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: self._size] = column[: self._size]
+            self._columns[k] = grown
+
+
+class ColumnarOrderStore:
+    """ New/Cancel orders (orders table) and executions (fills table)
+
+    fills are joined to the successful NewOrder with the same order_no,
+    an execution arriving before its NewOrder is joined when the NewOrder is appended
+    """
+
+    ORDER_COLUMNS = {
+        "msg_type": "int8",
+        "order_no": "int32",
+        "ticker": "int32",  # code of self.tickers
+        "price": "int64",
+        "qty": "int64",
+        "unex_qty": "int64",
+        "response_code": "int8",
+        "time": "float64",
+    }
+    FILL_COLUMNS = {
+        "order_no": "int32",
+        "row": "int64",  # row of the NewOrder in the orders table, -1 if unknown yet
+        "qty": "int64",
+        "time": "float64",
+    }
+    INT_CODED = ("msg_type", "order_no", "response_code")
+
+    def __init__(self, capacity=1024):
+        if np is None:
+            raise ImportError("ColumnarOrderStore requires numpy, pip install numpy")
+
+        self.orders = ColumnTable(self.ORDER_COLUMNS, capacity)
+        self.fills = ColumnTable(self.FILL_COLUMNS, capacity)
+
+        self.tickers = []  # code -> ticker
+        self._ticker_codes = {}  # ticker -> code
+
+        self._objects = []  # row -> Order
+        self._rows = {}  # {Order: row}
+        self._row_by_order_no = {}  # {order_no: row of the successful NewOrder}
+        self._pending_fills = {}  # {order_no: [fill row]} arrived before the NewOrder
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    """ ingest """
+
+    def append(self, orders: Iterable[Order]) -> None:
+        rows = {k: [] for k in self.ORDER_COLUMNS}
+        fills = {k: [] for k in self.FILL_COLUMNS}
+        new_rows = []
+        joined = []  # (fill row, order row) of pending fills
+
+        for o in orders:
+            if isinstance(o, NewOrder):  # NewOrder, CancelOrder
+                row = len(self._objects) + len(new_rows)
+                new_rows.append(o)
+
+                rows["msg_type"].append(int(o.msg_type))
+                rows["order_no"].append(int(o.order_no))
+                rows["ticker"].append(self.encode_ticker(o.ticker))
+                rows["price"].append(o.price)
+                rows["qty"].append(o.qty)
+                rows["unex_qty"].append(o.unex_qty)
+                rows["response_code"].append(int(o.response_code))
+                rows["time"].append(o.time or 0.0)
+
+                if o.msg_type == NewOrder.MSG_TYPE and o.response_code == "0":
+                    self._row_by_order_no[o.order_no] = row
+                    for fill_row in self._pending_fills.pop(o.order_no, ()):
+                        joined.append((fill_row, row))
+
+            elif isinstance(o, ExecutedOrder):
+                row = self._row_by_order_no.get(o.order_no, -1)
+                if row < 0:  # NewOrder가 아직 로드되지 않음
+                    fill_row = len(self.fills) + len(fills["row"])
+                    self._pending_fills.setdefault(o.order_no, []).append(fill_row)
+
+                fills["order_no"].append(int(o.order_no))
+                fills["row"].append(row)
+                fills["qty"].append(o.qty)
+                fills["time"].append(o.time or 0.0)
+
+        if new_rows:
+            for o in new_rows:
+                self._rows[o] = len(self._objects)
+                self._objects.append(o)
+            self.orders.append(rows)
+
+        if fills["row"]:
+            self.fills.append(fills)
+
+        for fill_row, row in joined:
+            self.fills["row"][fill_row] = row
+
+    def set_unex_qty(self, order: NewOrder) -> None:
+        row = self._rows.get(order)
+        if row is not None:
+            self.orders["unex_qty"][row] = order.unex_qty
+
+    """ encoding """
+
+    def encode_ticker(self, ticker: str) -> int:
+        code = self._ticker_codes.get(ticker)
+        if code is None:
+            code = self._ticker_codes[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return code
+
+    def encode(self, key, value):
+        """ query value -> stored value, None if the ticker is unknown """
+        value = normalize_value(key, value)
+        if key == "ticker":
+            return self._ticker_codes.get(value)
+        elif key in self.INT_CODED:
+            return int(value)
+        return value
+
+    def decode(self, key, value):
+        if key == "ticker":
+            return self.tickers[value]
+        elif key == "order_no":
+            return str(value).zfill(5)
+        elif key in ("msg_type", "response_code"):
+            return str(value)
+        return value.item() if hasattr(value, "item") else value
+
+    """ vectorized queries """
+
+    def mask(self, exclude=None, **conditions) -> "np.ndarray":
+        """ boolean row mask, key == value for conditions and key != value for exclude """
+        result = np.ones(len(self.orders), dtype=bool)
+        for key, value in conditions.items():
+            value = self.encode(key, value)
+            if value is None:
+                return np.zeros(len(self.orders), dtype=bool)
+            result &= self.orders[key] == value
+
+        for key, value in (exclude or {}).items():
+            value = self.encode(key, value)
+            if value is not None:
+                result &= self.orders[key] != value
+        return result
+
+    def select(self, mask=None, rows=None) -> List[Order]:
+        """ Order objects of a mask or of row indices (in that order) """
+        if rows is None:
+            rows = np.flatnonzero(mask)
+        objects = self._objects
+        return [objects[i] for i in rows.tolist()]
+
+    def sum(self, column: str, mask=None) -> int:
+        values = self.orders[column]
+        return int(values.sum() if mask is None else values[mask].sum())
+
+    def groupby_sum(self, by: str, column: str, mask=None) -> Dict:
+        """ {value of `by`: sum of `column`} over the rows of mask """
+        keys, values = self.orders[by], self.orders[column]
+        if mask is not None:
+            keys, values = keys[mask], values[mask]
+        return self._groupby_sum(by, keys, values)
+
+    def sort(self, by: Tuple[str, ...], mask=None) -> "np.ndarray":
+        """ row indices sorted by the columns of `by`, ties keep the arrival order """
+        rows = np.arange(len(self.orders)) if mask is None else np.flatnonzero(mask)
+        keys = [self.orders[k][rows] for k in reversed(by)]  # lexsort: last key is primary
+        return rows[np.lexsort(keys)] if keys else rows
+
+    def fills_by(self, by: str, **conditions) -> Dict:
+        """ executed quantity grouped by a column of the filled NewOrder,
+            e.g. fills_by("price", ticker="000660")
+        """
+        rows, qty = self.fills["row"], self.fills["qty"]
+        joined = rows >= 0
+        rows, qty = rows[joined], qty[joined]
+
+        if conditions:
+            keep = self.mask(**conditions)[rows]
+            rows, qty = rows[keep], qty[keep]
+        return self._groupby_sum(by, self.orders[by][rows], qty)
+
+    def _groupby_sum(self, by, keys, values) -> Dict:
+        if not len(keys):
+            return {}
+
+        uniques, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=values, minlength=len(uniques))
+        return {self.decode(by, k): int(s) for k, s in zip(uniques, sums)}
@@ -1,14 +1,23 @@
 from abc import ABC, abstractmethod
 from collections import defaultdict
-from itertools import chain
+from contextlib import contextmanager
+import gc
 import json
+import mmap
 import os
+import pickle
 import re
+import time
 from typing import List
 import warnings
 
-from cache.redis import Redis
+from cache.redis import RedisRegistry
+from exceptions import AggregateMismatchError
+from journal import JournalReader
+from journal.journal import to_kwargs
 from logger import LoggerMixin
+import metrics
+from .book import OrderBook, OrderBooks
 from .orders import (
     Order,
     NewOrder,
@@ -16,6 +25,7 @@ from .orders import (
     ReceivedOrder,
     ExecutedOrder,
     OrderFactory,
+    normalize_value,
 )
 
 """
@@ -29,6 +39,27 @@ class Singleton(object):
 """
 
 
+@contextmanager
+def paused_gc():
+    """ (un)pickling millions of orders triggers the cyclic gc over and over """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _stream_id(entry_id: str):
+    """ "<ms>-<seq>" -> (ms, seq), comparable in stream order """
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+UPDATE = metrics.histogram("history_update", "OrderHistory.update, change check + ingest")
+
+
 class History:
     history = []
 
@@ -49,7 +80,42 @@ class History:
 
 
 class OrderHistory(History, LoggerMixin):
-    def __init__(self, source="ram", *args, **kwargs):
+    SEQ_KEY = "OrderSeq"  # number of persisted messages, INCRBY'd by Client.save_cache
+    STREAM_KEY = "OrderEvents"  # event log appended by Client.save_cache
+
+    # "[client:111][DEBUG][...] NewOrder-{json}", see Client._log_cache
+    ORDER_LINE = re.compile(r"Order-(\{.*\})")
+    MMAP_MIN_SIZE = 1 << 20  # appended bytes read through mmap from this size
+
+    SNAPSHOT_VERSION = 1
+    # configuration and handles, not part of the materialized state
+    # subclasses extend it with their own, e.g. OrderHistory.SNAPSHOT_EXCLUDE + ("attr",)
+    SNAPSHOT_EXCLUDE = (
+        "source",
+        "block",
+        "poll_interval",
+        "redis",
+        "factory",
+        "snapshot_path",
+        "snapshot_interval",
+        "_next_poll",
+        "_next_snapshot",
+        "_warm_start",
+        "_disk_file",
+        "_journal_reader",
+    )
+
+    def __init__(
+        self,
+        source="ram",
+        redis=None,
+        block=None,
+        poll_interval=0,
+        snapshot_path=None,
+        snapshot_interval=None,
+        *args,
+        **kwargs
+    ):
         super().__init__(*args, **kwargs)
         """
         Parameters
@@ -57,19 +123,65 @@ class OrderHistory(History, LoggerMixin):
         source: str
             data source, 
             if "ram"  : read from Redis 
+            elif "stream" : read from the Redis Stream event log (STREAM_KEY),
+                trimmed to about cache.redis.Redis.STREAM_MAXLEN events
             elif "disk" : read from log file
+            elif "journal" : read from the binary journal (journal_path)
+        redis: cache.redis.Redis
+            default: shared wrapper of RedisRegistry
+        block: int
+            "stream" only, milliseconds to wait for new events on update
+            None: don't wait
+        poll_interval: float
+            seconds between two change checks of the source,
+            update() is a no-op in between (0: check on every update)
+        snapshot_path: str
+            if the file exists, the first update() loads it (warm start)
+            and replays only the events after its read cursor
+        snapshot_interval: float
+            seconds between two snapshots to snapshot_path (None: no periodic snapshot)
         """
 
         self.source = source.lower()
 
         self._history = []  # {ClassName: [OrderClass]}
-        self._last_modified = None
+        self._new_orders_by_no = {}  # {order_no: successful NewOrder}
+        self._pending_fills = defaultdict(int)  # {order_no: qty} filled before its NewOrder
+        self._last_modified = None  # (inode, size, mtime) of the log file for DISK
+        self._last_seq = 0  # SEQ_KEY at the last load for RAM
+        self._next_poll = 0.0
+
+        self._last_redis_idx = defaultdict(int)  # idx per key for redis
+        self._disk_file = None  # log file followed for DISK, kept open across rotation
+        self._disk_inode = None
+        self._disk_offset = 0  # bytes of the log file already read
+        self._disk_partial = b""  # last line without "\n" yet
+        self._journal_reader = None
+        self._last_journal_seq = 0  # cursor for updating from JOURNAL
+        self._last_stream_id = "0-0"  # cursor for updating from STREAM
+
+        self.block = block
+        self.poll_interval = poll_interval
+
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._warm_start = snapshot_path is not None
+        self._next_snapshot = time.monotonic() + (snapshot_interval or 0)
+
+        self.redis = redis or RedisRegistry.get()
+        self.factory = OrderFactory()
 
-        self._last_redis_idx = defaultdict(lambda: 0)  # idx per key for redis
-        self._last_history_idx = 0  # last line idx for updating from DISK
+    def close(self) -> None:
+        """ close the log file followed for DISK, a later update() reopens it at the cursor """
+        if self._disk_file is not None:
+            self._disk_file.close()
+            self._disk_file = None
 
-        self.redis = Redis(host="127.0.0.1", port="6379")
-        self.factory = OrderFactory()
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     """ 
     methods for real-time message history updating 
@@ -81,9 +193,30 @@ class OrderHistory(History, LoggerMixin):
         return self._history
 
     def update(self) -> None:
+        if self._warm_start:
+            self._warm_start = False
+            if os.path.exists(self.snapshot_path):
+                self.load_snapshot(self.snapshot_path)
+
+        if self.poll_interval:
+            now = time.monotonic()
+            if now < self._next_poll:
+                return
+            self._next_poll = now + self.poll_interval
+
+        stime = time.perf_counter_ns()
         new_orders = self.load_new_orders()
         if new_orders:
             self._update(new_orders)
+        UPDATE.record(time.perf_counter_ns() - stime)
+
+        if (
+            new_orders
+            and self.snapshot_interval is not None
+            and time.monotonic() >= self._next_snapshot
+        ):
+            self._next_snapshot = time.monotonic() + self.snapshot_interval
+            self.save_snapshot(self.snapshot_path)
 
     def _update(self, new_orders: List[Order]):
         """ please override this method to change updating rule """
@@ -91,12 +224,15 @@ class OrderHistory(History, LoggerMixin):
         self._update_unex_qty(new_orders)  # sorting dict는 마지막에 업데이트
 
     def _update_history(self, orders: List[Order]):
-        self._last_modified = os.path.getmtime(self.log_path)  # modified 시간 최신화
         self._history.extend(orders)  # update history
 
+        for o in orders:  # index successful NewOrders by order_no
+            if o.msg_type == NewOrder.MSG_TYPE and o.response_code == "0":
+                self._new_orders_by_no[o.order_no] = o
+
     def _update_unex_qty(self, orders):
         """ 미체결 수량은 실시간으로 계산하여 업데이트 해야 함
-            ! 효율적인 계산을 위해 QueryBuild를 상속한 모듈에서 다시 implement
+            order_no index로 체결/취소 주문마다 O(1)
         """
         for o in orders:
 
@@ -105,24 +241,135 @@ class OrderHistory(History, LoggerMixin):
                 isinstance(o, CancelOrder) and getattr(o, "response_code") == "0"
             ):
                 order_no = getattr(o, "order_no")
-                qty = int(getattr(o, "qty"))
+                qty = getattr(o, "qty")
+
+                target_order = self._new_orders_by_no.get(order_no)
+                if target_order is None:  # NewOrder가 아직 로드되지 않음 (e.g. RAM key 순서)
+                    self._pending_fills[order_no] += qty
+                else:
+                    self._subtract_unex_qty(target_order, qty)
+
+            elif o.msg_type == NewOrder.MSG_TYPE and o.order_no in self._pending_fills:
+                if o is self._new_orders_by_no.get(o.order_no):
+                    self._subtract_unex_qty(o, self._pending_fills.pop(o.order_no))
+
+    def _subtract_unex_qty(self, order: NewOrder, qty: int):
+        old_qty = order.unex_qty
+        order.subtract_unex_order_count(qty)
+        self._on_unex_qty_changed(order, old_qty)
+
+    def _on_unex_qty_changed(self, order: NewOrder, old_qty):
+        """ please override this method to follow unex_qty changes (e.g. indexes) """
+        pass
+
+    """ snapshot / warm start """
+
+    def save_snapshot(self, path: str) -> None:
+        """ pickle orders, indexes, aggregates and the read cursors of the source
+            written to a temporary file first, so a crash never leaves a partial snapshot
+        """
+        state = {k: v for k, v in self.__dict__.items() if k not in self.SNAPSHOT_EXCLUDE}
+        snapshot = {
+            "version": self.SNAPSHOT_VERSION,
+            "class": self.class_name,
+            "source": self.source,
+            "state": state,
+        }
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f, paused_gc():
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load_snapshot(self, path: str) -> bool:
+        """ restore a snapshot of save_snapshot, the next update replays only newer events
+            return False (state untouched) if the snapshot doesn't fit this instance
+            ※ pickle: load only snapshots written by this process or a trusted one
+        """
+        with open(path, "rb") as f, paused_gc():
+            snapshot = pickle.load(f)
+
+        expected = (self.SNAPSHOT_VERSION, self.class_name, self.source)
+        found = (snapshot.get("version"), snapshot.get("class"), snapshot.get("source"))
+        if found != expected:
+            warnings.warn(f"{path} is a snapshot of {found}, expected {expected}")
+            return False
+
+        state = snapshot["state"]
+        if self._is_ahead_of_source(state):  # 무시하면 다음 update에서 처음부터 다시 읽음
+            warnings.warn(f"{path} is newer than the {self.source} source (reset?), ignored")
+            return False
+
+        self.__dict__.update(state)
+        return True
+
+    def _is_ahead_of_source(self, state: dict) -> bool:
+        """ True if the read cursor of a snapshot is past the end of the source """
+        if self.source == "ram":
+            return self.persisted_seq < state["_last_seq"]
+        if self.source == "stream":
+            last_id = self.redis.xlast_id(self.STREAM_KEY)
+            return _stream_id(last_id) < _stream_id(state["_last_stream_id"])
+        if self.source == "journal":
+            return self.journal_reader.last_seq() < state["_last_journal_seq"]
+        return False  # disk: a new inode or a smaller file is followed from 0
+
+    @property
+    def class_name(self) -> str:
+        return self.__class__.__name__
+
+    @property
+    def persisted_seq(self) -> int:
+        return int(self.redis.get(self.SEQ_KEY) or 0)
+
+    def wait_for_seq(self, seq: int, timeout=None, interval=0.001) -> bool:
+        """ block until `seq` messages are persisted (see Client.flush), then update
+            return False on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.persisted_seq < seq:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
 
-                for target_order in self._history:
-                    if (
-                        isinstance(target_order, NewOrder)
-                        and getattr(target_order, "order_no") == order_no
-                        and getattr(target_order, "response_code") == "0"
-                    ):  # target matching
-                        target_order.subtract_unex_order_count(qty)
+        self.update()
+        return True
 
     def load_new_orders(self) -> List[Order] or None:
-        """ return new orders which is not in history """
+        """ return new orders which is not in history, None if the source has not changed """
+        if not getattr(self, f"_has_changed_{self.source}")():
+            return None
+
+        loading_method = getattr(self, f"_load_new_orders_from_{self.source}")
+        return loading_method()
+
+    """ cheap change checks, one per source """
+
+    def _has_changed_ram(self) -> bool:
+        """ SEQ_KEY is INCRBY'd in the same transaction as the lists, one GET """
+        seq = self.persisted_seq
+        if seq == self._last_seq:
+            return False
+
+        self._last_seq = seq
+        return True
+
+    def _has_changed_stream(self) -> bool:
+        return True  # XREAD from the cursor is already a single round trip
+
+    def _has_changed_disk(self) -> bool:
+        """ inode, size and mtime of the log file, one stat() """
         try:
-            if self._last_modified != os.path.getmtime(self.log_path):  # if changed
-                loading_method = getattr(self, f"_load_new_orders_from_{self.source}")
-                return loading_method()
+            st = os.stat(self.log_path)
         except FileNotFoundError:
-            pass
+            return False
+
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if signature == self._last_modified:
+            return False
+
+        self._last_modified = signature  # modified 시간 최신화
+        return True
 
     """ load data from RAM """
 
@@ -146,6 +393,43 @@ class OrderHistory(History, LoggerMixin):
 
         return new_orders
 
+    """ load data from Redis Stream """
+
+    def _load_new_orders_from_stream(self) -> List[Order]:
+        """ one XREAD from the cursor, new events only and in arrival order """
+        entries = self.redis.xread(self.STREAM_KEY, self._last_stream_id, block=self.block)
+        if not entries:
+            return []
+
+        self._last_stream_id = entries[-1][0]
+
+        order_kwargs = [json.loads(fields["data"]) for _, fields in entries]
+        return [self.factory.create(**kw) for kw in order_kwargs]
+
+    def _has_changed_journal(self) -> bool:
+        """ last valid seq of the journal, one listdir() + the last record """
+        return self.journal_reader.last_seq() > self._last_journal_seq
+
+    """ load data from the binary journal """
+
+    @property
+    def journal_path(self):
+        return "logger/.journal"
+
+    @property
+    def journal_reader(self) -> JournalReader:
+        if self._journal_reader is None:
+            self._journal_reader = JournalReader(self.journal_path)
+        return self._journal_reader
+
+    def _load_new_orders_from_journal(self) -> List[Order]:
+        records = self.journal_reader.read(self._last_journal_seq + 1)
+        if records:
+            self._last_journal_seq = records[-1].seq
+
+        create = self.factory.create
+        return [create(**to_kwargs(r)) for r in records]
+
     """ load data from log file """
 
     @property
@@ -153,33 +437,70 @@ class OrderHistory(History, LoggerMixin):
         return "logger/.logs/client.log"
 
     def _load_new_orders_from_disk(self) -> List[Order]:
-        new_orders = []
-
-        try:  # read log
-            with open(self.log_path, "r") as f:
-                new_lines = f.readlines()[self._last_history_idx :]
-                new_lines = [l.rstrip() for l in new_lines]
-
-                self._last_history_idx += len(new_lines)
-
+        """ tail-follow: read only the bytes appended since the last load
+            rotation (new inode): the old file is drained first, then followed from 0
+            truncation (size < offset): followed from 0
+        """
+        try:
+            st = os.stat(self.log_path)
         except FileNotFoundError:
             warnings.warn(f"{self.log_path} doens't exists")
             return None
 
+        lines = []
+        if self._disk_file is not None and os.fstat(self._disk_file.fileno()).st_ino != st.st_ino:
+            lines.extend(self._read_appended_lines())  # rotated, drain the old file
+            if self._disk_partial:
+                lines.append(self._disk_partial)
+            self._disk_file.close()
+            self._disk_file = None
+
+        if self._disk_file is None:
+            self._disk_file = open(self.log_path, "rb")
+            inode = os.fstat(self._disk_file.fileno()).st_ino
+            if inode != self._disk_inode:  # another file than the cursor's
+                self._disk_inode, self._disk_offset, self._disk_partial = inode, 0, b""
+
+        if os.fstat(self._disk_file.fileno()).st_size < self._disk_offset:  # truncated
+            self._disk_offset, self._disk_partial = 0, b""
+
+        lines.extend(self._read_appended_lines())
+
         # translate log
-        order_kwargs = [self._parse_dict(l) for l in new_lines]
-        new_orders = [self.factory.create(**kw) for kw in order_kwargs]
-        return new_orders
+        order_kwargs = [self._parse_dict(l) for l in lines]
+        return [self.factory.create(**kw) for kw in order_kwargs if kw is not None]
+
+    def _read_appended_lines(self) -> List[bytes]:
+        f = self._disk_file
+        size = os.fstat(f.fileno()).st_size
+        if size <= self._disk_offset:
+            return []
+
+        if size - self._disk_offset >= self.MMAP_MIN_SIZE:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                data = mm[self._disk_offset : size]
+        else:
+            f.seek(self._disk_offset)
+            data = f.read(size - self._disk_offset)
+        self._disk_offset += len(data)
+
+        data = self._disk_partial + data
+        end = data.rfind(b"\n") + 1  # 마지막 줄이 아직 다 쓰이지 않았을 수 있음
+        self._disk_partial = data[end:]
+        return data[:end].splitlines()
 
     def _add_order_to_history_by_cls_name(self, *order: Order):
         for o in order:
             key = o.__class__.__name__  # class name
             self._history[key].append(order)
 
-    def _parse_dict(self, str_: str):
-        """ pattern: {"key" : "value"} (json format) """
-        pattern = re.compile(r"[{].+[}]")  # data
-        return json.loads(pattern.search(str_).group())
+    def _parse_dict(self, line: bytes):
+        """ pattern: ...Order-{"key" : "value"} (json format), None for other lines """
+        if b"Order-{" not in line:  # 대부분의 비주문 로그는 여기서 걸러짐
+            return None
+
+        match = self.ORDER_LINE.search(line.decode("utf-8", "replace"))
+        return json.loads(match.group(1)) if match else None
 
 
 class OrderHisotryEnhanced(OrderHistory):
@@ -195,44 +516,155 @@ class OrderHisotryEnhanced(OrderHistory):
     KEYS_SORTING_AFTER_UPDATE = ["unex_qty"]  # unex_qty는 계속 바뀌므로 따로 처리해주어야 함
     SORTING_KEYS = KEYS_SORTING_BEFORE_UPDATE + KEYS_SORTING_AFTER_UPDATE
 
-    def __init__(self, source="ram", *args, **kwargs):
+    # multi-key indexes, {(value, ...): [Order]}
+    # only KEYS_SORTING_BEFORE_UPDATE can be combined (values never change)
+    COMPOSITE_INDEXES = [
+        ("msg_type", "response_code", "ticker"),
+        ("msg_type", "response_code", "ticker", "price"),
+    ]
+
+    SNAPSHOT_EXCLUDE = OrderHistory.SNAPSHOT_EXCLUDE + ("check_aggregates",)
+
+    def __init__(self, source="ram", check_aggregates=False, *args, **kwargs):
+        """
+        check_aggregates: bool
+            if True, every update compares the running open quantities
+            with a full recompute and raises AggregateMismatchError on mismatch
+        """
         super().__init__(source=source, *args, **kwargs)
+        self.check_aggregates = check_aggregates
+
+        self._composite_indexes = {}  # {(key, ...): {(value, ...): [Order]}}
+        for keys in self.COMPOSITE_INDEXES:
+            self.add_composite_index(*keys)
+
+        self._books = OrderBooks()  # open orders per ticker, price-time priority
 
     def _update(self, new_orders) -> None:
         """ has been overriden to add "sorting dicts" for faster query """
 
         self._update_history(new_orders)
 
-        self._update_sorting_dict(
-            new_orders, *self.KEYS_SORTING_BEFORE_UPDATE,
-        )
-        self._update_unex_qty(new_orders)
-        self._update_sorting_dict(
-            new_orders, *self.KEYS_SORTING_AFTER_UPDATE
-        )  # 값이 바뀌는 key들은 마지막에 업데이트
+        # unex_qty는 최초 수량으로 등록한 뒤, 체결/취소로 값이 바뀐 주문만 bucket을 옮김
+        self._update_sorting_dict(new_orders, *self.SORTING_KEYS)
+        self._update_composite_indexes(new_orders)
+        self._update_books(new_orders)
+        self._update_unex_qty(new_orders)  # 전량 체결/취소된 주문은 book에서 제거
+
+        if self.check_aggregates:
+            mismatches = self.verify_aggregates()
+            if mismatches:
+                raise AggregateMismatchError(f"running totals != recompute: {mismatches}")
+
+    def add_composite_index(self, *keys) -> None:
+        """ declare a composite index over `keys`, built from the current history """
+        keys = tuple(keys)
+        for key in keys:
+            if key not in self.KEYS_SORTING_BEFORE_UPDATE:
+                msg = f"composite index only support {self.KEYS_SORTING_BEFORE_UPDATE} but got {key}"
+                raise ValueError(msg)
+
+        if keys not in self._composite_indexes:
+            self._composite_indexes[keys] = defaultdict(list)
+            self._update_composite_indexes(self._history, keys)
+
+    def get_composite_index(self, keys):
+        """ return (index keys, index) of the largest composite index covered by `keys`
+            (None, None) if there is no such index
+        """
+        keys = set(keys)
+        best = None
+        for index_keys in self._composite_indexes:
+            if keys.issuperset(index_keys) and (best is None or len(index_keys) > len(best)):
+                best = index_keys
 
-    def _update_sorting_dict(self, orders: List[Order], *sorting_keys):
-        for key in sorting_keys:
-            sorting_dict = self._get_sorting_dict(key)
+        if best is None:
+            return None, None
+        return best, self._composite_indexes[best]
 
-            if key == "unex_qty":
-                # unex_qty가 변한 주문들은 새롭게 key를 업데이트를 해줘야 함
-                # 현재는 전체 체결된 주문(fully_executed_orders)은 제외하고 re-update
-                # ! 이 부분에 비호율성이 심하므로, 최적화 방법을 고민
-                fully_executed_orders = sorting_dict.pop("00000", [])
-                left_orders = list(chain(*sorting_dict.values()))
+    def _update_composite_indexes(self, orders: List[Order], *indexes):
+        for keys in indexes or self._composite_indexes:
+            index = self._composite_indexes[keys]
 
-                sorting_dict.clear()  # reset
-                sorting_dict["00000"] = fully_executed_orders  # refill
+            for o in orders:
+                values = tuple(getattr(o, k, None) for k in keys)
+                if None not in values:
+                    index[values].append(o)
 
-                orders.extend(left_orders)  # new orders + not fully executed orders
+    def _update_sorting_dict(self, orders: List[Order], *sorting_keys):
+        for key in sorting_keys:
+            sorting_dict = self._get_sorting_dict(key)
+            is_mutable = key in self.KEYS_SORTING_AFTER_UPDATE
 
             for o in orders:
                 value = getattr(o, key, None)
 
-                if value is not None:
+                if value is None:
+                    continue
+                elif is_mutable:
+                    sorting_dict[value].add(o)  # set: 값이 바뀌면 O(1)로 이동
+                else:
                     sorting_dict[value].append(o)
 
+    def get_order_book(self, ticker: str) -> OrderBook:
+        self.update()
+        return self._books.get(ticker)
+
+    def get_unex_qty(self, ticker: str, price=None) -> int:
+        """ running open quantity of a ticker (and price level), O(1) """
+        self.update()
+        if price is None:
+            return self._books.qty(ticker)
+        return self._books.level_qty(ticker, normalize_value("price", price))
+
+    def verify_aggregates(self) -> dict:
+        """ recompute open quantities from the history and compare with the running totals
+            return {(ticker, price or None): (running, recomputed)} of the mismatches
+        """
+        expected = defaultdict(int)
+        for o in self._history:
+            if o.msg_type == NewOrder.MSG_TYPE and o.response_code == "0":
+                if o.unex_qty > 0:
+                    expected[(o.ticker, None)] += o.unex_qty
+                    expected[(o.ticker, o.price)] += o.unex_qty
+
+        running = {}
+        for book in self._books:
+            running[(book.ticker, None)] = book.qty
+            for price in book.prices:
+                running[(book.ticker, price)] = book.level_qty(price)
+
+        mismatches = {}
+        for key in set(expected) | set(running):
+            if expected.get(key, 0) != running.get(key, 0):
+                mismatches[key] = (running.get(key, 0), expected.get(key, 0))
+        return mismatches
+
+    def _update_books(self, orders: List[Order]):
+        for o in orders:
+            if (
+                o.msg_type == NewOrder.MSG_TYPE
+                and o.response_code == "0"
+                and o.unex_qty > 0
+            ):
+                self._books.add(o)
+
+    def _on_unex_qty_changed(self, order: NewOrder, old_qty):
+        """ move only the changed order between unex_qty buckets
+            and follow it in the order book (dropped once nothing is left)
+        """
+        self._books.reduce(order, old_qty)
+
+        sorting_dict = self._get_sorting_dict("unex_qty")
+
+        bucket = sorting_dict.get(old_qty)
+        if bucket is not None:
+            bucket.discard(order)
+            if not bucket:
+                del sorting_dict[old_qty]
+
+        sorting_dict[order.unex_qty].add(order)
+
     def _get_sorting_dict(self, sorting_key):
         # self.update()  # check update for every call
 
@@ -241,5 +673,8 @@ class OrderHisotryEnhanced(OrderHistory):
         try:
             return getattr(self, property_name)
         except AttributeError:
-            setattr(self, property_name, defaultdict(lambda: []))
+            if sorting_key in self.KEYS_SORTING_AFTER_UPDATE:
+                setattr(self, property_name, defaultdict(set))
+            else:
+                setattr(self, property_name, defaultdict(list))
             return getattr(self, property_name)
@@ -1,11 +1,57 @@
 from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
 import json
+import sys
+
+
+""" Order Class
+
+주문은 하루에 수백만 건이 쌓이므로 __slots__ + native 값으로 보관함
+ - price, qty, unex_qty: int
+ - ticker: interned str
+ - time: float (seconds since 1970-01-01 of the wall clock time)
+ - packet 등 wire-level 필드는 보관하지 않음
+zero padding 등 wire format은 json()에서만 적용함
+"""
+
+INT_FIELDS = ("price", "qty", "unex_qty")
+FIELD_WIDTHS = {"price": 5, "qty": 5, "unex_qty": 5}
+
+_EPOCH = datetime(1970, 1, 1)  # naive, the logged time has no timezone
+
+
+def parse_time(value) -> float:
+    """ str(datetime) -> float, numbers are kept """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return (datetime.fromisoformat(value) - _EPOCH).total_seconds()
+
+
+def format_time(value: float) -> str:
+    """ float -> str(datetime), inverse of parse_time """
+    return str(_EPOCH + timedelta(seconds=value))
+
+
+def normalize_value(key, value):
+    """ convert a query value to the stored representation, e.g. unex_qty "00000" -> 0 """
+    if value is None:
+        return value
+    elif key in INT_FIELDS:
+        return int(value)
+    elif key == "ticker":
+        return sys.intern(value)
+    return value
 
 
 class Order:
-    def __init__(self, **kwargs):
-        for k, v in kwargs.items():
-            setattr(self, k, v)
+    __slots__ = ("msg_type", "order_no", "time")
+
+    FIELDS = ("msg_type", "order_no", "time")  # json() order
+
+    def __init__(self, msg_type, order_no, time=None, **kwargs):
+        self.msg_type = msg_type
+        self.order_no = order_no
+        self.time = parse_time(time)
 
     def is_success(self):
         if not hasattr(self, "response_code"):
@@ -13,8 +59,30 @@ class Order:
 
         return getattr(self, "response_code") == "0"
 
+    def __getstate__(self):  # compact pickle (snapshot), FIELDS covers every slot
+        return tuple(getattr(self, k, None) for k in self.FIELDS)
+
+    def __setstate__(self, state):
+        for k, v in zip(self.FIELDS, state):
+            if v is not None:
+                setattr(self, k, v)
+
+    def to_dict(self) -> dict:
+        """ wire-format fields (zero padded), unset fields are skipped """
+        result = {}
+        for k in self.FIELDS:
+            v = getattr(self, k, None)
+            if v is None:
+                continue
+            elif k in FIELD_WIDTHS:
+                v = str(v).zfill(FIELD_WIDTHS[k])
+            elif k == "time":
+                v = format_time(v)
+            result[k] = v
+        return result
+
     def json(self, indent=None):
-        return json.dumps(self.__dict__, indent=indent)
+        return json.dumps(self.to_dict(), indent=indent)
 
     def __str__(self):
         return self.json(indent=4)
@@ -29,26 +97,38 @@ class Order:
 
 
 class NewOrder(Order):
+    __slots__ = ("ticker", "price", "qty", "response_code", "unex_qty")
+
     MSG_TYPE = "0"
+    FIELDS = (
+        "msg_type",
+        "order_no",
+        "ticker",
+        "price",
+        "qty",
+        "response_code",
+        "time",
+        "unex_qty",
+    )
 
     def __init__(self, msg_type, order_no, ticker, price, qty, response_code, **kwargs):
-        super().__init__(
-            msg_type=msg_type,
-            order_no=order_no,
-            ticker=ticker,
-            price=price,
-            qty=qty,
-            response_code=response_code,
-            **kwargs
-        )
+        kwargs.pop("unex_qty", None)  # 미체결 수량은 체결/취소 메시지로부터 다시 계산함
+        super().__init__(msg_type=msg_type, order_no=order_no, **kwargs)
+
+        self.ticker = sys.intern(ticker)
+        self.price = int(price)
+        self.qty = int(qty)
+        self.response_code = response_code
 
-        setattr(self, "unex_qty", qty)  # 신규 메시지 생성 시점에는 미체결 수량과 주문 수량이 일치함
+        self.unex_qty = self.qty  # 신규 메시지 생성 시점에는 미체결 수량과 주문 수량이 일치함
 
     def subtract_unex_order_count(self, qty):
-        self.unex_qty = str(int(self.unex_qty) - qty).zfill(5)
+        self.unex_qty -= qty
 
 
 class CancelOrder(NewOrder):
+    __slots__ = ()
+
     MSG_TYPE = "1"
 
 
@@ -72,19 +152,25 @@ class UnexecutedOrder(NewOrder):
 
 
 class ReceivedOrder(Order):
+    __slots__ = ("response_code",)
+
     MSG_TYPE = "2"
+    FIELDS = ("msg_type", "order_no", "response_code", "time")
 
     def __init__(self, msg_type, order_no, response_code, **kwargs):
-        super().__init__(
-            msg_type=msg_type, order_no=order_no, response_code=response_code, **kwargs
-        )
+        super().__init__(msg_type=msg_type, order_no=order_no, **kwargs)
+        self.response_code = response_code
 
 
 class ExecutedOrder(Order):
+    __slots__ = ("qty",)
+
     MSG_TYPE = "3"
+    FIELDS = ("msg_type", "order_no", "qty", "time")
 
     def __init__(self, msg_type, order_no, qty, **kwargs):
-        super().__init__(msg_type=msg_type, order_no=order_no, qty=qty, **kwargs)
+        super().__init__(msg_type=msg_type, order_no=order_no, **kwargs)
+        self.qty = int(qty)
 
 
 class OrderFactory:
@@ -1,14 +1,17 @@
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from itertools import chain
 import json
 import os
 import re
+import time
 from typing import List, Set
 import warnings
 
 from cache.redis import Redis
 
 from logger import LoggerMixin
+import metrics
 from .orders import (
     Order,
     NewOrder,
@@ -16,12 +19,68 @@ from .orders import (
     ReceivedOrder,
     ExecutedOrder,
     OrderFactory,
+    normalize_value,
 )
+from orders.columnar import ColumnarOrderStore
 from orders.history import OrderHisotryEnhanced
 from sockets import TCPSocket
 
 
+EXECUTE = metrics.histogram("query_execute", "OrderQueryBuilder.execute, plan + run")
+
+
+class Predicate:
+    """ keys == values, resolved to an index bucket when added (no copy)
+
+    exclude=True means "has the keys, but not these values"
+    """
+
+    def __init__(self, keys=(), values=(), bucket=None, exclude=False, universe=None):
+        self.keys = tuple(keys)
+        self.values = tuple(values)
+        self.bucket = bucket or ()
+        self.exclude = exclude
+        self.universe = universe  # callable, every order having the keys
+
+        self._bucket_set = None
+
+    @property
+    def cardinality(self) -> int:
+        return len(self.bucket)
+
+    @property
+    def bucket_set(self) -> Set:
+        if self._bucket_set is None:
+            self._bucket_set = self.bucket if isinstance(self.bucket, set) else set(self.bucket)
+        return self._bucket_set
+
+    def match(self, o) -> bool:
+        if not self.keys:  # plain result set (_add_query_result_to_buffer)
+            return o in self.bucket_set
+        return all(getattr(o, k, None) == v for k, v in zip(self.keys, self.values))
+
+    def has_keys(self, o) -> bool:
+        return all(getattr(o, k, None) is not None for k in self.keys)
+
+    def __str__(self):
+        if not self.keys:
+            return "<result>"
+        return ", ".join(f"{k}=={v}" for k, v in zip(self.keys, self.values))
+
+
 class QueryBuilder(ABC):
+    """ predicates are buffered by add_query, nothing is materialized until execute()
+
+    planner
+     1. start from the most selective include predicate (smallest index bucket)
+     2. short-circuit when a bucket or the intermediate result is empty
+     3. apply the other include predicates as filters on the candidates
+     4. apply exclusions as set difference when the bucket is smaller than
+        the candidates ("exclude(-)"), as filters otherwise ("exclude(f)")
+
+    explain() shows the plan of the buffered predicates
+    """
+
     buffer = []
 
     def reset_buffer(self):
@@ -32,14 +91,64 @@ class QueryBuilder(ABC):
         if not len(self.buffer):
             # raise ValueError("Please add queries before execution")
             result = None
-        elif len(self.buffer) == 1:
-            result = list(self.buffer)
         else:
-            result = list(set.intersection(*self.buffer))  # and condition
+            result = self._run(self.plan())
 
         self.reset_buffer()
         return result
 
+    def plan(self) -> List[Predicate]:
+        """ buffered predicates in execution order """
+        includes = sorted((p for p in self.buffer if not p.exclude), key=lambda p: p.cardinality)
+        excludes = sorted((p for p in self.buffer if p.exclude), key=lambda p: p.cardinality)
+        return includes + excludes
+
+    def explain(self) -> str:
+        """ chosen plan with estimated cardinalities, the buffer is kept """
+        lines = []
+        rows = None
+        for step, p in enumerate(self.plan(), start=1):
+            if rows is None and not p.exclude:
+                op, rows = "scan", p.cardinality
+            elif rows is None:  # exclusive-only query
+                op, rows = "scan all", None
+            elif p.exclude:
+                op = "exclude(-)" if p.cardinality < rows else "exclude(f)"
+            else:
+                op, rows = "filter", min(rows, p.cardinality)
+
+            rows_str = "?" if rows is None else rows
+            lines.append(f"{step}. {op:<10} {p}  (bucket={p.cardinality}, rows<={rows_str})")
+        return "\n".join(lines)
+
+    def _run(self, plan: List[Predicate]) -> List:
+        includes = [p for p in plan if not p.exclude]
+        excludes = [p for p in plan if p.exclude]
+
+        if includes:
+            first = includes[0]
+            if not first.cardinality:
+                return []
+            candidates = list(first.bucket)
+        else:
+            candidates = list(excludes[0].universe())
+
+        for p in includes[1:]:
+            if not candidates:
+                return []
+            candidates = [o for o in candidates if p.match(o)]
+
+        for p in excludes:
+            if not candidates:
+                return []
+            elif p.cardinality < len(candidates):
+                excluded = p.bucket_set
+                candidates = [o for o in candidates if o not in excluded and p.has_keys(o)]
+            else:
+                candidates = [o for o in candidates if p.has_keys(o) and not p.match(o)]
+
+        return candidates
+
     @abstractmethod
     def add_query(self, **kwags):
         """ main method """
@@ -50,43 +159,27 @@ class QueryBuilder(ABC):
     def _add_query_result_to_buffer(self, result: Set or List):
         """ support method """
         if not result:
-            self.buffer.append(set())
-        elif isinstance(result, list):
-            self.buffer.append(set(result))
-        elif isinstance(result, set):
-            self.buffer.append(result)
+            self.buffer.append(Predicate(bucket=set()))
+        elif isinstance(result, (list, set)):
+            self.buffer.append(Predicate(bucket=result))
         else:
             raise TypeError("result Type doens't match")
 
 
 class OrderQueryBuilder(QueryBuilder, OrderHisotryEnhanced):
+    SNAPSHOT_EXCLUDE = OrderHisotryEnhanced.SNAPSHOT_EXCLUDE + ("buffer",)  # query in progress
+
     def __init__(self, source="ram", *args, **kwargs):
         super(QueryBuilder, self).__init__(source=source, *args, **kwargs)
+        self.reset_buffer()
 
     def execute(self):
+        stime = time.perf_counter_ns()
         result = super().execute()
         self.update()
+        EXECUTE.record(time.perf_counter_ns() - stime)
         return result
 
-    def _update_unex_qty(self, orders):
-        """ overriden for faster unex_qty updates """
-
-        for o in orders:
-            # execution order or successful cancel order
-            if isinstance(o, ExecutedOrder) or (
-                isinstance(o, CancelOrder) and getattr(o, "response_code") == "0"
-            ):
-                order_no = getattr(o, "order_no")
-                qty = int(getattr(o, "qty"))
-
-                self.add_query(msg_type="0", order_no=order_no)
-                try:
-                    target_order = self.execute().pop()
-                    target_order.subtract_unex_order_count(qty)
-
-                except IndexError:  # empty
-                    pass
-
     """ 
         Query Methods 
         
@@ -106,25 +199,41 @@ class OrderQueryBuilder(QueryBuilder, OrderHisotryEnhanced):
         """ include orders that match key and value """
         for target_key, target_val in kwargs.items():
             self._validate_query_params(target_key, target_val)
+        kwargs = {k: normalize_value(k, v) for k, v in kwargs.items()}  # e.g. "60000" -> 60000
+
+        # composite index가 있으면 한 번의 hash probe로 처리
+        index_keys, index = self.get_composite_index(kwargs)
+        if index is not None:
+            values = tuple(kwargs[k] for k in index_keys)
+            self.buffer.append(Predicate(index_keys, values, index.get(values)))
+            kwargs = {k: v for k, v in kwargs.items() if k not in index_keys}
 
+        for target_key, target_val in kwargs.items():
             target = self._get_sorting_dict(sorting_key=target_key)
-            result = target.get(target_val)
-            self._add_query_result_to_buffer(result)
+            self.buffer.append(Predicate([target_key], [target_val], target.get(target_val)))
 
     def add_exclusive_query(self, **kwargs):
-        """ exclude orders that match key and value """
-        result = []
-
+        """ exclude orders that match key and value
+            (only orders having the keys are kept, as before)
+        """
         for key, exclusive_value in kwargs.items():
             self._validate_query_params(key, exclusive_value)
+        kwargs = {k: normalize_value(k, v) for k, v in kwargs.items()}
 
-            target = self._get_sorting_dict(sorting_key=key)
+        keys, values = list(kwargs.keys()), list(kwargs.values())
+        targets = [self._get_sorting_dict(sorting_key=k) for k in keys]
 
-            for value, orders in target.items():
-                if not value == exclusive_value:
-                    result += orders
+        if len(keys) == 1:
+            bucket = targets[0].get(values[0])
+        else:  # 여러 key의 조합은 버킷이 없으므로 가장 작은 버킷에서 필터링
+            bucket = [
+                o
+                for o in min((t.get(v, ()) for t, v in zip(targets, values)), key=len)
+                if all(getattr(o, k, None) == v for k, v in zip(keys, values))
+            ]
 
-        self._add_query_result_to_buffer(result)
+        universe = lambda: chain.from_iterable(targets[0].values())
+        self.buffer.append(Predicate(keys, values, bucket, exclude=True, universe=universe))
 
     def _validate_query_params(self, key, val):
         if not key in self.SORTING_KEYS:
@@ -135,7 +244,7 @@ class OrderQueryBuilder(QueryBuilder, OrderHisotryEnhanced):
 
     def select_unexecuted_orders(self):
         self.add_query(msg_type="0", response_code="0")
-        self.add_exclusive_query(unex_qty="00000")
+        self.add_exclusive_query(unex_qty=0)
         return self.execute()
 
     """ utility methods """
@@ -168,7 +277,7 @@ class OrderQueryBuilder(QueryBuilder, OrderHisotryEnhanced):
         elif len(set(o.__class__ for o in orders)) > 1:  # all orders must be same type
             raise TypeError(f"Does not support mixed types ")
 
-        result = sum([int(getattr(o, attr)) for o in orders])
+        result = sum([getattr(o, attr) for o in orders])
         if result is None:
             return 0
 
@@ -187,28 +296,22 @@ class AXETaskQuerent(OrderQueryBuilder):
 
     def get_unex_qty_by_ticker(self, ticker: str):
         """ 1. 종목코드를 입력으로 해당 종목의 전체 미체결 수량을 반환하는 함수 """
-        self.add_query(msg_type="0", response_code="0", ticker=ticker)
-        self.add_exclusive_query(unex_qty="00000")
-        unex_orders = self.execute()
-        return self.sum(unex_orders, "unex_qty")
+        return self.get_unex_qty(ticker)  # order book의 running total
 
     def get_unex_qty_by_ticker_and_price(self, ticker: str, price: str):
         """ 2. 종목코드와 가격을 입력으로 전체 미체결 주문 목록을 반환하는 함수 """
-        self.add_query(msg_type="0", response_code="0", ticker=ticker, price=price)
-        self.add_exclusive_query(unex_qty="00000")
-        unex_orders = self.execute()
-        return self.sum(unex_orders, "unex_qty")
+        return self.get_unex_qty(ticker, price)  # price level의 running total
 
     def get_unex_orders_by_ticker(self, ticker: str):
         """ 3. 종목코드를 입력으로 전체 미체결 주문 목록을 반환하는 함수 """
         self.add_query(msg_type="0", response_code="0", ticker=ticker)
-        self.add_exclusive_query(unex_qty="00000")
+        self.add_exclusive_query(unex_qty=0)
         return self.execute()
 
     def get_unex_orders_by_ticker_and_price(self, ticker: str, price: str):
         """ 4. 종목코드와 가격을 입력으로 특정 종목, 특정 가격의 미체결 주문 목록을 반환하는 함수"""
         self.add_query(msg_type="0", response_code="0", ticker=ticker, price=price)
-        self.add_exclusive_query(unex_qty="00000")
+        self.add_exclusive_query(unex_qty=0)
         return self.execute()
 
     def get_unex_order_by_ticker_sorted(self, ticker: str):
@@ -216,28 +319,70 @@ class AXETaskQuerent(OrderQueryBuilder):
         주문 시간을 두번째 키로 하여 정렬 된 미체결 주문 목록을 반환하는 함수
         """
 
-        tree = defaultdict(lambda: {})  # TODO: message가 많아지면 Custom Tree Class로 대체
+        return list(self.get_order_book(ticker))  # price-time priority로 유지되는 book
+
+    def get_order_by_ticker_and_order_no(self, ticker: str, order_no: str):
+        """ 6. 종목코드와 주문번호를 입력으로 해당 주문을 리턴하는 함수 """
+        self.add_query(msg_type="0", ticker=ticker, order_no=order_no)
+        return self.execute()
 
-        # set in tree
-        unex_orders = self.get_unex_orders_by_ticker(ticker)
-        for order in unex_orders:
-            price = getattr(order, "price")
-            time = getattr(order, "time")
 
-            tree[price][time] = order
+class ColumnarAXETaskQuerent(AXETaskQuerent):
+    """ AXETaskQuerent answered by vectorized scans of a ColumnarOrderStore (requires numpy)
 
-        # sort
-        result = []
-        for p in sorted(tree.keys()):  # price로 정렬
-            for t in sorted(tree.get(p).keys()):  # time으로 정렬
-                result.append(tree[p][t])
+    the store is fed by the same ingest (_update) and follows unex_qty changes,
+    results are the same as AXETaskQuerent
+    """
 
-        return result
+    def __init__(self, source="ram", *args, **kwargs):
+        super().__init__(source=source, *args, **kwargs)
+        self.columns = ColumnarOrderStore()
+
+    def _update(self, new_orders) -> None:
+        self.columns.append(new_orders)  # 최초 수량으로 등록, 체결/취소는 hook으로 반영
+        super()._update(new_orders)
+
+    def _on_unex_qty_changed(self, order: NewOrder, old_qty):
+        super()._on_unex_qty_changed(order, old_qty)
+        self.columns.set_unex_qty(order)
+
+    def _unex_mask(self, **conditions):
+        self.update()
+        return self.columns.mask(
+            msg_type="0", response_code="0", exclude={"unex_qty": 0}, **conditions
+        )
+
+    def get_unex_qty_by_ticker(self, ticker: str):
+        return self.columns.sum("unex_qty", self._unex_mask(ticker=ticker))
+
+    def get_unex_qty_by_ticker_and_price(self, ticker: str, price: str):
+        return self.columns.sum("unex_qty", self._unex_mask(ticker=ticker, price=price))
+
+    def get_unex_orders_by_ticker(self, ticker: str):
+        return self.columns.select(self._unex_mask(ticker=ticker))
+
+    def get_unex_orders_by_ticker_and_price(self, ticker: str, price: str):
+        return self.columns.select(self._unex_mask(ticker=ticker, price=price))
+
+    def get_unex_order_by_ticker_sorted(self, ticker: str):
+        mask = self._unex_mask(ticker=ticker) & (self.columns.orders["unex_qty"] > 0)
+        return self.columns.select(rows=self.columns.sort(("price",), mask))
 
     def get_order_by_ticker_and_order_no(self, ticker: str, order_no: str):
-        """ 6. 종목코드와 주문번호를 입력으로 해당 주문을 리턴하는 함수 """
-        self.add_query(msg_type="0", ticker=ticker, order_no=order_no)
-        return self.execute()
+        self.update()
+        return self.columns.select(self.columns.mask(msg_type="0", ticker=ticker, order_no=order_no))
+
+    """ bulk analytics """
+
+    def get_unex_qty_by_tickers(self):
+        """ {ticker: open quantity} of every ticker """
+        return self.columns.groupby_sum("ticker", "unex_qty", self._unex_mask())
+
+    def get_executed_qty_by_price(self, ticker: str = None):
+        """ {price: executed quantity}, of a ticker or of all tickers """
+        conditions = {} if ticker is None else {"ticker": ticker}
+        self.update()
+        return self.columns.fills_by("price", **conditions)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,36 @@
+import asyncio
+from collections import defaultdict
+import importlib
 import inspect
 import json
+import logging
 import os
+import queue
+import shutil
 import socket
+import tempfile
+import threading
 import time
+import urllib.request
 
-from logger import LoggerMixin
-from messages.messages import MessageFactory
-from client import Client
+from logger import LoggerMixin, QueuedLogging, set_level
+import metrics
+from messages.messages import MessageFactory, OrderReceivedMessage
+from client import BaseClient, Client
+from client_pool import SessionPool
+from async_client import AsyncClient
+from benchmarks.flows import synthetic_flow
+from cache.memory import InMemoryRedis
+from cache.redis import Redis, RedisRegistry, redis as redis_py
+from cache.writer import WriteBehindWriter
+from exchange import ExchangeSimulator, MatchingEngine, StubExchangeServer
+from exchange.matching import BUY, SELL, EngineOrder
+from exceptions import AggregateMismatchError, MessageTypeNotSupported, PacketDecodeError
+from journal import JournalReader, JournalWriter, RECORD_SIZE
 from orders.history import OrderHistory
-from orders.query_builder import AXETaskQuerent, OrderQueryBuilder
+from orders.orders import OrderFactory
+from orders.columnar import np
+from orders.query_builder import AXETaskQuerent, ColumnarAXETaskQuerent, OrderQueryBuilder
 
 import unittest
 
@@ -136,5 +158,1172 @@ class ClientTest(unittest.TestCase, LoggerMixin):
             method()
 
 
+class _RecordingAsyncRedis:
+    """ records rpush_all calls instead of writing to Redis """
+
+    def __init__(self):
+        self.lists = {}
+
+    async def rpush_all(self, entries, transaction=True, seq_key=None, stream=None):
+        for key, value in entries:
+            self.lists.setdefault(key, []).append(value)
+        return sum(len(v) for v in self.lists.values())
+
+
+class AsyncClientTest(unittest.TestCase):
+    NEW_PACKET = b"0000000006606000000020"
+
+    def test_concurrent_sendall(self):
+        async def senario():
+            server = StubExchangeServer(fill_qty=5)
+            port = await server.start()
+            redis = _RecordingAsyncRedis()
+
+            clients = [AsyncClient("127.0.0.1", port, redis=redis) for _ in range(3)]
+            for c in clients:
+                await c.connect()
+
+            results = await asyncio.gather(*[c.sendall(self.NEW_PACKET) for c in clients])
+
+            for c in clients:
+                await c.close()
+            await server.stop()
+            return results, redis.lists
+
+        results, lists = asyncio.run(senario())
+        self.assertEqual(results, [True, True, True])
+
+        order_nos = sorted(json.loads(o)["order_no"] for o in lists["NewOrder"])
+        self.assertEqual(order_nos, ["00001", "00002", "00003"])
+        self.assertEqual(len(lists["OrderExecutedOrder"]), 3)
+
+    def test_save_order(self):
+        class SlowFirstRedis(_RecordingAsyncRedis):
+            calls = 0
+
+            async def rpush_all(self, entries, *args, **kwargs):
+                self.calls += 1
+                if self.calls == 1:
+                    await asyncio.sleep(0.05)  # the first window is saved slowly
+                return await super().rpush_all(entries, *args, **kwargs)
+
+        async def senario():
+            server = StubExchangeServer()
+            port = await server.start()
+            redis = SlowFirstRedis()
+
+            async with AsyncClient("127.0.0.1", port, redis=redis) as client:
+                await asyncio.gather(*[client.sendall(self.NEW_PACKET) for _ in range(2)])
+
+            await server.stop()
+            return redis.lists
+
+        lists = asyncio.run(senario())
+        order_nos = [json.loads(o)["order_no"] for o in lists["NewOrder"]]
+        self.assertEqual(order_nos, ["00001", "00002"])  # saved in ack order
+
+    def test_send_many(self):
+        async def senario():
+            server = StubExchangeServer(reject_order_nos=["00009"])
+            port = await server.start()
+            redis = _RecordingAsyncRedis()
+
+            async with AsyncClient("127.0.0.1", port, redis=redis) as client:
+                results = await client.send_many(
+                    [
+                        self.NEW_PACKET,
+                        b"1000090006606000000010",  # rejected
+                        b"1000010006606000000010",
+                    ]
+                )
+
+            await server.stop()
+            return results, redis.lists
+
+        results, lists = asyncio.run(senario())
+        self.assertEqual(results, [True, False, True])
+
+        cancels = [json.loads(o) for o in lists["CancelOrderOrder"]]
+        self.assertEqual([c["response_code"] for c in cancels], ["1", "0"])
+
+
+class _LateAckServer:
+    """ acks every window of client packets when the next window arrives """
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        held, order_no = b"", 0
+        while True:
+            pk = await reader.read(1024)
+            if not pk:
+                break
+
+            acks = b""
+            for _ in range(len(pk) // 22):
+                order_no += 1
+                acks += f"2{str(order_no).zfill(5)}0".encode()
+            writer.write(held)
+            held = acks
+            await writer.drain()
+        writer.close()
+
+
+class LateAckTest(unittest.TestCase):
+    def _packets(self, first_qty):
+        return [f"000000000660060000{str(q).zfill(4)}".encode() for q in (first_qty, first_qty + 1)]
+
+    def test_late_window(self):
+        async def senario():
+            server = _LateAckServer()
+            port = await server.start()
+            redis = _RecordingAsyncRedis()
+
+            async with AsyncClient("127.0.0.1", port, redis=redis) as client:
+                client.recv_timeout = 0.1
+                results = [
+                    await client.send_many(self._packets(q), window=2) for q in (1, 3, 5)
+                ]
+                unacked = len(client._unacked)
+
+            await server.stop()
+            return results, unacked, redis.lists
+
+        results, unacked, lists = asyncio.run(senario())
+        self.assertEqual(results, [[False, False]] * 3)  # every ack arrives one window late
+        self.assertEqual(unacked, 2)  # the last window
+
+        # late acks are matched to their own packets, not to the next window
+        saved = [json.loads(o) for o in lists["NewOrder"]]
+        self.assertEqual([o["order_no"] for o in saved], ["00001", "00002", "00003", "00004"])
+        self.assertEqual([int(o["qty"]) for o in saved], [1, 2, 3, 4])
+
+
+class RecvBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.client = BaseClient("127.0.0.1", 0)
+
+    def test_split_frames(self):
+        self.assertEqual(self.client._feed(b"20000"), [])  # partial ack
+        self.assertEqual(self.client._feed(b"10300001"), ["2000010"])
+        self.assertEqual(self.client._feed(b"00005"), ["30000100005"])
+        self.assertEqual(self.client._recv_buffer, bytearray())
+
+    def test_unknown_message_type(self):
+        with self.assertRaises(MessageTypeNotSupported):
+            self.client._feed(b"2000010" + b"9xxxx")
+        self.assertEqual(self.client._recv_buffer, bytearray())  # garbage is dropped
+
+        self.assertEqual(self.client._feed(b"2000020"), ["2000020"])  # usable again
+
+    def test_scan_releases_buffer(self):
+        buffer = bytearray(b"2000010" + b"9xxxx")
+        with self.assertRaises(MessageTypeNotSupported):
+            MessageFactory().framer.scan(buffer)
+        buffer.clear()  # no BufferError, no view is left
+        self.assertEqual(buffer, bytearray())
+
+
+class PacketFramerTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = MessageFactory()
+
+    def test_split(self):
+        packet = "0000010006606000000020" + "2000010" + "30000100005"
+        expected = ["0000010006606000000020", "2000010", "30000100005"]
+        for p in [packet, packet.encode(), bytearray(packet.encode())]:
+            frames = self.factory.framer.split(p)
+            self.assertEqual([self.factory.framer.decode(f) for f in frames], expected)
+            self.assertEqual([m.msg_type for m in self.factory.create(p)], ["0", "2", "3"])
+
+    def test_buffer_frames_are_views(self):
+        buffer = bytearray(b"2000010" + b"2000020")
+        frames, _ = self.factory.framer.scan(buffer)
+        self.assertTrue(all(isinstance(f, memoryview) for f in frames))
+        buffer[1] = ord("9")  # zero-copy, the frame sees the buffer
+        self.assertEqual(self.factory.framer.decode(frames[0]), "2900010")
+
+    def test_partial_frame(self):
+        for packet in ["2000010" + "30000", b"2000010" + b"30000", bytearray(b"2000010" + b"30000")]:
+            frames, consumed = self.factory.framer.scan(packet)
+            self.assertEqual(len(frames), 1)
+            self.assertEqual(consumed, 7)  # trailing partial frame is not consumed
+            with self.assertRaises(PacketDecodeError):
+                self.factory.framer.split(packet)
+
+    def test_unknown_message_type(self):
+        for packet in ["2000010" + "9abcd", b"2000010" + b"9abcd", bytearray(b"2000010" + b"9abcd")]:
+            with self.assertRaisesRegex(MessageTypeNotSupported, r"^MSG TYPE 9 is not supported$"):
+                self.factory.create(packet)
+
+
+class MatchingEngineTest(unittest.TestCase):
+    def _buy(self, order_id, price, qty):
+        return EngineOrder(order_id, "000660", BUY, price, qty, owner="client")
+
+    def test_price_time_priority(self):
+        engine = MatchingEngine()
+        for order in [self._buy(1, 60000, 10), self._buy(2, 61000, 10), self._buy(3, 60000, 10)]:
+            engine.submit(order)
+
+        fills = engine.submit(EngineOrder(-1, "000660", SELL, 60000, 25), ioc=True)
+        self.assertEqual([(f.maker.order_id, f.qty, f.price) for f in fills], [
+            (2, 10, 61000),  # better price first
+            (1, 10, 60000),  # then arrival order
+            (3, 5, 60000),  # partial fill
+        ])
+        self.assertEqual(engine.get(3).remaining, 5)
+        self.assertIsNone(engine.get(1))
+        self.assertEqual(engine.book("000660").asks.best_price(), None)  # ioc never rests
+
+    def test_cancel(self):
+        engine = MatchingEngine()
+        engine.submit(self._buy(1, 60000, 10))
+
+        self.assertFalse(engine.cancel(1, 11))  # more than remaining
+        self.assertTrue(engine.cancel(1, 4))
+        self.assertTrue(engine.cancel(1, 6))
+        self.assertFalse(engine.cancel(1, 1))  # no longer resting
+        self.assertEqual(engine.book("000660").bids.depth(), [])
+
+
+class ExchangeSimulatorTest(unittest.TestCase):
+    NEW_PACKET = b"0000000006606000000020"
+
+    def test_sessions(self):
+        async def senario():
+            simulator = ExchangeSimulator(fill_ratio=1.0, latency=0.001, seed=0)
+            port = await simulator.start()
+            redis = _RecordingAsyncRedis()
+
+            clients = [AsyncClient("127.0.0.1", port, redis=redis) for _ in range(4)]
+            for c in clients:
+                await c.connect()
+            results = await asyncio.gather(
+                *[c.send_many([self.NEW_PACKET] * 5) for c in clients]
+            )
+
+            # cancel more than the order qty: rejected
+            rejected = await clients[0].sendall(b"1000010006606000000021")
+
+            for c in clients:
+                await c.close()
+            await simulator.stop()
+            return results, rejected, redis.lists, simulator.stats
+
+        results, rejected, lists, stats = asyncio.run(senario())
+        self.assertEqual(results, [[True] * 5] * 4)
+        self.assertFalse(rejected)
+
+        order_nos = sorted(json.loads(o)["order_no"] for o in lists["NewOrder"])
+        self.assertEqual(order_nos, [str(i).zfill(5) for i in range(1, 21)])
+
+        executed = defaultdict(int)
+        for o in lists.get("OrderExecutedOrder", []):
+            o = json.loads(o)
+            executed[o["order_no"]] += int(o["qty"])
+        self.assertEqual(sum(executed.values()), stats["executed_qty"])
+        self.assertTrue(all(qty <= 20 for qty in executed.values()))  # never overfilled
+        self.assertEqual(stats["orders"], 20)
+
+    def _new_order(self, simulator, session):
+        out = defaultdict(bytearray)
+        simulator._new_order(session, MessageFactory().create(self.NEW_PACKET).pop(), out)
+        return bytes(out[session])
+
+    def test_order_no_wrap(self):
+        simulator = ExchangeSimulator(fill_ratio=0.0)
+        simulator._order_no = simulator.MAX_ORDER_NO - 1
+        self.assertEqual(self._new_order(simulator, "a"), b"2999990")
+        self.assertEqual(self._new_order(simulator, "a"), b"2000010")
+
+        simulator._order_no = simulator.MAX_ORDER_NO - 1  # 99999, 00001 still resting
+        self.assertEqual(self._new_order(simulator, "a"), b"2000020")
+        self.assertEqual(simulator.engine.get("99999").remaining, 20)
+
+        simulator.MAX_ORDER_NO = 2  # 00001, 00002 resting
+        self.assertEqual(self._new_order(simulator, "a"), b"2000001")
+
+    def test_cancel_owner(self):
+        simulator = ExchangeSimulator(fill_ratio=0.0)
+        self._new_order(simulator, "a")
+        c_msg = MessageFactory().create(b"1000010006606000000005").pop()
+
+        out = defaultdict(bytearray)
+        simulator._cancel_order("b", c_msg, out)  # order of another session
+        simulator._cancel_order("a", c_msg, out)
+        self.assertEqual(out, {"b": b"2000011", "a": b"2000010"})
+        self.assertEqual(simulator.engine.get("00001").remaining, 15)
+
+
+class _FlakyRedis(InMemoryRedis):
+    """ rpush_all fails `failures` times, or blocks while `gate` is cleared """
+
+    def __init__(self, failures=0):
+        super().__init__()
+        self.failures = failures
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def rpush_all(self, *args, **kwargs):
+        self.gate.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("redis is down")
+        return super().rpush_all(*args, **kwargs)
+
+
+class _TmpJournalHistory(OrderHistory):
+    path = None
+
+    @property
+    def journal_path(self):
+        return self.path
+
+
+class SessionPoolTest(unittest.TestCase):
+    TICKERS = ["000660", "005930", "035420", "051910", "068270"]
+
+    def setUp(self):
+        self.simulator = ExchangeSimulator(fill_ratio=0.0)
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.port = asyncio.run_coroutine_threadsafe(self.simulator.start(), self.loop).result()
+        self.redis = InMemoryRedis()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.simulator.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _packets(self, n):
+        """ NewOrders round-robin over TICKERS, qty is the submit index """
+        return [
+            f"000000{self.TICKERS[i % len(self.TICKERS)]}60000{str(i + 1).zfill(5)}".encode()
+            for i in range(n)
+        ]
+
+    def test_ticker_order(self):
+        packets = self._packets(200)
+        with SessionPool("127.0.0.1", self.port, n_sessions=3, window=8, redis=self.redis) as pool:
+            futures = [pool.submit(p) for p in packets]
+            last_seq = pool.flush()
+            stats = pool.stats()
+
+        self.assertTrue(all(f.result() for f in futures))
+        self.assertEqual(last_seq, 400)  # one sequence over all sessions (New + Received)
+        self.assertEqual(sum(s["messages"] for s in stats), 200)
+        self.assertEqual(sorted(s["keys"] for s in stats), [1, 2, 2])
+
+        by_ticker = defaultdict(list)  # exchange order_no order, per ticker
+        for o in sorted(map(json.loads, self.redis.lrange("NewOrder")), key=lambda o: o["order_no"]):
+            by_ticker[o["ticker"]].append(int(o["qty"]))
+        for qtys in by_ticker.values():
+            self.assertEqual(qtys, sorted(qtys))  # submit order is kept per ticker
+
+    def test_custom_key(self):
+        with SessionPool(
+            "127.0.0.1", self.port, n_sessions=2, key=lambda p: p[12:17], redis=self.redis
+        ) as pool:  # by price, every packet has the same one
+            self.assertEqual(pool.send_many(self._packets(10)), [True] * 10)
+            stats = pool.stats()
+
+        self.assertEqual([s["messages"] for s in stats], [10, 0])
+
+    def test_reset_barrier(self):
+        self.simulator.latency = 0.02
+        with SessionPool("127.0.0.1", self.port, n_sessions=3, redis=self.redis) as pool:
+            futures = [pool.submit(p) for p in self._packets(6)]
+            self.assertEqual(pool.sendall(Client.RESET_PACKET), OrderReceivedMessage.SUCCESS)
+            self.assertTrue(all(f.done() for f in futures))  # answered before the reset
+            self.assertNotIn(b"", pool._routes)
+
+            self.assertTrue(pool.sendall(self._packets(1)[0]))
+            pool.flush()
+
+        order_nos = [json.loads(o)["order_no"] for o in self.redis.lrange("NewOrder")]
+        self.assertEqual(sorted(order_nos[:6]), [str(i).zfill(5) for i in range(1, 7)])
+        self.assertEqual(order_nos[6:], ["00001"])  # order_no from 1 after the reset
+
+    def test_latency_per_message(self):
+        self.simulator.latency = 0.02
+        packets = [self._packets(1)[0]] * 8  # one ticker, one window
+        with SessionPool("127.0.0.1", self.port, n_sessions=1, redis=self.redis) as pool:
+            self.assertEqual(pool.send_many(packets), [True] * 8)
+            latency = pool.sessions[0].latency.snapshot()
+
+        self.assertEqual(latency["count"], 8)
+        self.assertGreaterEqual(latency["p50"], 0.015)  # every message waits for the round trip
+
+    def test_flush_timeout(self):
+        self.simulator.latency = 0.3
+        with SessionPool("127.0.0.1", self.port, n_sessions=2, redis=self.redis) as pool:
+            future = pool.submit(self._packets(1)[0])
+            with self.assertRaises(TimeoutError):  # session still waiting for the ack
+                pool.flush(timeout=0.05)
+            self.assertEqual(pool.flush(timeout=1), 2)
+            self.assertTrue(future.result())
+
+    def test_flush_writer_timeout(self):
+        redis = _FlakyRedis()
+        redis.gate.clear()  # Redis hangs, the write-behind queue is not drained
+        with SessionPool("127.0.0.1", self.port, redis=redis, write_behind=True) as pool:
+            self.assertTrue(pool.sendall(self._packets(1)[0]))
+            with self.assertRaises(TimeoutError):
+                pool.flush(timeout=0.05)
+
+            redis.gate.set()
+            self.assertEqual(pool.flush(timeout=1), 2)
+
+    def test_flush_writer_and_journal(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        journal = JournalWriter(path)
+        with SessionPool(
+            "127.0.0.1", self.port, redis=self.redis, journal=journal, write_behind=True
+        ) as pool:
+            pool.send_many(self._packets(10))
+            self.assertEqual(pool.flush(timeout=1), 20)
+            self.assertEqual(JournalReader(path).last_seq(), 20)  # flushed too
+        journal.close()
+
+    def test_journal_order(self):
+        class SlowJournal(JournalWriter):
+            def append(self, msgs):
+                seq = super().append(msgs)
+                time.sleep(0.002)  # other sessions run between the journal and Redis
+                return seq
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        journal = SlowJournal(path)
+        with SessionPool(
+            "127.0.0.1", self.port, n_sessions=4, window=2, redis=self.redis, journal=journal
+        ) as pool:
+            pool.send_many(self._packets(100))
+            pool.flush()
+        journal.close()
+
+        history = _TmpJournalHistory(source="journal", redis=self.redis)
+        history.path = path
+        self.assertEqual(  # one order over all sessions, the same as the stream
+            [o.json() for o in history.history],
+            [o.json() for o in OrderHistory(source="stream", redis=self.redis).history],
+        )
+
+
+class WriteBehindWriterTest(unittest.TestCase):
+    def _writer(self, redis, **kwargs):
+        kwargs.setdefault("flush_interval", 0.01)
+        writer = WriteBehindWriter(redis, seq_key="OrderSeq", stream="OrderEvents", **kwargs)
+        self.addCleanup(writer.close, 1)
+        return writer
+
+    def _entries(self, i):
+        return [("NewOrder", str(i)), ("OrderReceivedOrder", str(i))]
+
+    def test_order_and_durability(self):
+        redis = InMemoryRedis()
+        writer = self._writer(redis, flush_size=7)
+        for i in range(100):
+            writer.put(self._entries(i))
+
+        self.assertTrue(writer.close())  # flushes before it stops
+        self.assertEqual(redis.lrange("NewOrder"), [str(i) for i in range(100)])
+        self.assertEqual(writer.persisted_seq, 200)
+        with self.assertRaises(RuntimeError):
+            writer.put(self._entries(100))
+
+    def test_backpressure(self):
+        redis = _FlakyRedis()
+        redis.gate.clear()  # Redis hangs, nothing is drained
+        writer = self._writer(redis, max_queue_size=2, flush_size=1, put_timeout=0.05)
+
+        writer.put(self._entries(0))  # taken by the worker, blocked in rpush_all
+        time.sleep(0.05)
+        writer.put(self._entries(1))
+        writer.put(self._entries(2))
+        with self.assertRaises(queue.Full):
+            writer.put(self._entries(3))
+        self.assertFalse(writer.flush(timeout=0.05))
+
+        redis.gate.set()
+        self.assertTrue(writer.flush(timeout=1))
+        self.assertEqual(redis.lrange("NewOrder"), ["0", "1", "2"])
+
+    def test_retry(self):
+        redis = _FlakyRedis(failures=2)
+        writer = self._writer(redis, retry_interval=0.01)
+        writer.put(self._entries(0))
+
+        self.assertTrue(writer.flush(timeout=1))
+        self.assertEqual(redis.failures, 0)
+        self.assertEqual(redis.lrange("NewOrder"), ["0"])
+
+    def test_retry_limit(self):
+        redis = _FlakyRedis(failures=100)
+        writer = self._writer(redis, retry_interval=0.01, max_retries=2)
+        writer.put(self._entries(0))
+
+        with self.assertRaises(RuntimeError):  # dropped, not a timeout
+            writer.flush(timeout=1)
+        with self.assertRaises(RuntimeError):
+            writer.put(self._entries(1))
+        self.assertFalse(writer.close(timeout=1))
+        self.assertEqual(redis.failures, 97)  # first try + 2 retries
+
+    def test_put_racing_close(self):
+        for _ in range(20):
+            redis = InMemoryRedis()
+            writer = self._writer(redis, flush_interval=0.001)
+            tickets = []
+
+            def put():
+                for i in range(50):
+                    try:
+                        tickets.append(writer.put(self._entries(i)))
+                    except RuntimeError:  # closed
+                        return
+
+            threads = [threading.Thread(target=put) for _ in range(4)]
+            for t in threads:
+                t.start()
+            writer.close()
+            for t in threads:
+                t.join()
+
+            writer._thread.join()
+            self.assertEqual(len(redis.lrange("NewOrder")), len(tickets))  # nothing dropped
+
+    def test_log_failure(self):
+        def log(entries):
+            raise OSError("disk full")
+
+        redis = InMemoryRedis()
+        writer = self._writer(redis, log=log)
+        writer.put(self._entries(0))
+        writer.put(self._entries(1))
+
+        self.assertTrue(writer.flush(timeout=1))  # the worker keeps running
+        self.assertEqual(redis.lrange("NewOrder"), ["0", "1"])
+
+    def test_client_flush_timeout(self):
+        redis = _FlakyRedis()
+        redis.gate.clear()
+        client = Client("127.0.0.1", 0, write_behind=True, redis=redis, flush_interval=0.01)
+        client.save_cache(*MessageFactory().create("0000010006606000000020" + "2000010"))
+
+        with self.assertRaises(TimeoutError):
+            client.flush(timeout=0.05)
+
+        redis.gate.set()
+        self.assertEqual(client.flush(timeout=1), 2)
+        client.writer.close()
+
+
+class _SavedOrdersMixin:
+    """ orders saved by Client.save_cache into an InMemoryRedis """
+
+    def setUp(self):
+        self.redis = InMemoryRedis()
+        self.client = Client("127.0.0.1", 0, redis=self.redis)
+        self.msg_factory = MessageFactory()
+
+    def _save_new_order(self, order_no, qty, executed_qty=None):
+        c_msg = self.msg_factory.create(f"00000000066060000{qty}").pop()
+        self.client._overwrite_c_msg(c_msg, order_no, "0")
+
+        s_packet = f"2{order_no}0"
+        if executed_qty:
+            s_packet += f"3{order_no}{executed_qty}"
+        self.client.save_cache(c_msg, *self.msg_factory.create(s_packet))
+
+
+class InMemoryRedisTest(unittest.TestCase):
+    def test_xread_block(self):
+        redis = InMemoryRedis()
+        self.assertEqual(redis.xread("s"), [])  # None: no wait
+        self.assertEqual(redis.xread("s", block=10), [])  # timeout
+
+        result = []
+        reader = threading.Thread(target=lambda: result.extend(redis.xread("s", block=0)))
+        reader.start()
+        time.sleep(0.05)
+        self.assertTrue(reader.is_alive())  # 0: waits forever, like BLOCK 0
+
+        redis.xadd("s", {"key": "k", "data": "d"})
+        reader.join(1)
+        self.assertEqual(result, [("1-0", {"key": "k", "data": "d"})])
+
+
+class OrderHistoryStreamTest(_SavedOrdersMixin, unittest.TestCase):
+
+    def test_arrival_order(self):
+        self._save_new_order("00001", "00020", executed_qty="00005")
+        self._save_new_order("00002", "00010")
+
+        history = OrderHistory(source="stream", redis=self.redis)
+        self.assertEqual(
+            [o.class_name for o in history.history],
+            ["NewOrder", "ReceivedOrder", "ExecutedOrder", "NewOrder", "ReceivedOrder"],
+        )
+        self.assertEqual(history.history[0].unex_qty, 15)
+
+    def test_incremental_update(self):
+        history = OrderHistory(source="stream", redis=self.redis)
+        self._save_new_order("00001", "00020")
+        self.assertEqual(len(history.history), 2)
+
+        self._save_new_order("00002", "00020")
+        new_orders = history.load_new_orders()
+        self.assertEqual([o.order_no for o in new_orders], ["00002", "00002"])
+        self.assertEqual(history.load_new_orders(), [])
+
+
+class OrderHistoryPollingTest(_SavedOrdersMixin, unittest.TestCase):
+    def _count_loads(self, history):
+        calls = []
+        load = history.load_new_orders
+        history.load_new_orders = lambda: calls.append(1) or load()
+        return calls
+
+    def test_ram_unchanged(self):
+        history = OrderHistory(source="ram", redis=self.redis)
+        self.assertIsNone(history.load_new_orders())  # OrderSeq 0, nothing saved
+
+        self._save_new_order("00001", "00020")
+        self.assertEqual(len(history.load_new_orders()), 2)
+        self.assertIsNone(history.load_new_orders())  # same OrderSeq, no LRANGE
+
+        self._save_new_order("00002", "00010")
+        self.assertEqual([o.order_no for o in history.load_new_orders()], ["00002", "00002"])
+        self.assertIsNone(history.load_new_orders())
+
+    def test_poll_interval(self):
+        history = OrderHistory(source="ram", redis=self.redis, poll_interval=0.2)
+        calls = self._count_loads(history)
+
+        self._save_new_order("00001", "00020")
+        self.assertEqual(len(history.history), 2)
+
+        self._save_new_order("00002", "00020")
+        self.assertEqual(len(history.history), 2)  # within poll_interval, not checked
+        self.assertEqual(len(calls), 1)
+
+        time.sleep(0.25)
+        self.assertEqual(len(history.history), 4)
+        self.assertEqual(len(calls), 2)
+
+
+class _CountingFactory(OrderFactory):
+    count = 0
+
+    def create(self, **kwargs):
+        self.count += 1
+        return super().create(**kwargs)
+
+
+class SnapshotTest(_SavedOrdersMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), "history.snapshot")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_warm_start(self):
+        self._save_new_order("00001", "00020", executed_qty="00005")
+        querent = AXETaskQuerent(redis=self.redis)
+        self.assertEqual(querent.get_unex_qty_by_ticker("000660"), 15)
+        querent.save_snapshot(self.path)
+
+        self._save_new_order("00002", "00010")
+        warm = AXETaskQuerent(redis=self.redis, snapshot_path=self.path)
+        warm.factory = _CountingFactory()
+
+        self.assertEqual(warm.get_unex_qty_by_ticker("000660"), 25)
+        self.assertEqual(warm.factory.count, 2)  # only the events after the snapshot
+        self.assertEqual(len(warm.history), 5)
+
+    def test_configuration_not_restored(self):
+        self._save_new_order("00001", "00020")
+        querent = AXETaskQuerent(redis=self.redis, check_aggregates=True)
+        querent.add_query(ticker="000660")  # buffer of a query in progress
+        querent.save_snapshot(self.path)
+
+        warm = AXETaskQuerent(redis=self.redis)
+        self.assertTrue(warm.load_snapshot(self.path))
+        self.assertFalse(warm.check_aggregates)
+        self.assertEqual(warm.buffer, [])
+        self.assertEqual(len(warm.history), 2)
+
+    def test_stale_snapshot(self):
+        self._save_new_order("00001", "00020")
+        querent = AXETaskQuerent(redis=self.redis)
+        querent.update()
+        querent.save_snapshot(self.path)
+
+        self.redis.flushall()  # reset
+        warm = AXETaskQuerent(redis=self.redis, snapshot_path=self.path)
+        with self.assertWarns(UserWarning):
+            self.assertEqual(warm.get_unex_qty_by_ticker("000660"), 0)
+
+    def test_stale_stream_snapshot(self):
+        self._save_new_order("00001", "00020")
+        self._save_new_order("00002", "00020")
+        history = OrderHistory(source="stream", redis=self.redis)
+        history.update()
+        history.save_snapshot(self.path)
+
+        self.redis.flushall()  # reset, the stream starts over
+        self._save_new_order("00003", "00010")
+        warm = OrderHistory(source="stream", redis=self.redis, snapshot_path=self.path)
+        with self.assertWarns(UserWarning):
+            self.assertEqual([o.order_no for o in warm.history], ["00003", "00003"])  # rebuilt
+
+
+class JournalTest(_SavedOrdersMixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        self.client.journal = JournalWriter(self.path, segment_records=4)
+
+    def tearDown(self):
+        self.client.journal.close()
+        shutil.rmtree(self.path)
+
+    def _history(self, source, **kwargs):
+        history = _TmpJournalHistory(source=source, redis=self.redis, **kwargs)
+        history.path = self.path
+        return history
+
+    def test_same_as_stream(self):
+        self._save_new_order("00001", "00020", executed_qty="00005")
+        self._save_new_order("00002", "00010")
+        self._save_new_order("00003", "00030", executed_qty="00030")
+        self.client.flush()
+
+        self.assertEqual(len(os.listdir(self.path)), 2)  # segments of 4 records
+        self.assertEqual(
+            [o.json() for o in self._history("journal").history],
+            [o.json() for o in self._history("stream").history],
+        )
+
+    def test_seek_and_torn_tail(self):
+        for i in range(1, 5):
+            self._save_new_order(f"0000{i}", "00020")
+        self.client.flush()
+
+        reader = JournalReader(self.path)
+        self.assertEqual([r.seq for r in reader.read(6, max_records=2)], [6, 7])
+        history = self._history("journal")
+        self.assertEqual(len(history.history), 8)
+
+        last = os.path.join(self.path, sorted(os.listdir(self.path))[-1])
+        with open(last, "ab") as f:
+            f.write(b"\x00" * (RECORD_SIZE + 3))  # crash while writing
+        self.assertEqual(reader.read(1)[-1].seq, 8)
+        self.assertEqual(reader.last_seq(), 8)  # the torn record is not counted
+        self.assertIsNone(history.load_new_orders())
+
+        self.client.journal.close()
+        self.client.journal = JournalWriter(self.path, segment_records=4)  # recovery
+        self.assertEqual(self.client.journal.last_seq, 8)
+        self.assertEqual(os.path.getsize(last), 4 * RECORD_SIZE)
+
+    def test_stale_snapshot(self):
+        for i in range(1, 4):
+            self._save_new_order(f"0000{i}", "00020")
+        self.client.flush()
+        snapshot_path = os.path.join(self.path, "history.snapshot")
+        history = self._history("journal")
+        history.update()
+        history.save_snapshot(snapshot_path)
+
+        self.client.journal.close()
+        for name in os.listdir(self.path):  # the journal is truncated, seq starts over
+            if name.endswith(".journal"):
+                os.remove(os.path.join(self.path, name))
+        self.client.journal = JournalWriter(self.path, segment_records=4)
+        self._save_new_order("00004", "00010")
+        self.client.flush()
+
+        warm = self._history("journal", snapshot_path=snapshot_path)
+        with self.assertWarns(UserWarning):
+            self.assertEqual([o.order_no for o in warm.history], ["00004", "00004"])
+
+
+class _TmpLogHistory(OrderHistory):
+    path = None
+
+    @property
+    def log_path(self):
+        return self.path
+
+
+class OrderHistoryDiskTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.history = _TmpLogHistory(source="disk", redis=InMemoryRedis())
+        self.history.path = os.path.join(self.dir, "client.log")
+        self.lines = [
+            f"[client:111][DEBUG][2020-05-26 09:00:00] NewOrder-{json.dumps(kw)}\n"
+            for kw in synthetic_flow(6)
+        ]
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.dir)
+
+    def _write(self, text, mode="a"):
+        with open(self.history.path, mode) as f:
+            f.write(text)
+
+    def _load(self):
+        return [o.msg_type for o in self.history.load_new_orders() or []]
+
+    def test_partial_line(self):
+        self._write("[client:163][ERROR][...] No Message Received From Server\n")
+        self._write(self.lines[0] + self.lines[1][:30])
+        self.assertEqual(self._load(), ["0"])
+
+        self._write(self.lines[1][30:])
+        self.assertEqual(self._load(), ["2"])
+        self.assertEqual(self._load(), [])
+
+    def test_rotation_and_truncation(self):
+        self._write(self.lines[0])
+        self.assertEqual(len(self._load()), 1)
+
+        self._write(self.lines[1])  # not read before the rotation
+        os.rename(self.history.path, self.history.path + ".1")
+        self._write(self.lines[2] + self.lines[3])
+        self.assertEqual(len(self._load()), 3)
+
+        self._write(self.lines[4], mode="w")  # truncated
+        self.assertEqual(len(self._load()), 1)
+
+    def test_unchanged(self):
+        self.assertIsNone(self.history.load_new_orders())  # no file yet
+
+        self._write(self.lines[0])
+        self.assertEqual(len(self._load()), 1)
+        self.assertIsNone(self.history.load_new_orders())  # same inode / size / mtime
+
+        self._write(self.lines[1])
+        self.assertEqual(self._load(), ["2"])
+        self.assertIsNone(self.history.load_new_orders())
+
+    def test_close(self):
+        with self.history as history:
+            self._write(self.lines[0])
+            self.assertEqual(len(self._load()), 1)
+            log_file = history._disk_file
+        self.assertTrue(log_file.closed)
+        self.assertIsNone(history._disk_file)
+
+        self._write(self.lines[1])  # reopened at the cursor
+        self.assertEqual(self._load(), ["2"])
+
+
+class _QueuedLoggingUser(LoggerMixin):
+    pass
+
+
+class QueuedLoggingTest(unittest.TestCase):
+    def setUp(self):
+        self.user = _QueuedLoggingUser()
+        self.path = next(  # loggers are per module, test.log for this one
+            h.baseFilename for h in self.user.logger.handlers if isinstance(h, logging.FileHandler)
+        )
+        self.token = f"queued-{time.time_ns()}"
+
+    def tearDown(self):
+        QueuedLogging.stop()
+        set_level(logging.DEBUG)
+
+    def _logged(self):
+        with open(self.path) as f:
+            return [l for l in f.read().splitlines() if self.token in l]
+
+    def test_queued(self):
+        QueuedLogging.start(interval=0)
+        for i in range(100):
+            self.user.logger.info(f"{self.token} {i}")
+        self.assertIs(self.user.logger, LoggerMixin.CLASS_LOGGERS[_QueuedLoggingUser])
+
+        QueuedLogging.stop()  # written by the listener before it stops
+        lines = self._logged()
+        self.assertEqual(len(lines), 100)
+        self.assertTrue(lines[-1].endswith(f"{self.token} 99"))
+
+    def test_disabled_level(self):
+        set_level(logging.INFO)
+        self.user.logger.debug(self.token)
+        self.assertEqual(self._logged(), [])
+
+
+class _PoolStub:
+    def stats(self):
+        return {"max_connections": 2, "in_use": 0}
+
+    def disconnect(self):
+        pass
+
+
+class _StubConnection:
+    """ redis-py connection without a server, connect() fails while `down` is set """
+
+    down = False
+
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+
+    def connect(self):
+        if self.down:
+            raise ConnectionError("redis is down")
+
+    def can_read(self, *args, **kwargs):
+        return False
+
+    def should_reconnect(self):
+        return False
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+
+class _PipelineStub:
+    """ records the commands of a redis-py pipeline """
+
+    def __init__(self):
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [len(self.commands)]
+
+
+class RedisRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.config = (RedisRegistry.backend, RedisRegistry.host, RedisRegistry.port)
+        RedisRegistry.reset()
+        RedisRegistry.configure(backend="memory", host="127.0.0.1", port=6379)
+
+    def tearDown(self):
+        RedisRegistry.reset()
+        RedisRegistry.backend, RedisRegistry.host, RedisRegistry.port = self.config
+
+    def test_shared_instance(self):
+        shared = RedisRegistry.get()
+        self.assertIsInstance(shared, InMemoryRedis)
+        self.assertIs(RedisRegistry.get("127.0.0.1", "6379"), shared)  # same endpoint
+        self.assertIsNot(RedisRegistry.get(port=6380), shared)
+
+        RedisRegistry.reset()
+        self.assertIsNot(RedisRegistry.get(), shared)  # forgotten
+
+    def test_stats(self):
+        RedisRegistry.get()
+        self.assertEqual(RedisRegistry.stats(), {})  # memory backend has no pool
+
+        RedisRegistry.get(port=6380).pool = _PoolStub()
+        self.assertEqual(
+            RedisRegistry.stats(), {"127.0.0.1:6380": {"max_connections": 2, "in_use": 0}}
+        )
+
+    def test_stream_maxlen(self):
+        redis = Redis("127.0.0.1", 6379)
+        redis._conn = _PipelineStub()
+        redis.rpush_all([("NewOrder", "a"), ("OrderReceivedOrder", "b")], stream="OrderEvents")
+
+        xadds = [kwargs for name, _, kwargs in redis._conn.commands if name == "xadd"]
+        self.assertEqual(len(xadds), 2)
+        for kwargs in xadds:  # MAXLEN ~ n
+            self.assertEqual(kwargs, {"maxlen": Redis.STREAM_MAXLEN, "approximate": True})
+
+    @unittest.skipIf(redis_py is None, "redis-py is not installed")
+    def test_pool_checkouts(self):
+        from cache.pool import InstrumentedConnectionPool
+
+        pool = InstrumentedConnectionPool(
+            connection_class=_StubConnection, max_connections=2, timeout=0
+        )
+        first, second = pool.get_connection(), pool.get_connection()
+        pool.release(first)
+        self.assertEqual((pool.stats()["in_use"], pool.stats()["idle"]), (1, 1))
+
+        _StubConnection.down = True
+        self.addCleanup(setattr, _StubConnection, "down", False)
+        with self.assertRaises(ConnectionError):  # released by get_connection itself
+            pool.get_connection()
+        stats = pool.stats()
+        self.assertEqual((stats["created"], stats["in_use"], stats["idle"]), (2, 1, 1))
+        self.assertEqual(stats["checkouts"], 2)
+
+        pool.release(second)
+        self.assertEqual(pool.stats()["in_use"], 0)
+
+    @unittest.skipIf(redis_py is not None, "redis-py is installed")
+    def test_pool_without_redis(self):
+        with self.assertRaisesRegex(ImportError, "backend='memory'"):
+            importlib.import_module("cache.pool")
+
+
+class MetricsTest(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = metrics.Histogram("test")
+        for v in range(1, 100001):
+            histogram.record(v)
+
+        self.assertEqual(histogram.max, 100000)
+        for q in (50, 99):  # bucket upper bound, within 1 / SUB_BUCKETS
+            self.assertLessEqual(abs(histogram.percentile(q) / (q * 1000) - 1), 0.125)
+
+    def test_endpoint(self):
+        history = OrderHistory(source="stream", redis=InMemoryRedis())
+        count = metrics.snapshot()["history_update"]["count"]
+        history.update()
+        self.assertEqual(metrics.snapshot()["history_update"]["count"], count + 1)
+
+        server = metrics.serve(port=0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as r:
+                body = r.read().decode()
+        finally:
+            server.close()
+        self.assertIn('history_update_seconds{quantile="0.99"}', body)
+
+
+class OrderTest(unittest.TestCase):
+    def test_native_fields(self):
+        kwargs = synthetic_flow(1)[0]
+        order = OrderFactory().create(**kwargs)
+
+        self.assertEqual(order.price, int(kwargs["price"]))
+        self.assertEqual(order.unex_qty, int(kwargs["qty"]))
+        self.assertIsInstance(order.time, float)
+        self.assertFalse(hasattr(order, "__dict__"))
+
+        kwargs.pop("packet")
+        self.assertEqual(json.loads(order.json()), dict(kwargs, unex_qty=kwargs["qty"]))
+
+
+class AXETaskQuerentTest(unittest.TestCase):
+    """ indexed queries against a brute-force scan of the same flow """
+
+    querent_cls = AXETaskQuerent
+
+    def setUp(self):
+        factory = OrderFactory()
+        self.orders = [factory.create(**kw) for kw in synthetic_flow(5000, n_tickers=3)]
+
+        self.querent = self.querent_cls(redis=InMemoryRedis())
+        for i in range(0, len(self.orders), 500):
+            self.querent._update(self.orders[i : i + 500])
+
+        self.ticker = self.orders[0].ticker
+        self.price = self.orders[0].price
+
+    def _unex_orders(self, **kwargs):
+        return [
+            o
+            for o in self.orders
+            if o.msg_type == "0"
+            and o.response_code == "0"
+            and o.unex_qty > 0
+            and all(getattr(o, k) == v for k, v in kwargs.items())
+        ]
+
+    def test_unex_qty(self):
+        expected = sum(o.unex_qty for o in self._unex_orders(ticker=self.ticker))
+        self.assertEqual(self.querent.get_unex_qty_by_ticker(self.ticker), expected)
+
+        expected = sum(
+            o.unex_qty for o in self._unex_orders(ticker=self.ticker, price=self.price)
+        )
+        self.assertEqual(
+            self.querent.get_unex_qty_by_ticker_and_price(self.ticker, self.price), expected
+        )
+
+    def test_aggregates(self):
+        self.assertEqual(self.querent.verify_aggregates(), {})
+
+        self.querent.get_order_book(self.ticker).qty += 1
+        self.assertIn((self.ticker, None), self.querent.verify_aggregates())
+
+        self.querent.check_aggregates = True
+        with self.assertRaises(AggregateMismatchError):
+            self.querent._update([])
+
+    def test_unknown_ticker_book(self):
+        self.assertEqual(list(self.querent.get_order_book("999999")), [])
+        self.assertNotIn("999999", self.querent._books)  # read-only, not stored
+        self.assertEqual(self.querent.verify_aggregates(), {})
+
+    def test_padded_query_values(self):
+        padded = str(self.price).zfill(5)
+        self.assertEqual(
+            self.querent.get_unex_qty_by_ticker_and_price(self.ticker, padded),
+            self.querent.get_unex_qty_by_ticker_and_price(self.ticker, self.price),
+        )
+        self.assertCountEqual(
+            self.querent.get_unex_orders_by_ticker_and_price(self.ticker, padded),
+            self._unex_orders(ticker=self.ticker, price=self.price),
+        )
+
+    def test_unex_orders(self):
+        expected = self._unex_orders(ticker=self.ticker, price=self.price)
+        result = self.querent.get_unex_orders_by_ticker_and_price(self.ticker, self.price)
+        self.assertCountEqual(result, expected)
+
+    def test_unex_orders_sorted(self):
+        expected = sorted(self._unex_orders(ticker=self.ticker), key=lambda o: (o.price, o.time))
+        result = self.querent.get_unex_order_by_ticker_sorted(self.ticker)
+        self.assertEqual(result, expected)
+
+    def test_explain(self):
+        self.querent.add_query(msg_type="0", response_code="0", ticker=self.ticker)
+        self.querent.add_exclusive_query(unex_qty="00000")
+
+        plan = self.querent.explain().splitlines()
+        self.assertTrue(plan[0].startswith("1. scan"))
+        self.assertIn("unex_qty==0", plan[1])
+        self.assertEqual(len(self.querent.execute()), len(self._unex_orders(ticker=self.ticker)))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class ColumnarAXETaskQuerentTest(AXETaskQuerentTest):
+    """ same results from the columnar store """
+
+    querent_cls = ColumnarAXETaskQuerent
+
+    def test_unex_qty_by_tickers(self):
+        expected = defaultdict(int)
+        for o in self._unex_orders():
+            expected[o.ticker] += o.unex_qty
+        self.assertEqual(self.querent.get_unex_qty_by_tickers(), expected)
+
+    def test_executed_qty_by_price(self):
+        new_orders = {
+            o.order_no: o for o in self.orders if o.msg_type == "0" and o.response_code == "0"
+        }
+        expected = defaultdict(int)
+        for o in self.orders:
+            if o.msg_type == "3" and new_orders[o.order_no].ticker == self.ticker:
+                expected[new_orders[o.order_no].price] += o.qty
+        self.assertEqual(self.querent.get_executed_qty_by_price(self.ticker), expected)
+
+
 if __name__ == "__main__":
     unittest.main()